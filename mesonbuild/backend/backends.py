@@ -16,6 +16,7 @@ from collections import OrderedDict
 from functools import lru_cache
 from pathlib import Path
 import enum
+import hashlib
 import json
 import os
 import pickle
@@ -39,6 +40,151 @@ if T.TYPE_CHECKING:
     from ..interpreter import Interpreter, Test
 
 
+# Regular expressions used to find the system headers a source includes
+# first when generating automatic precompiled headers.
+AUTO_PCH_INCLUDE_RE = re.compile(r'^\s*#\s*include\s*<([^>]+)>\s*(//.*|/\*.*\*/\s*)?$')
+AUTO_PCH_DIRECTIVE_RE = re.compile(r'^\s*#')
+
+
+def scan_system_includes(fname: str) -> T.Tuple[T.List[str], bool]:
+    '''Return the <...> headers that fname includes before anything else,
+    and whether a precompiled header can be forced into fname.
+
+    That is not the case when the scan stops at another preprocessor
+    directive, such as a #define of _GNU_SOURCE or an #include "config.h",
+    which could change the meaning of the headers that follow it.
+    '''
+    headers = []  # type: T.List[str]
+    in_comment = False
+    try:
+        with open(fname, encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                if in_comment:
+                    if '*/' not in line:
+                        continue
+                    in_comment = False
+                    line = line.split('*/', 1)[1]
+                line = line.strip()
+                if not line or line.startswith('//'):
+                    continue
+                if line.startswith('/*'):
+                    in_comment = '*/' not in line
+                    if in_comment or not line.split('*/', 1)[1].strip():
+                        continue
+                    line = line.split('*/', 1)[1].strip()
+                m = AUTO_PCH_INCLUDE_RE.match(line)
+                if m:
+                    if m.group(1) not in headers:
+                        headers.append(m.group(1))
+                    continue
+                return headers, not AUTO_PCH_DIRECTIVE_RE.match(line)
+    except OSError:
+        return [], False
+    return headers, True
+
+
+# Rough cost of an #include, in bytes of source, used to estimate how
+# expensive a file is to compile when no timing information is available.
+UNITY_INCLUDE_COST = 4096
+# How far above the average load a cost-balanced unity bucket may grow
+# before sources spill over to other buckets.
+UNITY_BUCKET_SLACK = 1.25
+UNITY_INCLUDE_RE = re.compile(r'^\s*#\s*include\b')
+
+
+def read_ninja_log(build_dir: str, offset: int = 0) -> T.List[T.Tuple[int, int, str, str]]:
+    '''Return the (start, end, output, command hash) entries of the
+    .ninja_log of build_dir, in the order they were recorded, starting at
+    byte offset. Times are in milliseconds since the start of the ninja run.'''
+    entries = []  # type: T.List[T.Tuple[int, int, str, str]]
+    try:
+        with open(os.path.join(build_dir, '.ninja_log'), encoding='utf-8', errors='replace') as f:
+            f.seek(offset)
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 5:
+                    continue
+                try:
+                    entries.append((int(fields[0]), int(fields[1]), fields[3], fields[4]))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return entries
+
+
+def load_ninja_log(build_dir: str) -> T.Dict[str, int]:
+    '''Return the duration, in milliseconds, of the last recorded run of the
+    edge building each output listed in the .ninja_log of build_dir.'''
+    return {output: end - start for start, end, output, _ in read_ninja_log(build_dir)}
+
+
+def estimate_source_cost(fname: str) -> int:
+    '''Estimate the cost of compiling fname from its size and the number of
+    files it includes.'''
+    try:
+        with open(fname, encoding='utf-8', errors='ignore') as f:
+            contents = f.read()
+    except OSError:
+        return 0
+    includes = sum(1 for line in contents.splitlines() if UNITY_INCLUDE_RE.match(line))
+    return len(contents) + includes * UNITY_INCLUDE_COST
+
+
+def jump_hash(key: int, num_buckets: int) -> int:
+    '''Jump consistent hash: map key to one of num_buckets buckets so that
+    growing the number of buckets by one only moves 1/num_buckets of the keys.'''
+    b, j = -1, 0
+    while j < num_buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+def balance_unity_sources(srcs: T.List[str], costs: T.Dict[str, int],
+                          num_buckets: int) -> T.List[T.List[str]]:
+    '''Split srcs into num_buckets lists of roughly equal total cost.
+
+    Every source has a fixed sequence of preferred buckets derived from its
+    name, and goes to the first of them that still has room. This keeps most
+    sources in the same bucket when the source list changes slightly, so
+    that only a few unity files are rebuilt. Sources keep their original
+    order inside each bucket.
+    '''
+    if not srcs:
+        return []
+    num_buckets = max(1, min(num_buckets, len(srcs)))
+    total = sum(costs[s] for s in srcs)
+    capacity = total / num_buckets * UNITY_BUCKET_SLACK
+    loads = [0] * num_buckets
+    assignment = {}  # type: T.Dict[str, int]
+    for src in sorted(srcs, key=lambda s: (-costs[s], s)):
+        seed = int.from_bytes(hashlib.sha1(src.encode()).digest()[:8], 'little')
+        for attempt in range(num_buckets):
+            bucket = jump_hash(seed + attempt, num_buckets)
+            if loads[bucket] + costs[src] <= capacity:
+                break
+        else:
+            bucket = loads.index(min(loads))
+        assignment[src] = bucket
+        loads[bucket] += costs[src]
+    buckets = [[] for _ in range(num_buckets)]  # type: T.List[T.List[str]]
+    for src in srcs:
+        buckets[assignment[src]].append(src)
+    # The number of unity files must only depend on the number of sources,
+    # so fill empty buckets with the cheapest source of the fullest ones.
+    for bucket in buckets:
+        if not bucket:
+            donor = max(buckets, key=len)
+            cheapest = min(donor, key=lambda s: (costs[s], s))
+            donor.remove(cheapest)
+            bucket.append(cheapest)
+    return buckets
+
+
 class TestProtocol(enum.Enum):
 
     EXITCODE = 0
@@ -123,7 +269,9 @@ class TestSerialisation:
                  env: build.EnvironmentVariables, should_fail: bool,
                  timeout: T.Optional[int], workdir: T.Optional[str],
                  extra_paths: T.List[str], protocol: TestProtocol, priority: int,
-                 cmd_is_built: bool, depends: T.List[str], version: str):
+                 cmd_is_built: bool, depends: T.List[str], version: str,
+                 locks: T.List[str], shared_locks: T.List[str], cpus: int,
+                 shards: int):
         self.name = name
         self.project_name = project
         self.suite = suite
@@ -145,6 +293,10 @@ class TestSerialisation:
         self.cmd_is_built = cmd_is_built
         self.depends = depends
         self.version = version
+        self.locks = locks
+        self.shared_locks = shared_locks
+        self.cpus = cpus
+        self.shards = shards
 
 
 def get_backend_from_name(backend: str, build: T.Optional[build.Build] = None, interpreter: T.Optional['Interpreter'] = None) -> T.Optional['Backend']:
@@ -189,6 +341,21 @@ class Backend:
         self.source_dir = self.environment.get_source_dir()
         self.build_to_src = mesonlib.relpath(self.environment.get_source_dir(),
                                              self.environment.get_build_dir())
+        self.auto_pch_stats = []  # type: T.List[T.Tuple[str, str, int, int]]
+        self.auto_pch_files = {}  # type: T.Dict[T.Tuple[str, str], str]
+        # Maps (target id, language) to the generated precompiled header, as
+        # it would be listed in c_pch, and the sources that can use it
+        self.auto_pch = {}  # type: T.Dict[T.Tuple[str, str], T.Tuple[T.List[str], T.Set[File]]]
+        # Maps (target id, language) to the private dir of the target that
+        # builds the precompiled header it shares with other targets
+        self.shared_pch_dirs = {}  # type: T.Dict[T.Tuple[str, str], str]
+        # Maps the object file a target would compile to the identical object
+        # file of another target that it links instead
+        self.shared_objects = {}  # type: T.Dict[str, str]
+        # Loaded from .ninja_log the first time cost-balanced unity files are generated
+        self.ninja_log_durations = None  # type: T.Optional[T.Dict[str, int]]
+        # Looked up the first time a binary with split debug info is generated
+        self.dwp_command = None  # type: T.Optional[T.List[str]]
 
     def generate(self) -> None:
         raise RuntimeError('generate is not implemented in {}'.format(type(self).__name__))
@@ -214,6 +381,41 @@ class Backend:
                                    self.environment.coredata.builtins,
                                    self.environment.coredata.base_options)
 
+    def uses_split_dwarf(self, target, compiler) -> bool:
+        return ('b_split_dwarf' in compiler.base_options and
+                self.get_base_options_for_target(target)['b_split_dwarf'].value and
+                self.get_option_for_target('debug', target))
+
+    def get_dwp_command(self) -> T.List[str]:
+        if self.dwp_command is None:
+            dwp = self.environment.lookup_binary_entry(MachineChoice.HOST, 'dwp')
+            if dwp is None and not self.environment.is_cross_build():
+                # The dwp of binutils does not support DWARF 5, the default
+                # since GCC 11, prefer the one of LLVM
+                for name in ['llvm-dwp', 'dwp']:
+                    prog = dependencies.ExternalProgram(name, silent=True)
+                    if prog.found():
+                        dwp = prog.get_command()
+                        break
+            if dwp is None:
+                mlog.warning('dwp was not found, the split debug info of the binaries '
+                             'stays in the build directory and is not installed.')
+            self.dwp_command = dwp or []
+        return self.dwp_command
+
+    def get_dwp_filename(self, target) -> T.Optional[str]:
+        '''
+        Return the .dwp file that packages the split debug info of a binary
+        next to it, so that gdb finds it once installed.
+        '''
+        if not isinstance(target, (build.Executable, build.SharedLibrary, build.SharedModule)):
+            return None
+        if not any(self.uses_split_dwarf(target, c) for c in target.compilers.values()):
+            return None
+        if not self.get_dwp_command():
+            return None
+        return self.get_target_filename(target) + '.dwp'
+
     def get_compiler_options_for_target(self, target):
         comp_reg = self.environment.coredata.compiler_options[target.for_machine]
         comp_override = target.option_overrides_compiler
@@ -301,6 +503,7 @@ class Backend:
         result = []
         compsrcs = classify_unity_sources(target.compilers.values(), unity_src)
         unity_size = self.get_option_for_target('unity_size', target)
+        unity_strategy = self.get_option_for_target('unity_strategy', target)
 
         def init_language_file(suffix, unity_file_number):
             unity_src = self.get_unity_source_file(target, suffix, unity_file_number)
@@ -316,24 +519,45 @@ class Backend:
 
         # For each language, generate unity source files and return the list
         for comp, srcs in compsrcs.items():
-            files_in_current = unity_size + 1
-            unity_file_number = 0
-            ofile = None
-            for src in srcs:
-                if files_in_current >= unity_size:
-                    if ofile:
-                        ofile.close()
-                    ofile = init_language_file(comp.get_default_suffix(), unity_file_number)
-                    unity_file_number += 1
-                    files_in_current = 0
-                ofile.write('#include<{}>\n'.format(src))
-                files_in_current += 1
-            if ofile:
-                ofile.close()
+            if unity_strategy == 'cost':
+                num_buckets = (len(srcs) + unity_size - 1) // unity_size
+                buckets = balance_unity_sources(srcs, self.get_unity_source_costs(target, srcs), num_buckets)
+            else:
+                buckets = [srcs[i:i + unity_size] for i in range(0, len(srcs), unity_size)]
+            for unity_file_number, bucket in enumerate(buckets):
+                with init_language_file(comp.get_default_suffix(), unity_file_number) as ofile:
+                    for src in bucket:
+                        ofile.write('#include<{}>\n'.format(src))
 
         [mesonlib.replace_if_different(x, x + '.tmp') for x in abs_files]
         return result
 
+    def get_unity_source_costs(self, target, srcs):
+        '''Return the cost of compiling each of the absolute paths in srcs.
+
+        Compile times recorded in .ninja_log for the objects of a previous
+        non-unity build are used if every source has one, so that all costs
+        are in the same unit. Otherwise the cost is estimated from the
+        sources themselves.
+        '''
+        if self.ninja_log_durations is None:
+            self.ninja_log_durations = load_ninja_log(self.build_dir)
+        durations = {}
+        for src in srcs:
+            if os.path.normpath(src).startswith(os.path.join(self.build_dir, '')):
+                rel = os.path.relpath(src, self.build_dir)
+                f = File(True, os.path.dirname(rel), os.path.basename(rel))
+            else:
+                rel = os.path.relpath(src, self.source_dir)
+                f = File(False, os.path.dirname(rel), os.path.basename(rel))
+            obj = os.path.join(self.get_target_private_dir(target),
+                               self.object_filename_from_source(target, f))
+            duration = self.ninja_log_durations.get(obj.replace('\\', '/'))
+            if duration is None:
+                return {src: estimate_source_cost(src) for src in srcs}
+            durations[src] = duration
+        return durations
+
     def relpath(self, todir, fromdir):
         return os.path.relpath(os.path.join('dummyprefixdir', todir),
                                os.path.join('dummyprefixdir', fromdir))
@@ -630,20 +854,102 @@ class Backend:
 
         for osrc in sources:
             objname = self.object_filename_from_source(extobj.target, osrc)
-            objpath = os.path.join(proj_dir_to_build_root, targetdir, objname)
-            result.append(objpath)
+            objpath = os.path.join(targetdir, objname)
+            objpath = self.shared_objects.get(objpath, objpath)
+            result.append(os.path.join(proj_dir_to_build_root, objpath))
 
         return result
 
-    def get_pch_include_args(self, compiler, target):
+    def get_target_pch_dir(self, target, lang):
+        return self.shared_pch_dirs.get((target.get_id(), lang), self.get_target_private_dir(target))
+
+    def get_pch_include_args(self, compiler, target, src=None):
         args = []
-        pchpath = self.get_target_private_dir(target)
+        pchpath = self.get_target_pch_dir(target, compiler.get_language())
         includeargs = compiler.get_include_args(pchpath, False)
-        p = target.get_pch(compiler.get_language())
+        p = self.get_target_pch(target, compiler.get_language(), src)
         if p:
             args += compiler.get_pch_use_args(pchpath, p[0])
         return includeargs + args
 
+    def generate_auto_pch(self, target):
+        '''Synthesize a precompiled header for targets that do not set one.
+
+        The header contains the system and third-party headers that are
+        included by at least half of the target's sources. It is only
+        rewritten when that set changes, so the PCH is not rebuilt needlessly.
+        '''
+        options = self.get_base_options_for_target(target)
+        if 'b_pch_auto' not in options or not options['b_pch_auto'].value:
+            return
+        if not options['b_pch'].value:
+            return
+        for lang in ('c', 'cpp'):
+            if lang not in target.compilers or target.get_pch(lang):
+                continue
+            compiler = target.compilers[lang]
+            if 'b_pch_auto' not in compiler.base_options:
+                continue
+            sources = [s for s in target.sources
+                       if isinstance(s, File) and not s.is_built and
+                       self.environment.is_source(s) and not self.environment.is_header(s) and
+                       mesonlib.get_compiler_for_source(target.compilers.values(), s) is compiler]
+            if len(sources) < 2:
+                continue
+            counts = OrderedDict()  # type: T.Dict[str, int]
+            pch_sources = set()  # type: T.Set[File]
+            for src in sources:
+                src_headers, can_use_pch = scan_system_includes(src.absolute_path(self.source_dir, self.build_dir))
+                # The other sources are compiled without the precompiled header
+                if not can_use_pch:
+                    continue
+                pch_sources.add(src)
+                for header in src_headers:
+                    counts[header] = counts.get(header, 0) + 1
+            if len(pch_sources) < 2:
+                continue
+            threshold = max(2, (len(pch_sources) + 1) // 2)
+            headers = [h for h, c in counts.items() if c >= threshold]
+            if not headers:
+                continue
+
+            pch_name = 'meson_auto_pch-{}.h'.format(lang)
+            pch_rel_to_build = os.path.join(self.get_target_private_dir(target), pch_name)
+            pch_file = os.path.join(self.build_dir, pch_rel_to_build)
+            os.makedirs(os.path.dirname(pch_file), exist_ok=True)
+            content = '/* Generated by Meson from the headers most included by {!r}. */\n'.format(target.name)
+            content += ''.join('#include <{}>\n'.format(h) for h in headers)
+            pch_file_tmp = pch_file + '.tmp'
+            with open(pch_file_tmp, 'w') as f:
+                f.write(content)
+            mesonlib.replace_if_different(pch_file, pch_file_tmp)
+            self.auto_pch_files[(target.get_id(), lang)] = pch_file
+
+            # PCH paths are relative to the target's source directory
+            pch = [os.path.relpath(pch_file, os.path.join(self.source_dir, target.get_source_subdir()))]
+            self.auto_pch[(target.get_id(), lang)] = (pch, pch_sources)
+            # Each source now parses the PCH once instead of these headers
+            saved = sum(counts[h] for h in headers)
+            self.auto_pch_stats.append((target.name, lang, len(headers), saved))
+            mlog.debug('Automatic {} precompiled header for {!r}: {} headers, {} inclusions '
+                       'in {} sources'.format(lang, target.name, len(headers), saved, len(pch_sources)))
+
+    def get_target_pch(self, target, lang, src=None) -> T.List[str]:
+        '''
+        Return the precompiled header of a target, or the one generated for
+        it. With src, only return the generated one if src can use it.
+        '''
+        pch = target.get_pch(lang)
+        if pch:
+            return pch
+        pch, pch_sources = self.auto_pch.get((target.get_id(), lang), ([], set()))
+        if src is not None and src not in pch_sources:
+            return []
+        return pch
+
+    def target_has_pch(self, target) -> bool:
+        return target.has_pch() or any(k[0] == target.get_id() for k in self.auto_pch)
+
     def create_msvc_pch_implementation(self, target, lang, pch_header):
         # We have to include the language in the file name, otherwise
         # pch.c and pch.cpp will both end up as pch.obj in VS backends.
@@ -889,7 +1195,8 @@ class Backend:
                                    extra_paths, t.protocol, t.priority,
                                    isinstance(exe, build.Executable),
                                    [x.get_id() for x in depends],
-                                   self.environment.coredata.version)
+                                   self.environment.coredata.version,
+                                   t.locks, t.shared_locks, t.cpus, t.shards)
             arr.append(ts)
         return arr
 
@@ -1263,6 +1570,13 @@ class Backend:
                                                   {}, False, {}, set(), '',
                                                   install_mode, optional=True)
                             d.targets.append(i)
+
+                        dwp_file = self.get_dwp_filename(t)
+                        if not should_strip and dwp_file:
+                            i = TargetInstallData(dwp_file, outdirs[0],
+                                                  {}, False, {}, set(), '',
+                                                  install_mode, optional=True)
+                            d.targets.append(i)
                 # Install secondary outputs. Only used for Vala right now.
                 if num_outdirs > 1:
                     for output, outdir in zip(t.get_outputs()[1:], outdirs[1:]):
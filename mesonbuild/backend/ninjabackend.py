@@ -14,6 +14,7 @@
 import typing as T
 import os
 import re
+import multiprocessing
 import pickle
 import shlex
 import subprocess
@@ -53,6 +54,9 @@ FORTRAN_MODULE_PAT = r"^\s*\bmodule\b\s+(\w+)\s*(?:!+.*)*$"
 FORTRAN_SUBMOD_PAT = r"^\s*\bsubmodule\b\s*\((\w+:?\w+)\)\s*(\w+)"
 FORTRAN_USE_PAT = r"^\s*use,?\s*(?:non_intrinsic)?\s*(?:::)?\s*(\w+)"
 
+# Languages whose compilers write a .dwo file with -gsplit-dwarf
+SPLIT_DWARF_LANGUAGES = {'c', 'cpp', 'objc', 'objcpp', 'fortran', 'd'}
+
 def cmd_quote(s):
     # see: https://docs.microsoft.com/en-us/windows/desktop/api/shellapi/nf-shellapi-commandlinetoargvw#remarks
 
@@ -422,6 +426,8 @@ class NinjaBackend(backends.Backend):
         self.all_outputs = {}
         self.introspection_data = {}
         self.created_llvm_ir_rule = PerMachine(False, False)
+        self.pch_owners = {}  # type: T.Dict[T.Tuple[str, ...], str]
+        self.object_owners = {}  # type: T.Dict[T.Tuple[str, ...], str]
 
     def create_target_alias(self, to_target):
         # We need to use aliases for targets that might be used as directory
@@ -520,6 +526,12 @@ int dummy;
   depth = {}
 
 '''.format(num_pools))
+            lto_pool_depth = self.get_lto_link_pool_depth()
+            if lto_pool_depth > 0:
+                outfile.write('''pool lto_link_pool
+  depth = {}
+
+'''.format(lto_pool_depth))
 
         with self.detect_vs_dep_prefix(tempfilename) as outfile:
             self.generate_rules()
@@ -529,6 +541,16 @@ int dummy;
             self.add_build_comment(NinjaComment('Build rules for targets'))
             for t in ProgressBar(self.build.get_targets().values(), desc='Generating targets'):
                 self.generate_target(t)
+            if self.shared_pch_dirs:
+                mlog.log('Precompiled headers shared between targets with identical flags:',
+                         mlog.bold(str(len(self.shared_pch_dirs))))
+            if self.shared_objects:
+                mlog.log('Duplicate object compiles shared between targets:',
+                         mlog.bold(str(len(self.shared_objects))))
+            if self.auto_pch_stats:
+                mlog.log('Automatic precompiled headers generated for', mlog.bold(str(len(self.auto_pch_stats))),
+                         'targets, replacing', mlog.bold(str(sum(x[3] for x in self.auto_pch_stats))),
+                         'header inclusions')
             self.add_build_comment(NinjaComment('Test rules'))
             self.generate_tests()
             self.add_build_comment(NinjaComment('Install rules'))
@@ -752,6 +774,8 @@ int dummy;
         self.scan_fortran_module_outputs(target)
         # Generate rules for GeneratedLists
         self.generate_generator_list_rules(target)
+        # Must happen before any compile edges of this target are generated
+        self.generate_auto_pch(target)
 
         # Generate rules for building the remaining source files in this target
         outname = self.get_target_filename(target)
@@ -812,7 +836,7 @@ int dummy;
             obj_list.append(o)
 
         use_pch = self.environment.coredata.base_options.get('b_pch', False)
-        if use_pch and target.has_pch():
+        if use_pch and self.target_has_pch(target):
             pch_objects = self.generate_pch(target, header_deps=header_deps)
         else:
             pch_objects = []
@@ -878,6 +902,7 @@ int dummy;
         self.generate_dependency_scan_target(target, compiled_sources, source2object)
         self.generate_shlib_aliases(target, self.get_target_dir(target))
         self.add_build(elem)
+        self.generate_dwp(target)
 
     def should_use_dyndeps_for_target(self, target: 'build.BuildTarget') -> bool:
         if mesonlib.version_compare(self.ninja_version, '<1.10.0'):
@@ -1243,9 +1268,12 @@ int dummy;
                 gen_src_list.append(raw_src)
 
         compile_args = self.determine_single_java_compile_args(target, compiler)
-        for src in src_list + gen_src_list:
-            plain_class_path = self.generate_single_java_compile(src, target, compiler, compile_args)
-            class_list.append(plain_class_path)
+        if self.get_compiler_options_for_target(target)['java']['batch'].value:
+            class_list = self.generate_batch_java_compile(src_list + gen_src_list, target, compiler, compile_args)
+        else:
+            for src in src_list + gen_src_list:
+                plain_class_path = self.generate_single_java_compile(src, target, compiler, compile_args)
+                class_list.append(plain_class_path)
         class_dep_list = [os.path.join(self.get_target_private_dir(target), i) for i in class_list]
         manifest_path = os.path.join(self.get_target_private_dir(target), 'META-INF', 'MANIFEST.MF')
         manifest_fullpath = os.path.join(self.environment.get_build_dir(), manifest_path)
@@ -1376,6 +1404,25 @@ int dummy;
         self.add_build(element)
         return plain_class_path
 
+    def generate_batch_java_compile(self, srcs, target, compiler, args):
+        # Starting the JVM is what makes javac slow, so run it only once
+        # over all the sources of the target. Changing any of them rebuilds
+        # them all, which still costs a single compiler invocation.
+        if not srcs:
+            return []
+        deps = [os.path.join(self.get_target_dir(l), l.get_filename()) for l in target.link_targets]
+        rel_srcs = [src.rel_to_builddir(self.build_to_src) for src in srcs]
+        class_list = [src.fname[:-4] + 'class' for src in srcs]
+        rel_objs = [os.path.join(self.get_target_private_dir(target), c) for c in class_list]
+        rule = self.get_compiler_rule_name('java_BATCH', compiler.for_machine)
+        element = NinjaBuildElement(self.all_outputs, rel_objs[:1], rule, rel_srcs,
+                                    implicit_outs=rel_objs[1:])
+        element.add_dep(deps)
+        element.add_item('ARGS', args)
+        element.add_item('DESC', 'Compiling Java sources of {}'.format(target.get_basename()))
+        self.add_build(element)
+        return class_list
+
     def generate_java_link(self):
         rule = 'java_LINKER'
         command = ['jar', '$ARGS']
@@ -1622,23 +1669,55 @@ int dummy;
         args += rustc.get_option_compile_args(opt_proxy)
         args += self.build.get_global_args(rustc, target.for_machine)
         args += self.build.get_project_args(rustc, target.subproject, target.for_machine)
+        if opt_proxy['incremental'].value:
+            args += ['-C', 'incremental=' + os.path.join(self.get_target_private_dir(target), 'incremental')]
         depfile = os.path.join(target.subdir, target.name + '.d')
         args += ['--emit', 'dep-info={}'.format(depfile), '--emit', 'link']
+        rmeta = self.get_rust_rmeta_file(target)
+        if rmeta:
+            # The wrapper running rustc needs to know when the metadata is
+            # written. Diagnostics are then printed from JSON, which can not
+            # be combined with --color.
+            json_args = 'artifacts'
+            for a in [a for a in args if a.startswith('--color=')]:
+                args.remove(a)
+                if a == '--color=always':
+                    json_args += ',diagnostic-rendered-ansi'
+            args += ['--emit', 'metadata={}'.format(rmeta), '--error-format=json', '--json=' + json_args]
         args += target.get_extra_args('rust')
         args += rustc.get_output_args(os.path.join(target.subdir, target.get_filename()))
         args += self.environment.coredata.get_external_args(target.for_machine, rustc.language)
-        orderdeps = [os.path.join(t.subdir, t.get_filename()) for t in target.link_targets]
+        orderdeps = []
+        deps = []
         linkdirs = OrderedDict()
+        # An rlib is not linked, so it only needs the metadata of the crates
+        # it uses. Anything else needs all the crates it links to be built.
+        uses_metadata = cratetype == 'rlib'
         for d in target.link_targets:
             linkdirs[d.subdir] = True
             # specify `extern CRATE_NAME=OUTPUT_FILE` for each Rust
             # dependency, so that collisions with libraries in rustc's
             # sysroot don't cause ambiguity
-            args += ['--extern', '{}={}'.format(d.name, os.path.join(d.subdir, d.filename))]
+            d_rmeta = self.get_rust_rmeta_file(d)
+            if uses_metadata and d_rmeta:
+                args += ['--extern', '{}={}'.format(d.name, d_rmeta)]
+                deps.append(d_rmeta)
+            else:
+                args += ['--extern', '{}={}'.format(d.name, os.path.join(d.subdir, d.filename))]
+                orderdeps.append(os.path.join(d.subdir, d.get_filename()))
         for d in linkdirs.keys():
             if d == '':
                 d = '.'
             args += ['-L', d]
+        for d in target.get_dependencies():
+            if not self.get_rust_rmeta_file(d):
+                continue
+            if uses_metadata:
+                # Crates used indirectly are looked up by rustc, their
+                # complete rlib may not exist yet
+                args += ['-L', 'dependency={}'.format(self.get_target_private_dir(d))]
+            else:
+                deps.append(os.path.join(d.subdir, d.get_filename()))
         has_shared_deps = False
         for dep in target.get_dependencies():
             if isinstance(dep, build.SharedLibrary):
@@ -1672,10 +1751,25 @@ int dummy;
             # installations
             for rpath_arg in rpath_args:
                 args += ['-C', 'link-arg=' + rpath_arg + ':' + os.path.join(rustc.get_sysroot(), 'lib')]
-        compiler_name = self.get_compiler_rule_name('rust', target.for_machine)
-        element = NinjaBuildElement(self.all_outputs, target_name, compiler_name, main_rust_file)
+        if rmeta:
+            # rustc runs in the background from the edge that produces the
+            # metadata, and the edge that produces the rlib waits for it
+            state = os.path.join(self.get_target_private_dir(target), 'rustc')
+            compiler_name = self.get_compiler_rule_name('rust_METADATA', target.for_machine)
+            element = NinjaBuildElement(self.all_outputs, rmeta, compiler_name, main_rust_file)
+            element.add_item('STATE', state)
+            codegen_name = self.get_compiler_rule_name('rust_CODEGEN', target.for_machine)
+            codegen = NinjaBuildElement(self.all_outputs, target_name, codegen_name, main_rust_file)
+            codegen.add_dep(rmeta)
+            codegen.add_item('ARGS', args)
+            codegen.add_item('STATE', state)
+            self.add_build(codegen)
+        else:
+            compiler_name = self.get_compiler_rule_name('rust', target.for_machine)
+            element = NinjaBuildElement(self.all_outputs, target_name, compiler_name, main_rust_file)
         if len(orderdeps) > 0:
             element.add_orderdep(orderdeps)
+        element.add_dep(deps)
         element.add_item('ARGS', args)
         element.add_item('targetdep', depfile)
         element.add_item('cratetype', cratetype)
@@ -1684,6 +1778,21 @@ int dummy;
             self.generate_shsym(target)
         self.create_target_source_introspection(target, rustc, args, [main_rust_file], [])
 
+    def get_rust_rmeta_file(self, target):
+        '''Return the metadata file of target if crates using it should not
+        wait for its compilation to be complete.'''
+        if not isinstance(target, build.StaticLibrary) or getattr(target, 'rust_crate_type', None) != 'rlib':
+            return None
+        # The rustc wrapper needs fork()
+        if mesonlib.is_windows():
+            return None
+        rustc = target.compilers['rust']
+        if not mesonlib.version_compare(rustc.version, '>=1.38'):
+            return None
+        if not self.get_compiler_options_for_target(target)['rust']['pipelining'].value:
+            return None
+        return os.path.join(self.get_target_private_dir(target), 'lib{}.rmeta'.format(target.name))
+
     @staticmethod
     def get_rule_suffix(for_machine: MachineChoice) -> str:
         return PerMachine('_FOR_BUILD', '')[for_machine]
@@ -1920,6 +2029,9 @@ int dummy;
         command = compiler.get_exelist() + ['$ARGS', '$in']
         description = 'Compiling Java object $in'
         self.add_rule(NinjaRule(rule, command, [], description))
+        rule = self.get_compiler_rule_name('java_BATCH', compiler.for_machine)
+        self.add_rule(NinjaRule(rule, compiler.get_exelist(), ['$ARGS', '$in'], '$DESC',
+                                rspable=True))
 
     def generate_cs_compile_rule(self, compiler):
         rule = self.compiler_to_rule_name(compiler)
@@ -1944,6 +2056,16 @@ int dummy;
         depstyle = 'gcc'
         self.add_rule(NinjaRule(rule, command, [], description, deps=depstyle,
                                 depfile=depfile))
+        wrapper = self.environment.get_build_command() + ['--internal', 'rustc_pipeline']
+        rule = self.get_compiler_rule_name('rust_METADATA', compiler.for_machine)
+        command = wrapper + ['start', '$STATE', '--'] + compiler.get_exelist() + ['$ARGS', '$in']
+        description = 'Compiling Rust metadata $out'
+        self.add_rule(NinjaRule(rule, command, [], description, deps=depstyle,
+                                depfile=depfile))
+        rule = self.get_compiler_rule_name('rust_CODEGEN', compiler.for_machine)
+        command = wrapper + ['finish', '$STATE', '--'] + compiler.get_exelist() + ['$ARGS', '$in']
+        description = 'Compiling Rust crate $out'
+        self.add_rule(NinjaRule(rule, command, [], description))
 
     def generate_swift_compile_rules(self, compiler):
         rule = self.compiler_to_rule_name(compiler)
@@ -2095,6 +2217,9 @@ https://gcc.gnu.org/bugzilla/show_bug.cgi?id=47485'''))
 
     def generate_genlist_for_target(self, genlist, target):
         generator = genlist.get_generator()
+        if generator.batch is not None:
+            self.generate_batch_genlist_for_target(genlist, target)
+            return
         subdir = genlist.subdir
         exe = generator.get_exe()
         exe_arr = self.build_target_to_cmd_array(exe, True)
@@ -2156,6 +2281,52 @@ https://gcc.gnu.org/bugzilla/show_bug.cgi?id=47485'''))
             elem.add_item('COMMAND', cmdlist)
             self.add_build(elem)
 
+    def generate_batch_genlist_for_target(self, genlist, target):
+        generator = genlist.get_generator()
+        exe = generator.get_exe()
+        exe_arr = self.build_target_to_cmd_array(exe, True)
+        privdir = self.get_target_private_dir(target)
+        extra_dependencies = self.get_custom_target_depend_files(genlist)
+        abs_pdir = os.path.join(self.environment.get_build_dir(), self.get_target_dir(target))
+        os.makedirs(abs_pdir, exist_ok=True)
+        for batch in generator.get_batches(genlist.get_inputs()):
+            infilenames = [f.rel_to_builddir(self.build_to_src) for f in batch]
+            outfiles = [os.path.join(privdir, of) for f in batch for of in genlist.get_outputs_for(f)]
+            # Every argument mentioning the input is repeated for each file of the batch
+            args = []
+            for a in generator.arglist:
+                if '@INPUT@' in a:
+                    args += [a.replace('@INPUT@', i) for i in infilenames]
+                else:
+                    args.append(a)
+            if generator.depfile is None:
+                rulename = 'CUSTOM_COMMAND'
+            else:
+                rulename = 'CUSTOM_COMMAND_DEP'
+                # The first output is unique, use it to tell the batches apart
+                depfile = os.path.join(privdir, '{}.{}'.format(os.path.basename(outfiles[0]), generator.depfile))
+                args = [x.replace('@DEPFILE@', depfile) for x in args]
+            args = self.replace_paths(target, args, override_subdir=genlist.subdir)
+            cmdlist = exe_arr + self.replace_extra_args(args, genlist)
+            meson_exe_cmd, reason = self.as_meson_exe_cmdline('generator ' + cmdlist[0],
+                                                              cmdlist[0], cmdlist[1:])
+            if meson_exe_cmd:
+                cmdlist = meson_exe_cmd
+
+            elem = NinjaBuildElement(self.all_outputs, outfiles, rulename, infilenames)
+            elem.add_dep([self.get_target_filename(x) for x in generator.depends])
+            if generator.depfile is not None:
+                elem.add_item('DEPFILE', depfile)
+            if len(extra_dependencies) > 0:
+                elem.add_dep(extra_dependencies)
+            if reason:
+                reason = ' (wrapped by meson {})'.format(reason)
+            elem.add_item('DESC', 'Generating {} files from {!r}{}.'.format(len(outfiles), infilenames[0], reason))
+            if isinstance(exe, build.BuildTarget):
+                elem.add_dep(self.get_target_filename(exe))
+            elem.add_item('COMMAND', cmdlist)
+            self.add_build(elem)
+
     def scan_fortran_module_outputs(self, target):
         """
         Find all module and submodule made available in a Fortran code file.
@@ -2283,7 +2454,7 @@ https://gcc.gnu.org/bugzilla/show_bug.cgi?id=47485'''))
         # If you feel that the above is completely wrong and all of
         # this is actually doable, please send patches.
 
-        if target.has_pch():
+        if self.target_has_pch(target):
             tfilename = self.get_target_filename_abs(target)
             return compiler.get_compile_debugfile_args(tfilename, pch=True)
         else:
@@ -2494,10 +2665,19 @@ https://gcc.gnu.org/bugzilla/show_bug.cgi?id=47485'''))
         # Add MSVC debug file generation compile flags: /Fd /FS
         commands += self.get_compile_debugfile_args(compiler, target, rel_obj)
 
+        shareable_args = self.get_shareable_compile_args(target, compiler, commands)
+
         # PCH handling
         if self.environment.coredata.base_options.get('b_pch', False):
-            commands += self.get_pch_include_args(compiler, target)
-            pchlist = target.get_pch(compiler.language)
+            pch_args = self.get_pch_include_args(compiler, target, src)
+            commands += pch_args
+            pchlist = self.get_target_pch(target, compiler.language, src)
+            # A precompiled header may belong to another target, so its
+            # arguments must not be made independent of the private dir
+            if pchlist:
+                shareable_args += pch_args
+            else:
+                shareable_args += self.get_shareable_compile_args(target, compiler, pch_args)
         else:
             pchlist = []
         if not pchlist:
@@ -2506,7 +2686,8 @@ https://gcc.gnu.org/bugzilla/show_bug.cgi?id=47485'''))
             pch_dep = []
         else:
             arr = []
-            i = os.path.join(self.get_target_private_dir(target), compiler.get_pch_name(pchlist[0]))
+            i = os.path.join(self.get_target_pch_dir(target, compiler.get_language()),
+                             compiler.get_pch_name(pchlist[0]))
             arr.append(i)
             pch_dep = arr
 
@@ -2536,7 +2717,19 @@ https://gcc.gnu.org/bugzilla/show_bug.cgi?id=47485'''))
                         self.add_build(depelem)
             commands += compiler.get_module_outdir_args(self.get_target_private_dir(target))
 
-        element = NinjaBuildElement(self.all_outputs, rel_obj, compiler_name, rel_src)
+        # Reuse the object of another target that compiles the same source
+        # with the same arguments
+        owner_obj = self.find_shared_object(target, compiler, rel_obj, rel_src, shareable_args,
+                                            header_deps + order_deps + pch_dep)
+        if owner_obj is not None:
+            self.shared_objects[rel_obj] = owner_obj
+            return (owner_obj, rel_src.replace('\\', '/'))
+
+        # Split DWARF writes the debug info next to the object file, declare
+        # it so that ninja knows about it and cleans it up.
+        dwo_file = self.get_dwo_file_for_object(target, compiler, rel_src, rel_obj)
+        element = NinjaBuildElement(self.all_outputs, rel_obj, compiler_name, rel_src,
+                                    implicit_outs=[dwo_file] if dwo_file else None)
         self.add_header_deps(target, element, header_deps)
         for d in extra_deps:
             element.add_dep(d)
@@ -2558,6 +2751,25 @@ https://gcc.gnu.org/bugzilla/show_bug.cgi?id=47485'''))
         assert(isinstance(rel_src, str))
         return (rel_obj, rel_src.replace('\\', '/'))
 
+    def get_dwo_file_for_object(self, target, compiler, src, objfile):
+        if not self.uses_split_dwarf(target, compiler):
+            return None
+        # Depending on the assembler, assembly may not produce a .dwo file,
+        # and LLVM IR never does
+        if compiler.language not in SPLIT_DWARF_LANGUAGES or compilers.is_assembly(src) or compilers.is_llvm_ir(src):
+            return None
+        return os.path.splitext(objfile)[0] + '.dwo'
+
+    def generate_dwp(self, target):
+        dwp_file = self.get_dwp_filename(target)
+        if dwp_file is None:
+            return
+        if 'DWP' not in self.ruledict:
+            self.add_rule(NinjaRule('DWP', self.get_dwp_command() + ['-e', '$in', '-o', '$out'], [],
+                                    'Packaging split debug info $out'))
+        elem = NinjaBuildElement(self.all_outputs, dwp_file, 'DWP', self.get_target_filename(target))
+        self.add_build(elem)
+
     def add_dependency_scanner_entries_to_element(self, target, compiler, element):
         if not self.should_use_dyndeps_for_target(target):
             return
@@ -2632,7 +2844,7 @@ https://gcc.gnu.org/bugzilla/show_bug.cgi?id=47485'''))
         header_deps = header_deps if header_deps is not None else []
         pch_objects = []
         for lang in ['c', 'cpp']:
-            pch = target.get_pch(lang)
+            pch = self.get_target_pch(target, lang)
             if not pch:
                 continue
             if not has_path_sep(pch[0]) or not has_path_sep(pch[-1]):
@@ -2651,6 +2863,10 @@ https://gcc.gnu.org/bugzilla/show_bug.cgi?id=47485'''))
                 src = os.path.join(self.build_to_src, target.get_source_subdir(), pch[0])
                 (commands, dep, dst, objs) = self.generate_gcc_pch_command(target, compiler, pch[0])
                 extradep = None
+                owner_dir = self.find_shared_pch(target, compiler, src, commands, header_deps)
+                if owner_dir is not None:
+                    self.shared_pch_dirs[(target.get_id(), lang)] = owner_dir
+                    continue
             pch_objects += objs
             rulename = self.compiler_to_pch_rule_name(compiler)
             elem = NinjaBuildElement(self.all_outputs, dst, rulename, src)
@@ -2662,6 +2878,65 @@ https://gcc.gnu.org/bugzilla/show_bug.cgi?id=47485'''))
             self.add_build(elem)
         return pch_objects
 
+    def find_shared_pch(self, target, compiler, src, commands, header_deps):
+        '''Find a target that already builds an identical precompiled header.
+
+        Returns the private directory of that target. Otherwise this target
+        becomes the one that builds it, and None is returned.
+        '''
+        lang = compiler.get_language()
+        privdir = self.get_target_private_dir(target)
+        key = [lang, compiler.for_machine.name]
+        key += self.get_shareable_compile_args(target, compiler, commands)
+        key += [str(d) for d in header_deps]
+        auto_pch = self.auto_pch_files.get((target.get_id(), lang))
+        if auto_pch is not None:
+            # Generated headers live in the private dir, compare their content
+            with open(auto_pch) as f:
+                key.append(f.read())
+        else:
+            key.append(src)
+        owner_dir = self.pch_owners.setdefault(tuple(key), privdir)
+        if owner_dir == privdir:
+            return None
+        return owner_dir
+
+    def get_shareable_compile_args(self, target, compiler, commands):
+        # The only thing that differs between the commands of targets with
+        # the same flags is the include argument for their private dir.
+        privdir_args = compiler.get_include_args(self.get_target_private_dir(target), False)
+        return ['@PRIVATE_DIR@' if a in privdir_args else a for a in commands]
+
+    def find_shared_object(self, target, compiler, rel_obj, rel_src, args, deps):
+        '''Find a target that already compiles rel_src with identical arguments.
+
+        args must come from get_shareable_compile_args().
+
+        Returns the object file of that target. Otherwise this target becomes
+        the one that compiles it, and None is returned.
+        '''
+        if not self.environment.coredata.backend_options['backend_share_objects'].value:
+            return None
+        # Fortran modules and dyndeps are written to the private dir
+        if compiler.get_language() == 'fortran' or self.should_use_dyndeps_for_target(target):
+            return None
+        # Headers made by generators and valac are found through the private dir
+        if 'vala' in target.compilers:
+            return None
+        if any(isinstance(g, build.GeneratedList) for g in target.get_generated_sources()):
+            return None
+        key = [self.compiler_to_rule_name(compiler), rel_src] + args
+        for d in deps:
+            if isinstance(d, File):
+                d = d.rel_to_builddir(self.build_to_src)
+            elif not self.has_dir_part(d):
+                d = os.path.join(self.get_target_private_dir(target), d)
+            key.append(d)
+        owner_obj = self.object_owners.setdefault(tuple(key), rel_obj)
+        if owner_obj == rel_obj:
+            return None
+        return owner_obj
+
     def get_target_shsym_filename(self, target):
         # Always name the .symbols file after the primary build output because it always exists
         targetdir = self.get_target_private_dir(target)
@@ -2713,11 +2988,23 @@ https://gcc.gnu.org/bugzilla/show_bug.cgi?id=47485'''))
             if target.import_filename:
                 commands += linker.gen_import_library_args(self.get_import_filename(target))
         elif isinstance(target, build.StaticLibrary):
-            commands += linker.get_std_link_args()
+            commands += linker.get_std_link_args(self.use_thin_archive(target))
         else:
             raise RuntimeError('Unknown build target type.')
         return commands
 
+    def use_thin_archive(self, target):
+        # Thin archives only reference the object files in the build
+        # directory, so they can't be installed. Windows has no rm rule to
+        # recreate the archive, and ar refuses to convert an existing regular
+        # archive to a thin one. The Apple linker can't read them at all.
+        if target.should_install() or mesonlib.is_windows():
+            return False
+        if self.environment.machines[target.for_machine].is_darwin():
+            return False
+        options = self.get_base_options_for_target(target)
+        return 'b_thin_archive' in options and options['b_thin_archive'].value
+
     def get_target_type_link_args_post_dependencies(self, target, linker):
         commands = []
         if isinstance(target, build.Executable):
@@ -2860,7 +3147,8 @@ https://gcc.gnu.org/bugzilla/show_bug.cgi?id=47485'''))
         else:
             commands += compilers.get_base_link_args(self.get_base_options_for_target(target),
                                                      linker,
-                                                     isinstance(target, build.SharedModule))
+                                                     isinstance(target, build.SharedModule),
+                                                     self.environment.get_build_dir())
         # Add -nostdlib if needed; can't be overridden
         commands += self.get_no_stdlib_link_args(target, linker)
         # Add things like /NOLOGO; usually can't be overridden
@@ -2970,8 +3258,32 @@ https://gcc.gnu.org/bugzilla/show_bug.cgi?id=47485'''))
         elem = NinjaBuildElement(self.all_outputs, outname, linker_rule, obj_list, implicit_outs=implicit_outs)
         elem.add_dep(dep_targets + custom_target_libraries)
         elem.add_item('LINK_ARGS', commands)
+        if not isinstance(target, build.StaticLibrary) and self.uses_parallel_lto(target, linker):
+            elem.add_item('pool', 'lto_link_pool')
         return elem
 
+    def get_lto_link_pool_depth(self) -> int:
+        '''
+        Links with several LTO jobs run in a pool of their own, which lets
+        backend_max_links LTO jobs run at once.
+        '''
+        num_pools = self.environment.coredata.backend_options['backend_max_links'].value
+        try:
+            threads = self.environment.coredata.base_options['b_lto_threads'].value
+        except KeyError:
+            return 0
+        if num_pools == 0 or threads == 0:
+            return 0
+        if threads < 0:
+            threads = multiprocessing.cpu_count()
+        return max(1, num_pools // threads)
+
+    def uses_parallel_lto(self, target, linker) -> bool:
+        if self.get_lto_link_pool_depth() == 0 or 'b_lto_threads' not in linker.base_options:
+            return False
+        options = self.get_base_options_for_target(target)
+        return options['b_lto'].value and options['b_lto_threads'].value != 0
+
     def get_dependency_filename(self, t):
         if isinstance(t, build.SharedLibrary):
             return self.get_target_shsym_filename(t)
@@ -3127,6 +3439,10 @@ https://gcc.gnu.org/bugzilla/show_bug.cgi?id=47485'''))
             # Add the first output of each target to the 'all' target so that
             # they are all built
             targetlist.append(os.path.join(self.get_target_dir(t), t.get_outputs()[0]))
+            # The split debug info is packaged after the link, build it too
+            dwp_file = self.get_dwp_filename(t)
+            if dwp_file is not None:
+                targetlist.append(dwp_file)
 
         elem = NinjaBuildElement(self.all_outputs, 'all', 'phony', targetlist)
         self.add_build(elem)
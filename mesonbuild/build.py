@@ -1112,7 +1112,7 @@ This will become a hard error in a future Meson release.''')
     def get_objects(self):
         return self.objects
 
-    def get_generated_sources(self):
+    def get_generated_sources(self) -> T.List[T.Union['CustomTarget', 'CustomTargetIndex', 'GeneratedList']]:
         return self.generated
 
     def should_install(self) -> bool:
@@ -1443,13 +1443,14 @@ class Generator:
         self.depfile = None
         self.capture = False
         self.depends = []
+        self.batch = None
         self.process_kwargs(kwargs)
 
     def __repr__(self):
         repr_str = "<{0}: {1}>"
         return repr_str.format(self.__class__.__name__, self.exe)
 
-    def get_exe(self):
+    def get_exe(self) -> T.Union['Executable', dependencies.ExternalProgram]:
         return self.exe
 
     def process_kwargs(self, kwargs):
@@ -1497,6 +1498,30 @@ class Generator:
                 if not (isinstance(d, (BuildTarget, CustomTarget))):
                     raise InvalidArguments('Depends entries must be build targets.')
                 self.depends.append(d)
+        if 'batch' in kwargs:
+            batch = kwargs['batch']
+            if isinstance(batch, bool):
+                self.batch = 0 if batch else None
+            elif isinstance(batch, int) and batch > 0:
+                self.batch = batch
+            else:
+                raise InvalidArguments('Batch must be a boolean or a positive integer.')
+        if self.batch is not None:
+            for a in self.arglist:
+                for s in ('@OUTPUT@', '@BASENAME@', '@PLAINNAME@'):
+                    if s in a:
+                        raise InvalidArguments('{} can not be used in "arguments" of a batch generator.'.format(s))
+            if self.capture:
+                raise InvalidArguments('Capture can not be used in a batch generator.')
+            if self.depfile is not None and ('@BASENAME@' in self.depfile or '@PLAINNAME@' in self.depfile):
+                raise InvalidArguments('Depfile of a batch generator must not contain @BASENAME@ or @PLAINNAME@.')
+
+    def get_batches(self, infiles):
+        '''Split the inputs into the groups handled by one invocation.'''
+        if self.batch is None:
+            return [[f] for f in infiles]
+        size = self.batch or len(infiles)
+        return [infiles[i:i + size] for i in range(0, len(infiles), size)]
 
     def get_base_outnames(self, inname):
         plainname = os.path.basename(inname)
@@ -1583,7 +1608,7 @@ class GeneratedList:
     def get_outputs_for(self, filename):
         return self.outmap[filename]
 
-    def get_generator(self):
+    def get_generator(self) -> 'Generator':
         return self.generator
 
     def get_extra_args(self):
@@ -2147,7 +2172,7 @@ class CustomTarget(Target):
         repr_str = "<{0} {1}: {2}>"
         return repr_str.format(self.__class__.__name__, self.get_id(), self.command)
 
-    def get_target_dependencies(self):
+    def get_target_dependencies(self) -> T.List[T.Union['BuildTarget', 'CustomTarget']]:
         deps = self.dependencies[:]
         deps += self.extra_depends
         for c in unholder(self.sources):
@@ -2155,7 +2180,7 @@ class CustomTarget(Target):
                 deps.append(c)
         return deps
 
-    def get_transitive_build_target_deps(self):
+    def get_transitive_build_target_deps(self) -> T.Set['BuildTarget']:
         '''
         Recursively fetch the build targets that this custom target depends on,
         whether through `command:`, `depends:`, or `sources:` The recursion is
@@ -266,7 +266,18 @@ clike_debug_args = {False: [],
                     True: ['-g']}  # type: T.Dict[bool, T.List[str]]
 
 base_options = {'b_pch': coredata.UserBooleanOption('Use precompiled headers', True),
+                'b_pch_auto': coredata.UserBooleanOption('Generate precompiled headers from the most included system headers',
+                                                         False),
                 'b_lto': coredata.UserBooleanOption('Use link time optimization', False),
+                'b_lto_threads': coredata.UserIntegerOption('Use multiple threads for link time optimization, -1 for one per CPU',
+                                                            (-1, None, 0)),
+                'b_lto_mode': coredata.UserComboOption('Select between different link time optimization modes',
+                                                       ['default', 'thin'],
+                                                       'default'),
+                'b_thinlto_cache': coredata.UserBooleanOption('Use a ThinLTO cache in the build directory',
+                                                              False),
+                'b_thinlto_cache_policy': coredata.UserStringOption('Pruning policy of the ThinLTO cache, empty for the linker default',
+                                                                    ''),
                 'b_sanitize': coredata.UserComboOption('Code sanitizer to use',
                                                        ['none', 'address', 'thread', 'undefined', 'memory', 'address,undefined'],
                                                        'none'),
@@ -288,6 +299,12 @@ base_options = {'b_pch': coredata.UserBooleanOption('Use precompiled headers', T
                                                     False),
                 'b_bitcode': coredata.UserBooleanOption('Generate and embed bitcode (only macOS/iOS/tvOS)',
                                                         False),
+                'b_split_dwarf': coredata.UserBooleanOption('Emit debug info into separate .dwo files',
+                                                            False),
+                'b_thin_archive': coredata.UserBooleanOption('Create thin archives for static libraries that are not installed',
+                                                             False),
+                'b_time_trace': coredata.UserBooleanOption('Write a time trace report next to each object file',
+                                                           False),
                 'b_vscrt': coredata.UserComboOption('VS run-time library type to use.',
                                                     ['none', 'md', 'mdd', 'mt', 'mtd', 'from_buildtype', 'static_from_buildtype'],
                                                     'from_buildtype'),
@@ -304,11 +321,19 @@ def option_enabled(boptions: T.List[str], options: 'OptionDictType',
     except KeyError:
         return False
 
+def get_option_value(options: 'OptionDictType', option: str, fallback: T.Any) -> T.Any:
+    try:
+        return options[option].value
+    except KeyError:
+        return fallback
+
 def get_base_compile_args(options: 'OptionDictType', compiler: 'Compiler') -> T.List[str]:
     args = []  # type T.List[str]
     try:
         if options['b_lto'].value:
-            args.extend(compiler.get_lto_compile_args())
+            args.extend(compiler.get_lto_compile_args(
+                threads=get_option_value(options, 'b_lto_threads', 0),
+                mode=get_option_value(options, 'b_lto_mode', 'default')))
     except KeyError:
         pass
     try:
@@ -342,6 +367,14 @@ def get_base_compile_args(options: 'OptionDictType', compiler: 'Compiler') -> T.
     # This does not need a try...except
     if option_enabled(compiler.base_options, options, 'b_bitcode'):
         args.append('-fembed-bitcode')
+    if option_enabled(compiler.base_options, options, 'b_split_dwarf'):
+        try:
+            if options['debug'].value:
+                args += compiler.get_split_dwarf_args()
+        except KeyError:
+            pass
+    if option_enabled(compiler.base_options, options, 'b_time_trace'):
+        args += compiler.get_time_trace_args()
     try:
         crt_val = options['b_vscrt'].value
         buildtype = options['buildtype'].value
@@ -354,11 +387,18 @@ def get_base_compile_args(options: 'OptionDictType', compiler: 'Compiler') -> T.
     return args
 
 def get_base_link_args(options: 'OptionDictType', linker: 'Compiler',
-                       is_shared_module: bool) -> T.List[str]:
+                       is_shared_module: bool, build_dir: str) -> T.List[str]:
     args = []  # type: T.List[str]
     try:
         if options['b_lto'].value:
-            args.extend(linker.get_lto_link_args())
+            thinlto_cache_dir = None
+            if get_option_value(options, 'b_thinlto_cache', False):
+                thinlto_cache_dir = os.path.join(build_dir, 'meson-private', 'thinlto-cache')
+            args.extend(linker.get_lto_link_args(
+                threads=get_option_value(options, 'b_lto_threads', 0),
+                mode=get_option_value(options, 'b_lto_mode', 'default'),
+                thinlto_cache_dir=thinlto_cache_dir,
+                thinlto_cache_policy=get_option_value(options, 'b_thinlto_cache_policy', '')))
     except KeyError:
         pass
     try:
@@ -378,6 +418,12 @@ def get_base_link_args(options: 'OptionDictType', linker: 'Compiler',
             args += linker.get_coverage_link_args()
     except KeyError:
         pass
+    if option_enabled(linker.base_options, options, 'b_split_dwarf'):
+        try:
+            if options['debug'].value:
+                args += linker.get_gdb_index_link_args()
+        except KeyError:
+            pass
 
     as_needed = option_enabled(linker.base_options, options, 'b_asneeded')
     bitcode = option_enabled(linker.base_options, options, 'b_bitcode')
@@ -935,12 +981,23 @@ class Compiler(metaclass=abc.ABCMeta):
             ret.append(arg)
         return ret
 
-    def get_lto_compile_args(self) -> T.List[str]:
+    def get_lto_compile_args(self, *, threads: int = 0, mode: str = 'default') -> T.List[str]:
         return []
 
-    def get_lto_link_args(self) -> T.List[str]:
+    def get_lto_link_args(self, *, threads: int = 0, mode: str = 'default',
+                          thinlto_cache_dir: T.Optional[str] = None,
+                          thinlto_cache_policy: str = '') -> T.List[str]:
         return self.linker.get_lto_args()
 
+    def get_split_dwarf_args(self) -> T.List[str]:
+        return []
+
+    def get_time_trace_args(self) -> T.List[str]:
+        return []
+
+    def get_gdb_index_link_args(self) -> T.List[str]:
+        return self.linker.get_gdb_index_args()
+
     def sanitizer_compile_args(self, value: str) -> T.List[str]:
         return []
 
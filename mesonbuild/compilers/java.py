@@ -18,11 +18,13 @@ import subprocess
 import textwrap
 import typing as T
 
+from .. import coredata
 from ..mesonlib import EnvironmentException, MachineChoice
 from .compilers import Compiler, java_buildtype_args
 from .mixins.islinker import BasicLinkerIsCompilerMixin
 
 if T.TYPE_CHECKING:
+    from ..coredata import OptionDictType
     from ..envconfig import MachineInfo
     from ..environment import Environment
 
@@ -102,3 +104,11 @@ class JavaCompiler(BasicLinkerIsCompilerMixin, Compiler):
 
     def get_optimization_args(self, optimization_level: str) -> T.List[str]:
         return []
+
+    def get_options(self) -> 'OptionDictType':
+        return {
+            'batch': coredata.UserBooleanOption(
+                'Compile all sources of a target with one compiler invocation',
+                False,
+            ),
+        }
@@ -19,7 +19,7 @@ import shutil
 import typing as T
 
 from ... import mesonlib
-from ...linkers import AppleDynamicLinker
+from ...linkers import AppleDynamicLinker, GnuGoldDynamicLinker, LLVMDynamicLinker
 from ..compilers import CompileCheckMode
 from .gnu import GnuLikeCompiler
 
@@ -53,12 +53,23 @@ class ClangCompiler(GnuLikeCompiler):
         # linkers don't have base_options.
         if isinstance(self.linker, AppleDynamicLinker):
             self.base_options.append('b_bitcode')
+        # Split DWARF is only implemented for ELF targets
+        if not (self.info.is_windows() or self.info.is_cygwin() or self.info.is_darwin()):
+            self.base_options.append('b_split_dwarf')
+        self.base_options.extend(['b_lto_threads', 'b_lto_mode', 'b_thinlto_cache', 'b_thinlto_cache_policy'])
+        # Apple Clang versions do not follow the upstream ones
+        if mesonlib.version_compare(self.version, '>=9.0.0') and \
+                not isinstance(self.linker, AppleDynamicLinker):
+            self.base_options.append('b_time_trace')
         # All Clang backends can also do LLVM IR
         self.can_compile_suffixes.add('ll')
 
     def get_colorout_args(self, colortype: str) -> T.List[str]:
         return clang_color_args[colortype][:]
 
+    def get_time_trace_args(self) -> T.List[str]:
+        return ['-ftime-trace']
+
     def has_builtin_define(self, define: str) -> bool:
         return define in self.defines
 
@@ -100,6 +111,28 @@ class ClangCompiler(GnuLikeCompiler):
         return super().has_function(funcname, prefix, env, extra_args=extra_args,
                                    dependencies=dependencies)
 
+    def get_lto_compile_args(self, *, threads: int = 0, mode: str = 'default') -> T.List[str]:
+        if mode == 'thin':
+            # ThinLTO requires the use of gold, lld or ld64
+            if not isinstance(self.linker, (AppleDynamicLinker, GnuGoldDynamicLinker, LLVMDynamicLinker)):
+                raise mesonlib.MesonException(
+                    "LLVM's ThinLTO only works with gold, lld or ld64, not {}".format(self.linker.id))
+            return ['-flto=thin']
+        return super().get_lto_compile_args(threads=threads, mode=mode)
+
+    def get_lto_link_args(self, *, threads: int = 0, mode: str = 'default',
+                          thinlto_cache_dir: T.Optional[str] = None,
+                          thinlto_cache_policy: str = '') -> T.List[str]:
+        args = self.get_lto_compile_args(threads=threads, mode=mode)
+        if mode == 'thin' and thinlto_cache_dir is not None:
+            args.extend(self.linker.get_thinlto_cache_args(thinlto_cache_dir))
+            if thinlto_cache_policy:
+                args.extend(self.linker.get_thinlto_cache_policy_args(thinlto_cache_policy))
+        # -flto-jobs=0 means one job per CPU, which is already the default
+        if threads > 0:
+            args.append('-flto-jobs={}'.format(threads))
+        return args
+
     def openmp_flags(self) -> T.List[str]:
         if mesonlib.version_compare(self.version, '>=3.8.0'):
             return ['-fopenmp']
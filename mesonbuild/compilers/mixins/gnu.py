@@ -16,6 +16,7 @@
 
 import abc
 import functools
+import multiprocessing
 import os
 import pathlib
 import re
@@ -146,7 +147,7 @@ class GnuLikeCompiler(Compiler, metaclass=abc.ABCMeta):
     LINKER_PREFIX = '-Wl,'
 
     def __init__(self) -> None:
-        self.base_options = ['b_pch', 'b_lto', 'b_pgo', 'b_coverage',
+        self.base_options = ['b_pch', 'b_pch_auto', 'b_lto', 'b_pgo', 'b_coverage',
                              'b_ndebug', 'b_staticpic', 'b_pie']
         if not (self.info.is_windows() or self.info.is_cygwin() or self.info.is_openbsd()):
             self.base_options.append('b_lundef')
@@ -154,6 +155,8 @@ class GnuLikeCompiler(Compiler, metaclass=abc.ABCMeta):
             self.base_options.append('b_asneeded')
         if not self.info.is_hurd():
             self.base_options.append('b_sanitize')
+        if not (self.info.is_windows() or self.info.is_darwin()):
+            self.base_options.append('b_thin_archive')
         # All GCC-like backends can do assembly
         self.can_compile_suffixes.add('s')
 
@@ -279,9 +282,12 @@ class GnuLikeCompiler(Compiler, metaclass=abc.ABCMeta):
                 return self._split_fetch_real_dirs(line.split('=', 1)[1])
         return []
 
-    def get_lto_compile_args(self) -> T.List[str]:
+    def get_lto_compile_args(self, *, threads: int = 0, mode: str = 'default') -> T.List[str]:
         return ['-flto']
 
+    def get_split_dwarf_args(self) -> T.List[str]:
+        return ['-gsplit-dwarf']
+
     def sanitizer_compile_args(self, value: str) -> T.List[str]:
         if value == 'none':
             return []
@@ -329,12 +335,37 @@ class GnuCompiler(GnuLikeCompiler):
         self.id = 'gcc'
         self.defines = defines or {}
         self.base_options.append('b_colorout')
+        # Split DWARF is only implemented for ELF targets
+        if not (self.info.is_windows() or self.info.is_cygwin() or self.info.is_darwin()):
+            self.base_options.append('b_split_dwarf')
+        self.base_options.append('b_lto_threads')
 
     def get_colorout_args(self, colortype: str) -> T.List[str]:
         if mesonlib.version_compare(self.version, '>=4.9.0'):
             return gnu_color_args[colortype][:]
         return []
 
+    def get_lto_compile_args(self, *, threads: int = 0, mode: str = 'default') -> T.List[str]:
+        if threads > 0:
+            return ['-flto={}'.format(threads)]
+        if threads < 0:
+            # -flto=auto uses the jobserver of make if there is one, and one
+            # job per CPU otherwise. -flto=jobserver, its only alternative
+            # before GCC 10, runs serially without make.
+            if mesonlib.version_compare(self.version, '>=10.0'):
+                return ['-flto=auto']
+            return ['-flto={}'.format(multiprocessing.cpu_count())]
+        return super().get_lto_compile_args(threads=threads, mode=mode)
+
+    def get_lto_link_args(self, *, threads: int = 0, mode: str = 'default',
+                          thinlto_cache_dir: T.Optional[str] = None,
+                          thinlto_cache_policy: str = '') -> T.List[str]:
+        # The LTRANS stage runs at link time, so this is where the
+        # parallelism actually matters.
+        if threads != 0:
+            return self.get_lto_compile_args(threads=threads, mode=mode)
+        return super().get_lto_link_args(threads=threads, mode=mode)
+
     def get_warn_args(self, level: str) -> T.List[str]:
         # Mypy doesn't understand cooperative inheritance
         args = super().get_warn_args(level)
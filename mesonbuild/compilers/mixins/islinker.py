@@ -48,7 +48,9 @@ class BasicLinkerIsCompilerMixin(Compiler):
     def sanitizer_link_args(self, value: str) -> T.List[str]:
         return []
 
-    def get_lto_link_args(self) -> T.List[str]:
+    def get_lto_link_args(self, *, threads: int = 0, mode: str = 'default',
+                          thinlto_cache_dir: T.Optional[str] = None,
+                          thinlto_cache_policy: str = '') -> T.List[str]:
         return []
 
     def can_linker_accept_rsp(self) -> bool:
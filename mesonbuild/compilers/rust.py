@@ -140,6 +140,14 @@ class RustCompiler(Compiler):
                 ['none', '2015', '2018'],
                 'none',
             ),
+            'incremental': coredata.UserBooleanOption(
+                'Keep an incremental compilation cache in the private directory of each target',
+                False,
+            ),
+            'pipelining': coredata.UserBooleanOption(
+                'Compile crates as soon as the metadata of the rlibs they use is available',
+                False,
+            ),
         }
 
     def get_option_compile_args(self, options: 'OptionDictType') -> T.List[str]:
@@ -547,6 +547,11 @@ class CoreData:
                     'Maximum number of linker processes to run or 0 for no '
                     'limit',
                     (0, None, 0))
+            self.backend_options['backend_share_objects'] = \
+                UserBooleanOption(
+                    'Compile sources that several targets build with '
+                    'identical arguments only once',
+                    False)
         elif backend_name.startswith('vs'):
             self.backend_options['backend_startup_project'] = \
                 UserStringOption(
@@ -1183,6 +1188,7 @@ BUILTIN_CORE_OPTIONS = OrderedDict([
     ('strip',           BuiltinOption(UserBooleanOption, 'Strip targets on install', False)),
     ('unity',           BuiltinOption(UserComboOption, 'Unity build', 'off', choices=['on', 'off', 'subprojects'])),
     ('unity_size',      BuiltinOption(UserIntegerOption, 'Unity block size', (2, None, 4))),
+    ('unity_strategy',  BuiltinOption(UserComboOption, 'How sources are split into unity files', 'count', choices=['count', 'cost'])),
     ('warning_level',   BuiltinOption(UserComboOption, 'Compiler warning level to use', '1', choices=['0', '1', '2', '3'], yielding=False)),
     ('werror',          BuiltinOption(UserBooleanOption, 'Treat warnings as errors', False, yielding=False)),
     ('wrap_mode',       BuiltinOption(UserComboOption, 'Wrap mode', 'default', choices=['default', 'nofallback', 'nodownload', 'forcefallback'])),
@@ -644,6 +644,7 @@ class ExternalLibraryHolder(InterpreterObject, ObjectHolder):
         return DependencyHolder(pdep, self.subproject)
 
 class GeneratorHolder(InterpreterObject, ObjectHolder):
+    @FeatureNewKwargs('generator', '0.57.0', ['batch'])
     @FeatureNewKwargs('generator', '0.43.0', ['capture'])
     def __init__(self, interp, args, kwargs):
         self.interpreter = interp
@@ -974,7 +975,8 @@ class Test(InterpreterObject):
                  depends: T.List[T.Union[build.CustomTarget, build.BuildTarget]],
                  is_parallel: bool, cmd_args: T.List[str], env: build.EnvironmentVariables,
                  should_fail: bool, timeout: int, workdir: T.Optional[str], protocol: str,
-                 priority: int):
+                 priority: int, locks: T.List[str], shared_locks: T.List[str], cpus: int,
+                 shards: int):
         InterpreterObject.__init__(self)
         self.name = name
         self.suite = suite
@@ -989,6 +991,10 @@ class Test(InterpreterObject):
         self.workdir = workdir
         self.protocol = TestProtocol.from_str(protocol)
         self.priority = priority
+        self.locks = locks
+        self.shared_locks = shared_locks
+        self.cpus = cpus
+        self.shards = shards
 
     def get_exe(self):
         return self.exe
@@ -2289,7 +2295,7 @@ known_build_target_kwargs = (
     {'target_type'}
 )
 
-_base_test_args = {'args', 'depends', 'env', 'should_fail', 'timeout', 'workdir', 'suite', 'priority', 'protocol'}
+_base_test_args = {'args', 'depends', 'env', 'should_fail', 'timeout', 'workdir', 'suite', 'priority', 'protocol', 'cpus'}
 
 permitted_kwargs = {'add_global_arguments': {'language', 'native'},
                     'add_global_link_arguments': {'language', 'native'},
@@ -2363,6 +2369,7 @@ permitted_kwargs = {'add_global_arguments': {'language', 'native'},
                                   'depends',
                                   'depfile',
                                   'capture',
+                                  'batch',
                                   'preserve_path_from'},
                     'include_directories': {'is_system'},
                     'install_data': {'install_dir', 'install_mode', 'rename', 'sources'},
@@ -2380,7 +2387,7 @@ permitted_kwargs = {'add_global_arguments': {'language', 'native'},
                     'library': known_library_kwargs,
                     'subdir': {'if_found'},
                     'subproject': {'version', 'default_options', 'required'},
-                    'test': set.union(_base_test_args, {'is_parallel'}),
+                    'test': set.union(_base_test_args, {'is_parallel', 'locks', 'shared_locks', 'shards'}),
                     'vcs_tag': {'input', 'output', 'fallback', 'command', 'replace_string'},
                     }
 
@@ -4098,6 +4105,7 @@ This will become a hard error in the future.''' % kwargs['input'], location=self
 
     @FeatureNewKwargs('benchmark', '0.46.0', ['depends'])
     @FeatureNewKwargs('benchmark', '0.52.0', ['priority'])
+    @FeatureNewKwargs('benchmark', '0.57.0', ['cpus'])
     @permittedKwargs(permitted_kwargs['benchmark'])
     def func_benchmark(self, node, args, kwargs):
         # is_parallel isn't valid here, so make sure it isn't passed
@@ -4107,6 +4115,7 @@ This will become a hard error in the future.''' % kwargs['input'], location=self
 
     @FeatureNewKwargs('test', '0.46.0', ['depends'])
     @FeatureNewKwargs('test', '0.52.0', ['priority'])
+    @FeatureNewKwargs('test', '0.57.0', ['locks', 'shared_locks', 'cpus', 'shards'])
     @permittedKwargs(permitted_kwargs['test'])
     def func_test(self, node, args, kwargs):
         if kwargs.get('protocol') == 'gtest':
@@ -4182,8 +4191,22 @@ This will become a hard error in the future.''' % kwargs['input'], location=self
         priority = kwargs.get('priority', 0)
         if not isinstance(priority, int):
             raise InterpreterException('Keyword argument priority must be an integer.')
+        locks = mesonlib.stringlistify(kwargs.get('locks', []))
+        shared_locks = mesonlib.stringlistify(kwargs.get('shared_locks', []))
+        both = set(locks) & set(shared_locks)
+        if both:
+            raise InterpreterException('Test can not hold lock {!r} both exclusively and shared.'.format(sorted(both)[0]))
+        cpus = kwargs.get('cpus', 1)
+        if not isinstance(cpus, int) or cpus < 1:
+            raise InterpreterException('Keyword argument cpus must be a positive integer.')
+        shards = kwargs.get('shards', 1)
+        if not isinstance(shards, int) or shards < 0:
+            raise InterpreterException('Keyword argument shards must be a non-negative integer.')
+        if shards != 1 and protocol != 'gtest':
+            raise InterpreterException('Keyword argument shards can only be used with the "gtest" protocol.')
         t = Test(name, prj, suite, exe.held_object, depends, par, cmd_args,
-                 env, should_fail, timeout, workdir, protocol, priority)
+                 env, should_fail, timeout, workdir, protocol, priority,
+                 locks, shared_locks, cpus, shards)
         if is_base_test:
             self.build.tests.append(t)
             mlog.debug('Adding test', mlog.bold(name, True))
@@ -47,7 +47,7 @@ class StaticLinker:
     def get_exelist(self) -> T.List[str]:
         return self.exelist.copy()
 
-    def get_std_link_args(self) -> T.List[str]:
+    def get_std_link_args(self, is_thin: bool = False) -> T.List[str]:
         return []
 
     def get_buildtype_linker_args(self, buildtype: str) -> T.List[str]:
@@ -155,11 +155,20 @@ class ArLinker(StaticLinker):
         else:
             self.std_args = ['csr']
         self.can_rsp = '@<' in stdo
+        # Thin archives only reference the member objects instead of copying
+        # them. Both GNU ar and llvm-ar create them with --thin; older
+        # versions of them only have the T modifier, which is deprecated now.
+        self.thin_flag = '--thin' in stdo
+        self.can_thin = self.thin_flag or '[T]' in stdo
 
     def can_linker_accept_rsp(self) -> bool:
         return self.can_rsp
 
-    def get_std_link_args(self) -> T.List[str]:
+    def get_std_link_args(self, is_thin: bool = False) -> T.List[str]:
+        if is_thin and self.can_thin:
+            if self.thin_flag:
+                return self.std_args + ['--thin']
+            return [self.std_args[0] + 'T'] + self.std_args[1:]
         return self.std_args
 
     def get_output_args(self, target: str) -> T.List[str]:
@@ -172,6 +181,7 @@ class ArmarLinker(ArLinker):  # lgtm [py/missing-call-to-init]
         StaticLinker.__init__(self, exelist)
         self.id = 'armar'
         self.std_args = ['-csr']
+        self.can_thin = False
 
     def can_linker_accept_rsp(self) -> bool:
         # armar can't accept arguments using the @rsp syntax
@@ -184,7 +194,7 @@ class DLinker(StaticLinker):
         self.id = exelist[0]
         self.arch = arch
 
-    def get_std_link_args(self) -> T.List[str]:
+    def get_std_link_args(self, is_thin: bool = False) -> T.List[str]:
         return ['-lib']
 
     def get_output_args(self, target: str) -> T.List[str]:
@@ -266,6 +276,7 @@ class AIXArLinker(ArLinker):
         StaticLinker.__init__(self, exelist)
         self.id = 'aixar'
         self.std_args = ['-csr', '-Xany']
+        self.can_thin = False
 
     def can_linker_accept_rsp(self) -> bool:
         # AIXAr can't accept arguments using the @rsp syntax
@@ -414,6 +425,17 @@ class DynamicLinker(LinkerEnvVarsMixin, metaclass=abc.ABCMeta):
     def get_lto_args(self) -> T.List[str]:
         return []
 
+    def get_gdb_index_args(self) -> T.List[str]:
+        """Arguments to build a .gdb_index section, which speeds up
+        loading split debug info in gdb."""
+        return []
+
+    def get_thinlto_cache_args(self, path: str) -> T.List[str]:
+        return []
+
+    def get_thinlto_cache_policy_args(self, policy: str) -> T.List[str]:
+        return []
+
     def sanitizer_args(self, value: str) -> T.List[str]:
         return []
 
@@ -699,6 +721,9 @@ class AppleDynamicLinker(PosixDynamicLinkerMixin, DynamicLinker):
     def get_pie_args(self) -> T.List[str]:
         return []
 
+    def get_thinlto_cache_args(self, path: str) -> T.List[str]:
+        return self._apply_prefix('-cache_path_lto,' + path)
+
     def get_link_whole_for(self, args: T.List[str]) -> T.List[str]:
         result = []  # type: T.List[str]
         for a in args:
@@ -772,6 +797,15 @@ class GnuGoldDynamicLinker(GnuDynamicLinker):
 
     id = 'ld.gold'
 
+    def get_thinlto_cache_args(self, path: str) -> T.List[str]:
+        return self._apply_prefix('-plugin-opt,cache-dir=' + path)
+
+    def get_thinlto_cache_policy_args(self, policy: str) -> T.List[str]:
+        return self._apply_prefix('-plugin-opt,cache-policy=' + policy)
+
+    def get_gdb_index_args(self) -> T.List[str]:
+        return self._apply_prefix('--gdb-index')
+
 
 class GnuBFDDynamicLinker(GnuDynamicLinker):
 
@@ -802,6 +836,15 @@ class LLVMDynamicLinker(GnuLikeDynamicLinkerMixin, PosixDynamicLinkerMixin, Dyna
             return self._apply_prefix('--allow-shlib-undefined')
         return []
 
+    def get_gdb_index_args(self) -> T.List[str]:
+        return self._apply_prefix('--gdb-index')
+
+    def get_thinlto_cache_args(self, path: str) -> T.List[str]:
+        return self._apply_prefix('--thinlto-cache-dir=' + path)
+
+    def get_thinlto_cache_policy_args(self, policy: str) -> T.List[str]:
+        return self._apply_prefix('--thinlto-cache-policy=' + policy)
+
 
 class WASMDynamicLinker(GnuLikeDynamicLinkerMixin, PosixDynamicLinkerMixin, DynamicLinker):
 
@@ -1070,7 +1113,7 @@ class PGIStaticLinker(StaticLinker):
         self.id = 'ar'
         self.std_args = ['-r']
 
-    def get_std_link_args(self) -> T.List[str]:
+    def get_std_link_args(self, is_thin: bool = False) -> T.List[str]:
         return self.std_args
 
     def get_output_args(self, target: str) -> T.List[str]:
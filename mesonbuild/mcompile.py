@@ -26,6 +26,8 @@ from pathlib import Path
 from . import mlog
 from . import mesonlib
 from . import coredata
+from . import build
+from .backend.backends import read_ninja_log
 from .mesonlib import MesonException
 from mesonbuild.environment import detect_ninja
 from mesonbuild.coredata import UserArrayOption
@@ -270,6 +272,215 @@ def get_parsed_args_xcode(options: 'argparse.Namespace', builddir: Path) -> T.Tu
     cmd += options.xcode_args
     return cmd, None
 
+# Number of edges listed in the slowest edges of the build statistics
+STATS_SLOWEST_EDGES = 20
+# Written to meson-private by `meson compile` after each ninja run
+LAST_BUILD_MARKER = 'last_ninja_build.json'
+
+class BuildEdge:
+    def __init__(self, start: int, end: int, outputs: T.List[str]):
+        self.start = start
+        self.end = end
+        self.outputs = outputs
+        self.target = None  # type: T.Optional[str]
+
+    @property
+    def duration(self) -> int:
+        return self.end - self.start
+
+def get_ninja_log_state(builddir: Path) -> T.Optional[T.Tuple[int, int]]:
+    """Return the inode and size of the .ninja_log of builddir."""
+    try:
+        st = (builddir / '.ninja_log').stat()
+    except OSError:
+        return None
+    return st.st_ino, st.st_size
+
+def write_last_build_marker(builddir: Path, before: T.Optional[T.Tuple[int, int]]) -> None:
+    """
+    Record where the entries of the ninja run that `meson compile` just
+    finished are in .ninja_log. ninja appends to the log, unless it rewrites
+    it at startup to drop the entries of outdated runs; the start of the run
+    is unknown then.
+    """
+    after = get_ninja_log_state(builddir)
+    if after is None:
+        return
+    if before is None:
+        start = 0  # type: T.Optional[int]
+    elif before[0] == after[0] and before[1] <= after[1]:
+        start = before[1]
+    else:
+        start = None
+    marker = {'inode': after[0], 'start': start, 'end': after[1]}
+    with (builddir / 'meson-private' / LAST_BUILD_MARKER).open('w') as f:
+        json.dump(marker, f)
+
+def last_ninja_build(builddir: Path) -> T.List[BuildEdge]:
+    """
+    Group the entries of the most recent ninja run recorded in .ninja_log by
+    the edge that produced them. That run must have been started by
+    `meson compile`, which records where its entries start.
+    """
+    try:
+        with (builddir / 'meson-private' / LAST_BUILD_MARKER).open() as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        marker = None
+    if marker is None or (marker['inode'], marker['end']) != get_ninja_log_state(builddir):
+        raise MesonException('The last build was not run by `meson compile`, run it again to record build statistics.')
+    if marker['start'] is None:
+        raise MesonException('ninja compacted its log during the last build, run `meson compile` again to record build statistics.')
+    edges = {}  # type: T.Dict[T.Tuple[int, int, str], BuildEdge]
+    for start, end, output, cmdhash in read_ninja_log(str(builddir), marker['start']):
+        key = (start, end, cmdhash)
+        if key in edges:
+            edges[key].outputs.append(os.path.normpath(output))
+        else:
+            edges[key] = BuildEdge(start, end, [os.path.normpath(output)])
+    return sorted(edges.values(), key=lambda e: (e.start, e.end))
+
+def get_target_dependencies(target: build.Target) -> T.List[build.Target]:
+    deps = []  # type: T.List[T.Any]
+    if isinstance(target, build.BuildTarget):
+        deps += target.link_targets + target.link_whole_targets
+        for g in target.get_generated_sources():
+            if isinstance(g, build.GeneratedList):
+                deps += [g.get_generator().get_exe()] + g.get_generator().depends
+            else:
+                deps.append(g)
+        deps += [o.target for o in target.objects if isinstance(o, build.ExtractedObjects)]
+    elif isinstance(target, build.CustomTarget):
+        deps += target.get_target_dependencies() + target.command
+    deps = [d.target if isinstance(d, build.CustomTargetIndex) else d for d in deps]
+    return [d for d in deps if isinstance(d, build.Target)]
+
+def get_output_owners(b: build.Build) -> T.Dict[str, str]:
+    """
+    Map the outputs and private directories of all targets, relative to the
+    build directory, to the id of their target.
+    """
+    owners = {}  # type: T.Dict[str, str]
+    for tid, t in b.get_targets().items():
+        outputs = [os.path.normpath(os.path.join(t.subdir, o)) for o in t.get_outputs()]
+        for o in outputs:
+            owners[o] = tid
+        if outputs:
+            owners[outputs[0] + '.p'] = tid
+    return owners
+
+def find_output_owner(owners: T.Dict[str, str], output: str) -> T.Optional[str]:
+    # Objects and other intermediate files live in the private directory
+    if output in owners:
+        return owners[output]
+    return next((owners[str(d)] for d in Path(output).parents if str(d) in owners), None)
+
+def load_compdb(builddir: Path) -> T.List[T.Dict[str, str]]:
+    try:
+        with (builddir / 'compile_commands.json').open() as f:
+            return T.cast(T.List[T.Dict[str, str]], json.load(f))
+    except (OSError, ValueError):
+        return []
+
+def get_build_stats(builddir: Path) -> T.Tuple[T.Dict[str, T.Any], T.List[BuildEdge]]:
+    """
+    Map the edges of the last build back to the targets that produced them
+    and compute where the build time went.
+    """
+    b = build.load(str(builddir))
+    edges = last_ninja_build(builddir)
+    targets = b.get_targets()
+
+    owners = get_output_owners(b)
+    sources = {}  # type: T.Dict[str, str]
+    for c in load_compdb(builddir):
+        sources[os.path.normpath(c['output'])] = os.path.normpath(os.path.join(c['directory'], c['file']))
+
+    stats = defaultdict(lambda: {'time': 0, 'edges': 0})  # type: T.Dict[str, T.Dict[str, T.Any]]
+    for e in edges:
+        for o in e.outputs:
+            e.target = find_output_owner(owners, o)
+            if e.target:
+                break
+        if e.target is None:
+            continue
+        s = stats[e.target]
+        s['start'] = min(s.get('start', e.start), e.start)
+        s['end'] = max(s.get('end', e.end), e.end)
+        s['time'] += e.duration
+        s['edges'] += 1
+
+    def describe(tid: str) -> T.Dict[str, T.Any]:
+        s = stats[tid]
+        return {'id': tid,
+                'name': targets[tid].get_basename(),
+                'start': s['start'] / 1000,
+                'end': s['end'] / 1000,
+                'time': s['time'] / 1000,
+                'edges': s['edges']}
+
+    # Walk back from the target that finished last through the dependency
+    # that finished last, i.e. the one it was waiting for
+    critical_path = []  # type: T.List[T.Dict[str, T.Any]]
+    current = max(stats, key=lambda tid: stats[tid]['end'], default=None)
+    while current is not None:
+        critical_path.insert(0, describe(current))
+        deps = [d.get_id() for d in get_target_dependencies(targets[current])]
+        deps = [d for d in deps if d in stats and stats[d]['end'] <= stats[current]['end'] and d not in [c['id'] for c in critical_path]]
+        current = max(deps, key=lambda tid: stats[tid]['end'], default=None)
+
+    wall_time = max((e.end for e in edges), default=0) - min((e.start for e in edges), default=0)
+    cpu_time = sum(e.duration for e in edges)
+    slowest = sorted(edges, key=lambda e: e.duration, reverse=True)[:STATS_SLOWEST_EDGES]
+    result = {
+        'wall_time': wall_time / 1000,
+        'cpu_time': cpu_time / 1000,
+        'parallelism': cpu_time / wall_time if wall_time else 0.0,
+        'slowest': [{'outputs': e.outputs,
+                     'source': next((sources[o] for o in e.outputs if o in sources), None),
+                     'target': e.target,
+                     'time': e.duration / 1000} for e in slowest],
+        'targets': [describe(tid) for tid in sorted(stats, key=lambda tid: stats[tid]['time'], reverse=True)],
+        'critical_path': critical_path,
+    }
+    return result, edges
+
+def get_chrome_trace(edges: T.List[BuildEdge]) -> T.Dict[str, T.Any]:
+    """
+    Convert the edges to the Trace Event Format read by chrome://tracing and
+    Perfetto, with one thread per concurrently running edge.
+    """
+    lanes = []  # type: T.List[int]
+    events = []  # type: T.List[T.Dict[str, T.Any]]
+    for e in edges:
+        for lane, end in enumerate(lanes):
+            if end <= e.start:
+                break
+        else:
+            lane = len(lanes)
+            lanes.append(0)
+        lanes[lane] = e.end
+        events.append({'name': ', '.join(e.outputs),
+                       'cat': e.target or 'other',
+                       'ph': 'X',
+                       'ts': e.start * 1000,
+                       'dur': e.duration * 1000,
+                       'pid': 0,
+                       'tid': lane,
+                       'args': {}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+def run_stats(options: 'argparse.Namespace', builddir: Path) -> int:
+    if not (builddir / '.ninja_log').is_file():
+        raise MesonException('No build recorded in `{}`, build the project first.'.format(builddir / '.ninja_log'))
+    result, edges = get_build_stats(builddir)
+    if options.stats_trace:
+        with open(options.stats_trace, 'w') as f:
+            json.dump(get_chrome_trace(edges), f)
+    if options.stats:
+        print(json.dumps(result, indent=4))
+    return 0
+
 def add_arguments(parser: 'argparse.ArgumentParser') -> None:
     """Add compile specific arguments."""
     parser.add_argument(
@@ -328,6 +539,17 @@ def add_arguments(parser: 'argparse.ArgumentParser') -> None:
         default=[],
         help='Arguments to pass to `xcodebuild` (applied only on `xcode` backend).'
     )
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        help='Print where the time went in the last build as JSON, instead of building (applied only on `ninja` backend).'
+    )
+    parser.add_argument(
+        '--stats-trace',
+        metavar='FILE',
+        default=None,
+        help='Write a Chrome trace of the last build to FILE, instead of building (applied only on `ninja` backend).'
+    )
 
 def run(options: 'argparse.Namespace') -> int:
     bdir = options.builddir  # type: Path
@@ -340,6 +562,12 @@ def run(options: 'argparse.Namespace') -> int:
         raise MesonException('`TARGET` and `--clean` can\'t be used simultaneously')
 
     backend = get_backend_from_coredata(bdir)
+    if options.stats or options.stats_trace:
+        if options.targets or options.clean:
+            raise MesonException('`--stats` and `--stats-trace` can\'t be used with `TARGET` or `--clean`')
+        if backend != 'ninja':
+            raise MesonException('Build statistics are only available with the ninja backend.')
+        return run_stats(options, bdir)
     if backend == 'ninja':
         cmd, env = get_parsed_args_ninja(options, bdir)
     elif backend.startswith('vs'):
@@ -350,6 +578,9 @@ def run(options: 'argparse.Namespace') -> int:
         raise MesonException(
             'Backend `{}` is not yet supported by `compile`. Use generated project files directly instead.'.format(backend))
 
+    log_state = get_ninja_log_state(bdir) if backend == 'ninja' else None
     p, *_ = mesonlib.Popen_safe(cmd, stdout=sys.stdout.buffer, stderr=sys.stderr.buffer, env=env)
+    if backend == 'ninja':
+        write_last_build_marker(bdir, log_state)
 
     return p.returncode
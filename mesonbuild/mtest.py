@@ -16,20 +16,26 @@
 
 from pathlib import Path
 from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
 from copy import deepcopy
 import argparse
 import asyncio
 import datetime
 import enum
-import io
+import gzip
+import hashlib
 import json
+import math
 import multiprocessing
 import os
 import pickle
 import platform
 import random
 import re
+import shutil
 import signal
+import stat
+import statistics
 import subprocess
 import sys
 import tempfile
@@ -37,6 +43,7 @@ import textwrap
 import time
 import typing as T
 import xml.etree.ElementTree as et
+from xml.sax.saxutils import quoteattr
 
 from . import build
 from . import environment
@@ -44,7 +51,7 @@ from . import mlog
 from .coredata import major_versions_differ, MesonVersionMismatchException
 from .coredata import version as coredata_version
 from .dependencies import ExternalProgram
-from .mesonlib import MesonException, OrderedSet, get_wine_shortpath, split_args, join_args
+from .mesonlib import MesonException, OrderedSet, get_wine_shortpath, split_args, join_args, python_command
 from .mintro import get_infodir, load_info_file
 from .backend.backends import TestProtocol, TestSerialisation
 
@@ -56,6 +63,19 @@ GNU_SKIP_RETURNCODE = 77
 # mean that the test failed even before testing what it is supposed to test.
 GNU_ERROR_RETURNCODE = 99
 
+LOG_COMPRESSION_SUFFIXES = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+
+# The number of tests listed by the summary of --rusage
+RUSAGE_SUMMARY_COUNT = 5
+
+# Environment variables that change between runs without changing the
+# result of the tests, and are left out of the key of --cache
+CACHE_IGNORED_ENV = {
+    '_', 'COLUMNS', 'LINES', 'OLDPWD', 'PWD', 'SHLVL', 'TERM', 'WINDOWID',
+    'MAKEFLAGS', 'MAKELEVEL', 'MFLAGS', 'MESON_TESTTHREADS', 'MALLOC_PERTURB_',
+    'SSH_AUTH_SOCK', 'SSH_CLIENT', 'SSH_CONNECTION', 'SSH_TTY',
+}
+
 def is_windows() -> bool:
     platname = platform.system().lower()
     return platname == 'windows'
@@ -80,11 +100,35 @@ def determine_worker_count() -> int:
             num_workers = 1
     return num_workers
 
+def parse_shard(value: str) -> T.Tuple[int, int]:
+    try:
+        index, count = (int(i) for i in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('must be of the form INDEX/COUNT, e.g. 1/8')
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError('the index must be between 1 and the number of shards')
+    return index, count
+
+def parse_cpu_list(value: str) -> T.Set[int]:
+    cpus = set()  # type: T.Set[int]
+    try:
+        for part in value.split(','):
+            first, _, last = part.partition('-')
+            cpus.update(range(int(first), int(last or first) + 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError('must be a list of CPU numbers and ranges, e.g. 0,2-3')
+    if not cpus:
+        raise argparse.ArgumentTypeError('the list of CPUs is empty')
+    return cpus
+
 def add_arguments(parser: argparse.ArgumentParser) -> None:
     parser.add_argument('--repeat', default=1, dest='repeat', type=int,
                         help='Number of times to run the tests.')
     parser.add_argument('--no-rebuild', default=False, action='store_true',
                         help='Do not rebuild before running tests.')
+    parser.add_argument('--pipelined-rebuild', default=False, action='store_true',
+                        help='Rebuild the dependencies of the tests in the order they are started, '
+                        'and start each test as soon as its own are up to date.')
     parser.add_argument('--gdb', default=False, dest='gdb', action='store_true',
                         help='Run test under gdb.')
     parser.add_argument('--gdb-path', default='gdb', dest='gdb_path',
@@ -108,10 +152,48 @@ def add_arguments(parser: argparse.ArgumentParser) -> None:
                         help="Whether to print failing tests' logs.")
     parser.add_argument('--benchmark', default=False, action='store_true',
                         help="Run benchmarks instead of tests.")
+    parser.add_argument('--warmup', default=0, type=int, metavar='N',
+                        help='With --benchmark, run each benchmark N times before the runs that are measured.')
+    parser.add_argument('--cpu-affinity', default=None, type=parse_cpu_list, metavar='CPUS',
+                        help='Only let the tests run on the given CPUs, e.g. 2 or 0,2-3.')
+    parser.add_argument('--save-baseline', default=None, metavar='FILE',
+                        help='With --benchmark, write the statistics of the benchmarks to FILE.')
+    parser.add_argument('--compare-baseline', default=None, metavar='FILE',
+                        help='With --benchmark, compare the benchmarks with the statistics saved in FILE.')
+    parser.add_argument('--regression-threshold', default=5.0, type=float, metavar='PERCENT',
+                        help='Fail if the median time of a benchmark is more than PERCENT higher '
+                        'than in the baseline (default: %(default)s).')
     parser.add_argument('--logbase', default='testlog',
                         help="Base name for log file.")
     parser.add_argument('--num-processes', default=determine_worker_count(), type=int,
                         help='How many parallel processes to use.')
+    parser.add_argument('--spill-size', default=1024 * 1024, type=int, metavar='BYTES',
+                        help='Keep the output of a test in its own file in meson-logs when it is '
+                        'longer than this, and only part of it in the logs (default: %(default)s).')
+    parser.add_argument('--keep-output', default='end', choices=['end', 'start', 'both'],
+                        help='Which part of a long test output to keep in the logs (default: %(default)s).')
+    parser.add_argument('--log-compression', default='none', choices=list(LOG_COMPRESSION_SUFFIXES),
+                        help='Compress the log files (default: %(default)s).')
+    parser.add_argument('--schedule', default='longest-first', choices=['longest-first', 'declared'],
+                        help='Order in which to start the tests of the same priority (default: %(default)s).')
+    parser.add_argument('--cache', default='off', nargs='?', const='on', choices=['off', 'on', 'refresh'],
+                        help='Do not run the tests that passed with the same inputs last time. '
+                        '"refresh" runs all tests and records their results (default: %(default)s).')
+    parser.add_argument('--shard', default=None, type=parse_shard, metavar='INDEX/COUNT',
+                        help='Only run the INDEXth of COUNT groups of the selected tests.')
+    parser.add_argument('--shard-timings', default=None, metavar='FILE',
+                        help='Test history of a previous run, used to give each shard the same run time.')
+    parser.add_argument('--shard-manifest', default=None, metavar='FILE',
+                        help='Write the list of the tests of the shard to FILE as JSON.')
+    parser.add_argument('--failed-first', default=False, action='store_true',
+                        help='Start the tests that failed last time first.')
+    parser.add_argument('--last-failed', default=False, action='store_true',
+                        help='Only run the tests that failed last time.')
+    parser.add_argument('--rusage', default=False, action='store_true',
+                        help='Record the CPU time, memory and I/O used by each test, and list '
+                        'the tests that used the most.')
+    parser.add_argument('--max-rss', default=None, type=int, metavar='MIB',
+                        help='Fail the tests that use more than MIB mebibytes of memory. Implies --rusage.')
     parser.add_argument('-v', '--verbose', default=False, action='store_true',
                         help='Do not redirect stdout and stderr')
     parser.add_argument('-q', '--quiet', default=False, action='store_true',
@@ -225,8 +307,17 @@ class TAPParser:
     _RE_YAML_START = re.compile(r'(\s+)---.*')
     _RE_YAML_END = re.compile(r'\s+\.\.\.\s*')
 
-    def __init__(self, io: T.Iterator[str]):
+    def __init__(self, io: T.Optional[T.Iterator[str]] = None):
         self.io = io
+        self.found_late_test = False
+        self.bailed_out = False
+        self.plan = None  # type: T.Optional[TAPParser.Plan]
+        self.lineno = 0
+        self.num_tests = 0
+        self.yaml_lineno = None  # type: T.Optional[int]
+        self.yaml_indent = ''
+        self.state = self._MAIN
+        self.version = 12
 
     def parse_test(self, ok: bool, num: int, name: str, directive: T.Optional[str], explanation: T.Optional[str]) -> \
             T.Generator[T.Union['TAPParser.Test', 'TAPParser.Error'], None, None]:
@@ -247,111 +338,107 @@ class TAPParser:
         yield self.Test(num, name, TestResult.OK if ok else TestResult.FAIL, explanation)
 
     def parse(self) -> T.Generator[T.Union['TAPParser.Test', 'TAPParser.Error', 'TAPParser.Version', 'TAPParser.Plan', 'TAPParser.Bailout'], None, None]:
-        found_late_test = False
-        bailed_out = False
-        plan = None
-        lineno = 0
-        num_tests = 0
-        yaml_lineno = None
-        yaml_indent = ''
-        state = self._MAIN
-        version = 12
-        while True:
-            lineno += 1
-            try:
-                line = next(self.io).rstrip()
-            except StopIteration:
-                break
-
-            # YAML blocks are only accepted after a test
-            if state == self._AFTER_TEST:
-                if version >= 13:
-                    m = self._RE_YAML_START.match(line)
-                    if m:
-                        state = self._YAML
-                        yaml_lineno = lineno
-                        yaml_indent = m.group(1)
-                        continue
-                state = self._MAIN
+        assert self.io is not None
+        for line in self.io:
+            yield from self.parse_line(line)
+        yield from self.parse_eof()
+
+    def parse_line(self, line: str) -> T.Generator[T.Union['TAPParser.Test', 'TAPParser.Error', 'TAPParser.Version', 'TAPParser.Plan', 'TAPParser.Bailout'], None, None]:
+        """Parse one line of output, the test may still be running."""
+        self.lineno += 1
+        line = line.rstrip()
+
+        # YAML blocks are only accepted after a test
+        if self.state == self._AFTER_TEST:
+            if self.version >= 13:
+                m = self._RE_YAML_START.match(line)
+                if m:
+                    self.state = self._YAML
+                    self.yaml_lineno = self.lineno
+                    self.yaml_indent = m.group(1)
+                    return
+            self.state = self._MAIN
 
-            elif state == self._YAML:
-                if self._RE_YAML_END.match(line):
-                    state = self._MAIN
-                    continue
-                if line.startswith(yaml_indent):
-                    continue
-                yield self.Error('YAML block not terminated (started on line {})'.format(yaml_lineno))
-                state = self._MAIN
+        elif self.state == self._YAML:
+            if self._RE_YAML_END.match(line):
+                self.state = self._MAIN
+                return
+            if line.startswith(self.yaml_indent):
+                return
+            yield self.Error('YAML block not terminated (started on line {})'.format(self.yaml_lineno))
+            self.state = self._MAIN
 
-            assert state == self._MAIN
-            if line.startswith('#'):
-                continue
+        assert self.state == self._MAIN
+        if line.startswith('#'):
+            return
 
-            m = self._RE_TEST.match(line)
-            if m:
-                if plan and plan.late and not found_late_test:
-                    yield self.Error('unexpected test after late plan')
-                    found_late_test = True
-                num_tests += 1
-                num = num_tests if m.group(2) is None else int(m.group(2))
-                if num != num_tests:
-                    yield self.Error('out of order test numbers')
-                yield from self.parse_test(m.group(1) == 'ok', num,
-                                           m.group(3), m.group(4), m.group(5))
-                state = self._AFTER_TEST
-                continue
+        m = self._RE_TEST.match(line)
+        if m:
+            if self.plan and self.plan.late and not self.found_late_test:
+                yield self.Error('unexpected test after late plan')
+                self.found_late_test = True
+            self.num_tests += 1
+            num = self.num_tests if m.group(2) is None else int(m.group(2))
+            if num != self.num_tests:
+                yield self.Error('out of order test numbers')
+            yield from self.parse_test(m.group(1) == 'ok', num,
+                                       m.group(3), m.group(4), m.group(5))
+            self.state = self._AFTER_TEST
+            return
 
-            m = self._RE_PLAN.match(line)
-            if m:
-                if plan:
-                    yield self.Error('more than one plan found')
-                else:
-                    count = int(m.group(1))
-                    skipped = (count == 0)
-                    if m.group(2):
-                        if m.group(2).upper().startswith('SKIP'):
-                            if count > 0:
-                                yield self.Error('invalid SKIP directive for plan')
-                            skipped = True
-                        else:
-                            yield self.Error('invalid directive for plan')
-                    plan = self.Plan(count=count, late=(num_tests > 0),
-                                     skipped=skipped, explanation=m.group(3))
-                    yield plan
-                continue
+        m = self._RE_PLAN.match(line)
+        if m:
+            if self.plan:
+                yield self.Error('more than one plan found')
+            else:
+                count = int(m.group(1))
+                skipped = (count == 0)
+                if m.group(2):
+                    if m.group(2).upper().startswith('SKIP'):
+                        if count > 0:
+                            yield self.Error('invalid SKIP directive for plan')
+                        skipped = True
+                    else:
+                        yield self.Error('invalid directive for plan')
+                self.plan = self.Plan(count=count, late=(self.num_tests > 0),
+                                      skipped=skipped, explanation=m.group(3))
+                yield self.plan
+            return
 
-            m = self._RE_BAILOUT.match(line)
-            if m:
-                yield self.Bailout(m.group(1))
-                bailed_out = True
-                continue
+        m = self._RE_BAILOUT.match(line)
+        if m:
+            yield self.Bailout(m.group(1))
+            self.bailed_out = True
+            return
 
-            m = self._RE_VERSION.match(line)
-            if m:
-                # The TAP version is only accepted as the first line
-                if lineno != 1:
-                    yield self.Error('version number must be on the first line')
-                    continue
-                version = int(m.group(1))
-                if version < 13:
-                    yield self.Error('version number should be at least 13')
-                else:
-                    yield self.Version(version=version)
-                continue
+        m = self._RE_VERSION.match(line)
+        if m:
+            # The TAP version is only accepted as the first line
+            if self.lineno != 1:
+                yield self.Error('version number must be on the first line')
+                return
+            self.version = int(m.group(1))
+            if self.version < 13:
+                yield self.Error('version number should be at least 13')
+            else:
+                yield self.Version(version=self.version)
+            return
 
-            if not line:
-                continue
+        if not line:
+            return
 
-            yield self.Error('unexpected input at line {}'.format((lineno,)))
+        yield self.Error('unexpected input at line {}'.format((self.lineno,)))
 
-        if state == self._YAML:
-            yield self.Error('YAML block not terminated (started on line {})'.format(yaml_lineno))
+    def parse_eof(self) -> T.Generator['TAPParser.Error', None, None]:
+        """Check that the output was complete once the test is done."""
+        if self.state == self._YAML:
+            yield self.Error('YAML block not terminated (started on line {})'.format(self.yaml_lineno))
 
-        if not bailed_out and plan and num_tests != plan.count:
-            if num_tests < plan.count:
-                yield self.Error('Too few tests run (expected {}, got {})'.format(plan.count, num_tests))
+        if not self.bailed_out and self.plan and self.num_tests != self.plan.count:
+            if self.num_tests < self.plan.count:
+                yield self.Error('Too few tests run (expected {}, got {})'.format(self.plan.count, self.num_tests))
             else:
-                yield self.Error('Too many tests run (expected {}, got {})'.format(plan.count, num_tests))
+                yield self.Error('Too many tests run (expected {}, got {})'.format(self.plan.count, self.num_tests))
 
 
 class TestLogger:
@@ -374,10 +461,56 @@ class TestLogger:
         pass
 
 
+class LogFile:
+    '''
+    A log file, which can be compressed. The data is compressed and written
+    by a thread shared by all the log files, so that large logs do not delay
+    the tests.
+    '''
+
+    WRITER = ThreadPoolExecutor(max_workers=1)
+
+    def __init__(self, filename: str, compression: str = 'none', errors: str = 'replace') -> None:
+        self.filename = filename + LOG_COMPRESSION_SUFFIXES[compression]
+        self.errors = errors
+        self.error = None  # type: T.Optional[OSError]
+        self.raw = open(self.filename, 'wb')
+        if compression == 'gzip':
+            self.file = gzip.GzipFile(fileobj=self.raw, mode='wb')  # type: T.Any
+        elif compression == 'zstd':
+            import zstandard
+            self.file = zstandard.ZstdCompressor().stream_writer(self.raw)
+        else:
+            self.file = self.raw
+        self.last_write = None  # type: T.Optional[Future]
+
+    def _write(self, data: bytes) -> None:
+        if self.error is None:
+            try:
+                self.file.write(data)
+            except OSError as e:
+                self.error = e
+
+    def write(self, text: str) -> None:
+        self.last_write = self.WRITER.submit(self._write, text.encode('utf-8', self.errors))
+
+    def close(self) -> None:
+        # The writes are done in order, so all of them are done after the last one
+        if self.last_write is not None:
+            self.last_write.result()
+        try:
+            self.file.close()
+            self.raw.close()
+        except OSError as e:
+            self.error = self.error or e
+        if self.error is not None:
+            mlog.warning('Could not write {}: {}'.format(self.filename, self.error))
+
+
 class TestFileLogger(TestLogger):
-    def __init__(self, filename: str, errors: str = 'replace') -> None:
-        self.filename = filename
-        self.file = open(filename, 'w', encoding='utf8', errors=errors)
+    def __init__(self, filename: str, compression: str = 'none', errors: str = 'replace') -> None:
+        self.file = LogFile(filename, compression, errors)  # type: T.Optional[LogFile]
+        self.filename = self.file.filename
 
     def close(self) -> None:
         if self.file:
@@ -508,6 +641,10 @@ class ConsoleLogger(TestLogger):
             for i, result in enumerate(harness.collected_failures, 1):
                 print(harness.format(result, mlog.colorize_console()))
 
+        if harness.options.rusage:
+            print(harness.rusage_summary(), end='')
+        if harness.options.benchmark:
+            print(harness.benchmark_report(), end='')
         print(harness.summary())
 
 
@@ -526,6 +663,10 @@ class TextLogfileBuilder(TestFileLogger):
             self.file.write("\nSummary of Failures:\n\n")
             for i, result in enumerate(harness.collected_failures, 1):
                 self.file.write(harness.format(result, False) + '\n')
+        if harness.options.rusage:
+            self.file.write(harness.rusage_summary())
+        if harness.options.benchmark:
+            self.file.write(harness.benchmark_report())
         self.file.write(harness.summary())
 
         print('Full log written to {}'.format(self.filename))
@@ -541,33 +682,69 @@ class JsonLogfileBuilder(TestFileLogger):
                    'returncode': result.returncode,
                    'env': result.env,
                    'command': result.cmd}  # type: T.Dict[str, T.Any]
+        if result.cached:
+            jresult['cached'] = True
+        if result.stdo_files:
+            jresult['stdout_files'] = result.stdo_files
+        if result.stde_files:
+            jresult['stderr_files'] = result.stde_files
+        if result.rusage is not None:
+            jresult['rusage'] = result.rusage
         if result.stde:
             jresult['stderr'] = result.stde
         self.file.write(json.dumps(jresult) + '\n')
 
 
-class JunitBuilder(TestLogger):
+class JunitBuilder(TestFileLogger):
 
     """Builder for Junit test results.
 
-    Junit is impossible to stream out, it requires attributes counting the
-    total number of tests, failures, skips, and errors in the root element
-    and in each test suite. As such, we use a builder class to track each
-    test case, and calculate all metadata before writing it out.
+    Junit requires attributes counting the total number of tests, failures,
+    skips, and errors in the root element and in each test suite. Each
+    suite is written out as soon as it is complete, and the totals of the
+    root element are filled in at the end, if the file is not compressed.
 
     For tests with multiple results (like from a TAP test), we record the
     test as a suite with the project_name.test_name. This allows us to track
     each result separately. For tests with only one result (such as exit-code
     tests) we record each one into a suite with the name project_name. The use
     of the project_name allows us to sort subproject tests separately from
-    the root project.
+    the root project. These test cases are kept in a temporary file until
+    all the tests are done.
     """
 
-    def __init__(self, filename: str) -> None:
-        self.filename = filename
-        self.root = et.Element(
-            'testsuites', tests='0', errors='0', failures='0')
-        self.suites = {}  # type: T.Dict[str, et.Element]
+    HEADER = "<?xml version='1.0' encoding='utf-8'?>\n<testsuites"
+    # Room for the totals, which cannot count more than 2**63 tests
+    ROOT_PADDING = len(' tests="{0}" errors="{0}" failures="{0}"'.format(2 ** 63))
+
+    def __init__(self, filename: str, compression: str = 'none') -> None:
+        super().__init__(filename, compression)
+        self.compression = compression
+        self.totals = {'tests': 0, 'errors': 0, 'failures': 0}
+        self.suite_names = set()  # type: T.Set[str]
+        self.suites = {}  # type: T.Dict[str, T.Tuple[et.Element, T.IO[str]]]
+
+    def start(self, harness: 'TestHarness') -> None:
+        # Leave room for the totals in the root element
+        padding = self.ROOT_PADDING if self.compression == 'none' else 0
+        self.file.write(self.HEADER + ' ' * padding + '>')
+
+    @staticmethod
+    def add_rusage(element: et.Element, test: 'TestRun') -> None:
+        # Must be the first child of a testsuite or testcase
+        if test.rusage is None:
+            return
+        properties = et.SubElement(element, 'properties')
+        for k, v in test.rusage.items():
+            et.SubElement(properties, 'property', name='rusage.' + k, value=str(v))
+
+    def write_suite(self, suite: et.Element) -> None:
+        self.file.write(et.tostring(suite, encoding='unicode'))
+
+    def add_totals(self, suite: et.Element) -> None:
+        # Skipped is really not allowed in the "testsuits" element
+        for attr in self.totals:
+            self.totals[attr] += int(suite.attrib[attr])
 
     def log(self, harness: 'TestHarness', test: 'TestRun') -> None:
         """Log a single test case."""
@@ -581,7 +758,7 @@ class JunitBuilder(TestLogger):
                     del case.attrib['result']
                 for case in suite.findall('.//testcase[@timestamp]'):
                     del case.attrib['timestamp']
-                self.root.append(suite)
+                self.write_suite(suite)
             return
 
         # In this case we have a test binary with multiple results.
@@ -589,9 +766,10 @@ class JunitBuilder(TestLogger):
         # separately
         if test.results:
             suitename = '{}.{}'.format(test.project, test.name)
-            assert suitename not in self.suites, 'duplicate suite'
+            assert suitename not in self.suite_names, 'duplicate suite'
+            self.suite_names.add(suitename)
 
-            suite = self.suites[suitename] = et.Element(
+            suite = et.Element(
                 'testsuite',
                 name=suitename,
                 tests=str(len(test.results)),
@@ -601,6 +779,7 @@ class JunitBuilder(TestLogger):
                                  {TestResult.FAIL, TestResult.UNEXPECTEDPASS, TestResult.TIMEOUT})),
                 skipped=str(sum(1 for r in test.results if r is TestResult.SKIP)),
             )
+            self.add_rusage(suite, test)
 
             for i, result in enumerate(test.results):
                 # Both name and classname are required. Set them both to the
@@ -623,20 +802,26 @@ class JunitBuilder(TestLogger):
                     fail.text = 'Test did not finish before configured timeout.'
             if test.stdo:
                 out = et.SubElement(suite, 'system-out')
-                out.text = test.stdo.rstrip()
+                out.text = test.get_spill_note(test.stdo_files) + test.stdo.rstrip()
             if test.stde:
                 err = et.SubElement(suite, 'system-err')
-                err.text = test.stde.rstrip()
+                err.text = test.get_spill_note(test.stde_files) + test.stde.rstrip()
+            self.add_totals(suite)
+            self.write_suite(suite)
         else:
             if test.project not in self.suites:
-                suite = self.suites[test.project] = et.Element(
+                suite = et.Element(
                     'testsuite', name=test.project, tests='1', errors='0',
                     failures='0', skipped='0')
+                self.suites[test.project] = (suite, tempfile.TemporaryFile('w+', encoding='utf-8'))
             else:
-                suite = self.suites[test.project]
+                suite = self.suites[test.project][0]
                 suite.attrib['tests'] = str(int(suite.attrib['tests']) + 1)
 
-            testcase = et.SubElement(suite, 'testcase', name=test.name, classname=test.name)
+            testcase = et.Element('testcase', name=test.name, classname=test.name)
+            if test.cached:
+                testcase.set('status', 'cached')
+            self.add_rusage(testcase, test)
             if test.res is TestResult.SKIP:
                 et.SubElement(testcase, 'skipped')
                 suite.attrib['skipped'] = str(int(suite.attrib['skipped']) + 1)
@@ -648,22 +833,39 @@ class JunitBuilder(TestLogger):
                 suite.attrib['failures'] = str(int(suite.attrib['failures']) + 1)
             if test.stdo:
                 out = et.SubElement(testcase, 'system-out')
-                out.text = test.stdo.rstrip()
+                out.text = test.get_spill_note(test.stdo_files) + test.stdo.rstrip()
             if test.stde:
                 err = et.SubElement(testcase, 'system-err')
-                err.text = test.stde.rstrip()
+                err.text = test.get_spill_note(test.stde_files) + test.stde.rstrip()
+            self.suites[test.project][1].write(et.tostring(testcase, encoding='unicode'))
 
     async def finish(self, harness: 'TestHarness') -> None:
-        """Calculate total test counts and write out the xml result."""
-        for suite in self.suites.values():
-            self.root.append(suite)
-            # Skipped is really not allowed in the "testsuits" element
-            for attr in ['tests', 'errors', 'failures']:
-                self.root.attrib[attr] = str(int(self.root.attrib[attr]) + int(suite.attrib[attr]))
+        """Write out the suites of the projects and the total test counts."""
+        for suite, cases in self.suites.values():
+            self.add_totals(suite)
+            attrs = ''.join(' {}={}'.format(k, quoteattr(v)) for k, v in suite.items())
+            self.file.write('<testsuite{}>'.format(attrs))
+            cases.seek(0)
+            for chunk in iter(lambda: cases.read(65536), ''):
+                self.file.write(chunk)
+            cases.close()
+            self.file.write('</testsuite>')
+        self.suites = {}
+        self.file.write('</testsuites>\n')
+        self.close()
+
+        if self.compression == 'none':
+            attrs = ''.join(' {}="{}"'.format(k, v) for k, v in self.totals.items())
+            assert len(attrs) <= self.ROOT_PADDING
+            with open(self.filename, 'r+b') as f:
+                f.seek(len(self.HEADER))
+                f.write(attrs.ljust(self.ROOT_PADDING).encode())
 
-        tree = et.ElementTree(self.root)
-        with open(self.filename, 'wb') as f:
-            tree.write(f, encoding='utf-8', xml_declaration=True)
+    def close(self) -> None:
+        for _, cases in self.suites.values():
+            cases.close()
+        self.suites = {}
+        super().close()
 
 
 class TestRun:
@@ -686,21 +888,83 @@ class TestRun:
         self.should_fail = test.should_fail
         self.project = test.project_name
         self.junit = None      # type: T.Optional[et.ElementTree]
+        self.shard = None      # type: T.Optional[T.Tuple[int, int]]
+        self.cache_key = None  # type: T.Optional[str]
+        self.stdo_files = []   # type: T.List[str]
+        self.stde_files = []   # type: T.List[str]
+        self.tap = TAPParser()
+        self.tap_results = []  # type: T.List[TestResult]
+        self.tap_errors = ''
+        self.tap_failed = False
+        self.cached = False
+        self.rusage = None     # type: T.Optional[T.Dict[str, T.Union[int, float]]]
+        self.rss_exceeded = False
 
     def start(self) -> None:
         self.res = TestResult.RUNNING
         self.starttime = time.time()
 
+    def get_gtest_output(self) -> str:
+        filename = self.test.name
+        if self.shard is not None:
+            filename += '.shard{}'.format(self.shard[0])
+        filename += '.xml'
+        if self.test.workdir:
+            filename = os.path.join(self.test.workdir, filename)
+        return filename
+
     def complete_gtest(self, returncode: int,
                        stdo: T.Optional[str], stde: T.Optional[str],
                        cmd: T.List[str]) -> None:
-        filename = '{}.xml'.format(self.test.name)
-        if self.test.workdir:
-            filename = os.path.join(self.test.workdir, filename)
-        tree = et.parse(filename)
+        tree = et.parse(self.get_gtest_output())
 
         self.complete_exitcode(returncode, stdo, stde, cmd, junit=tree)
 
+    def complete_shards(self, shards: T.List['TestRun']) -> None:
+        """Merge the results of the shards of a GoogleTest test into one."""
+        root = et.Element('testsuites')
+        suites = {}  # type: T.Dict[str, et.Element]
+        for shard in shards:
+            if shard.junit is None:
+                continue
+            for suite in shard.junit.findall('.//testsuite'):
+                name = suite.get('name', '')
+                if name not in suites:
+                    suites[name] = suite
+                    root.append(suite)
+                    continue
+                # Every shard runs some of the cases of each suite
+                merged = suites[name]
+                merged.extend(suite.findall('testcase'))
+                for attr in ('tests', 'failures', 'errors', 'disabled', 'skipped'):
+                    if attr in suite.attrib:
+                        merged.set(attr, str(int(merged.get(attr, '0')) + int(suite.get(attr))))
+
+        stdo = ''.join(s.stdo or '' for s in shards)
+        stde = ''.join(s.stde or '' for s in shards)
+        self.stdo_files = [f for s in shards for f in s.stdo_files]
+        self.stde_files = [f for s in shards for f in s.stde_files]
+        usages = [s.rusage for s in shards if s.rusage is not None]
+        if usages:
+            self.rusage = merge_rusage(usages)
+        cmd = shards[0].cmd or []
+        returncode = next((s.returncode for s in shards if s.returncode), 0)
+        junit = et.ElementTree(root)
+        for res in (TestResult.INTERRUPT, TestResult.TIMEOUT, TestResult.ERROR):
+            if any(s.res is res for s in shards):
+                self.complete(res, [], returncode, stdo, stde, cmd, junit=junit)
+                return
+        if any(s.res in {TestResult.PENDING, TestResult.RUNNING} for s in shards):
+            # A shard did not get to run because the test was interrupted
+            self.complete(TestResult.INTERRUPT, [], returncode, stdo, stde, cmd, junit=junit)
+            return
+        self.complete_exitcode(returncode, stdo, stde, cmd, junit=junit)
+
+    def complete_cached(self, res: TestResult) -> None:
+        """Report the result of a previous run with the same inputs."""
+        self.complete(res, [], 0, None, None, None)
+        self.cached = True
+
     def complete_exitcode(self, returncode: int,
                           stdo: T.Optional[str], stde: T.Optional[str],
                           cmd: T.List[str],
@@ -715,23 +979,29 @@ class TestRun:
             res = TestResult.FAIL if bool(returncode) else TestResult.OK
         self.complete(res, [], returncode, stdo, stde, cmd, **kwargs)
 
-    def complete_tap(self, returncode: int, stdo: str, stde: str, cmd: T.List[str]) -> None:
-        res = None    # type: T.Optional[TestResult]
-        results = []  # type: T.List[TestResult]
-        failed = False
-
-        for i in TAPParser(io.StringIO(stdo)).parse():
+    def parse_tap(self, events: T.Iterable[T.Union['TAPParser.Test', 'TAPParser.Error', 'TAPParser.Version', 'TAPParser.Plan', 'TAPParser.Bailout']]) -> None:
+        for i in events:
             if isinstance(i, TAPParser.Bailout):
-                results.append(TestResult.ERROR)
-                failed = True
+                self.tap_results.append(TestResult.ERROR)
+                self.tap_failed = True
             elif isinstance(i, TAPParser.Test):
-                results.append(i.result)
+                self.tap_results.append(i.result)
                 if i.result not in {TestResult.OK, TestResult.EXPECTEDFAIL, TestResult.SKIP}:
-                    failed = True
+                    self.tap_failed = True
             elif isinstance(i, TAPParser.Error):
-                results.append(TestResult.ERROR)
-                stde += '\nTAP parsing error: ' + i.message
-                failed = True
+                self.tap_results.append(TestResult.ERROR)
+                self.tap_errors += '\nTAP parsing error: ' + i.message
+                self.tap_failed = True
+
+    def parse_tap_line(self, line: str) -> None:
+        self.parse_tap(self.tap.parse_line(line))
+
+    def complete_tap(self, returncode: int, stdo: str, stde: str, cmd: T.List[str]) -> None:
+        res = None    # type: T.Optional[TestResult]
+        self.parse_tap(self.tap.parse_eof())
+        results = self.tap_results
+        failed = self.tap_failed
+        stde += self.tap_errors
 
         if returncode != 0:
             res = TestResult.ERROR
@@ -770,6 +1040,12 @@ class TestRun:
         self.cmd = cmd
         self.junit = junit
 
+    @staticmethod
+    def get_spill_note(files: T.List[str]) -> str:
+        if not files:
+            return ''
+        return '(only part of the output is shown, see {})\n'.format(', '.join(files))
+
     def get_log(self) -> str:
         res = '--- command ---\n'
         if self.cmd is None:
@@ -782,11 +1058,13 @@ class TestRun:
             )
         if self.stdo:
             res += '--- stdout ---\n'
+            res += self.get_spill_note(self.stdo_files)
             res += self.stdo
         if self.stde:
             if res[-1:] != '\n':
                 res += '\n'
             res += '--- stderr ---\n'
+            res += self.get_spill_note(self.stde_files)
             res += self.stde
         if res[-1:] != '\n':
             res += '\n'
@@ -813,9 +1091,99 @@ def decode(stream: T.Union[None, bytes]) -> str:
     except UnicodeDecodeError:
         return stream.decode('iso-8859-1', errors='ignore')
 
+class TestOutput:
+    '''
+    A stream of the output of a test. It is written to a file while the test
+    runs, and only the part selected by `keep` is read back once it is done
+    if it is longer than `spill_size`. The file is then kept in `output_dir`,
+    if there is one.
+    '''
+
+    def __init__(self, name: str, stream: str, output_dir: T.Optional[str], spill_size: int,
+                 keep: str = 'end'):
+        self.spill_size = spill_size
+        self.keep = keep
+        self.fname = None  # type: T.Optional[str]
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            prefix = re.sub(r'[^\w.-]', '_', name) + '.'
+            fd, self.fname = tempfile.mkstemp(prefix=prefix, suffix='.' + stream, dir=output_dir)
+            self.file = os.fdopen(fd, 'wb+')  # type: T.BinaryIO
+        else:
+            self.file = tempfile.TemporaryFile('wb+')
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def write(self, data: bytes) -> None:
+        self.file.write(data)
+
+    def read_start(self, size: int) -> bytes:
+        self.file.seek(0)
+        data = self.file.read(size)
+        # Do not end in the middle of a line
+        end = data.rfind(b'\n')
+        return data if end < 0 else data[:end + 1]
+
+    def read_end(self, size: int) -> bytes:
+        self.file.seek(-size, os.SEEK_END)
+        data = self.file.read()
+        # Do not start in the middle of a line
+        return data[data.find(b'\n') + 1:]
+
+    def read(self) -> T.Tuple[str, T.Optional[str]]:
+        '''
+        Return the output, or only part of it and the file containing all of
+        it if it is too long.
+        '''
+        size = self.file.seek(0, os.SEEK_END)
+        spilled = size > self.spill_size
+        if spilled:
+            if self.keep == 'start':
+                data = self.read_start(self.spill_size)
+            elif self.keep == 'end':
+                data = self.read_end(self.spill_size)
+            else:
+                start = self.read_start(self.spill_size // 2)
+                end = self.read_end(self.spill_size // 2)
+                omitted = '[... {} bytes omitted ...]\n'.format(size - len(start) - len(end))
+                data = start + omitted.encode() + end
+        else:
+            self.file.seek(0)
+            data = self.file.read()
+        self.file.close()
+        if self.fname is not None and not spilled:
+            os.unlink(self.fname)
+        return decode(data), self.fname if spilled else None
+
 def run_with_mono(fname: str) -> bool:
     return fname.endswith('.exe') and not (is_windows() or is_cygwin())
 
+def get_rusage_command(fname: str) -> T.List[str]:
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts', 'rusage.py')
+    return python_command + [script, fname, '--']
+
+def read_rusage(fname: str) -> T.Optional[T.Dict[str, T.Union[int, float]]]:
+    try:
+        with open(fname, encoding='utf-8') as f:
+            usage = json.load(f)
+    except (OSError, ValueError):
+        # The wrapper was killed before the test was done
+        return None
+    finally:
+        try:
+            os.unlink(fname)
+        except OSError:
+            pass
+    if not isinstance(usage, dict) or not all(isinstance(v, (int, float)) for v in usage.values()):
+        return None
+    return T.cast(T.Dict[str, T.Union[int, float]], usage)
+
+def merge_rusage(usages: T.List[T.Dict[str, T.Union[int, float]]]) -> T.Dict[str, T.Union[int, float]]:
+    merged = {k: sum(u.get(k, 0) for u in usages) for k in usages[0]}
+    merged['maxrss'] = max(u.get('maxrss', 0) for u in usages)
+    return merged
+
 def check_testdata(objs: T.List[TestSerialisation]) -> T.List[TestSerialisation]:
     if not isinstance(objs, list):
         raise MesonVersionMismatchException('<unknown>', coredata_version)
@@ -828,6 +1196,16 @@ def check_testdata(objs: T.List[TestSerialisation]) -> T.List[TestSerialisation]
             raise MesonVersionMismatchException(obj.version, coredata_version)
     return objs
 
+def get_test_key(test: TestSerialisation) -> str:
+    return ':'.join([test.project_name, '+'.join(test.suite), test.name])
+
+def get_benchmark_stats(samples: T.List[float]) -> T.Dict[str, T.Any]:
+    return {'runs': len(samples),
+            'median': statistics.median(samples),
+            'mean': statistics.mean(samples),
+            'stddev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+            'min': min(samples)}
+
 def load_benchmarks(build_dir: str) -> T.List[TestSerialisation]:
     datafile = Path(build_dir) / 'meson-private' / 'meson_benchmark_setup.dat'
     if not datafile.is_file():
@@ -869,17 +1247,225 @@ async def complete_all(futures: T.Iterable[asyncio.Future]) -> None:
             if not f.cancelled():
                 f.result()
 
+class TestCapacity:
+    """Count the CPUs used by the running tests. Tests start in order,
+    each one as soon as enough CPUs are free for it."""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.free = capacity
+        self.waiters = deque()  # type: T.Deque[T.Tuple[int, asyncio.Future]]
+
+    async def acquire(self, cpus: int) -> int:
+        """Wait for the CPUs of a test and return how many were taken."""
+        # A test needing more than the whole machine still has to run
+        cpus = min(cpus, self.capacity)
+        if not self.waiters and cpus <= self.free:
+            self.free -= cpus
+            return cpus
+        waiter = asyncio.get_event_loop().create_future()
+        self.waiters.append((cpus, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(cpus)
+            else:
+                self.waiters.remove((cpus, waiter))
+                self._wake_up()
+            raise
+        return cpus
+
+    def release(self, cpus: int) -> None:
+        self.free += cpus
+        self._wake_up()
+
+    def _wake_up(self) -> None:
+        while self.waiters and self.waiters[0][0] <= self.free:
+            cpus, waiter = self.waiters.popleft()
+            self.free -= cpus
+            waiter.set_result(None)
+
+class Jobserver:
+    """Client of the jobserver of an outer GNU make, or of any other tool
+    using its protocol. Like every job started by make, meson test owns one
+    implicit job slot. Each other test running at the same time needs a
+    token read from the jobserver, which is written back once it is done."""
+
+    def __init__(self, rfd: int, wfd: int) -> None:
+        self.rfd = rfd
+        self.wfd = wfd
+        self.implicit_slot = True
+        self.waiters = deque()  # type: T.Deque[asyncio.Future[T.Optional[bytes]]]
+        self.reading = False
+        self.closed = False
+
+    @staticmethod
+    def from_environment() -> T.Optional['Jobserver']:
+        """Connect to the jobserver in MAKEFLAGS, if there is one."""
+        auth = None
+        for flag in os.environ.get('MAKEFLAGS', '').split():
+            # --jobserver-fds is the name used before GNU make 4.2
+            for prefix in ('--jobserver-auth=', '--jobserver-fds='):
+                if flag.startswith(prefix):
+                    auth = flag[len(prefix):]
+        # The Windows jobserver is a semaphore, which is not supported
+        if auth is None or is_windows():
+            return None
+        try:
+            if auth.startswith('fifo:'):
+                rfd = os.open(auth[5:], os.O_RDONLY | os.O_NONBLOCK)
+                wfd = os.open(auth[5:], os.O_WRONLY)
+            else:
+                r, w = (int(i) for i in auth.split(','))
+                # make only passes the pipe to the commands it knows are
+                # recursive, the numbers may not refer to it otherwise
+                if not stat.S_ISFIFO(os.fstat(r).st_mode) or not stat.S_ISFIFO(os.fstat(w).st_mode):
+                    raise OSError('file descriptors {} are not a pipe'.format(auth))
+                try:
+                    # Reopen the pipe so that making it non-blocking does
+                    # not affect make and the other jobs
+                    rfd = os.open('/proc/self/fd/{}'.format(r), os.O_RDONLY | os.O_NONBLOCK)
+                except OSError:
+                    rfd = os.dup(r)
+                    os.set_blocking(rfd, False)
+                wfd = os.dup(w)
+        except (OSError, ValueError) as e:
+            mlog.warning('Cannot use the jobserver of MAKEFLAGS, running up to --num-processes '
+                         'tests at once: {}'.format(e))
+            return None
+        return Jobserver(rfd, wfd)
+
+    async def acquire(self) -> T.Optional[bytes]:
+        """Wait for a job slot and return its token, or None for the implicit slot."""
+        if self.implicit_slot and not self.waiters:
+            self.implicit_slot = False
+            return None
+        waiter = asyncio.get_event_loop().create_future()  # type: asyncio.Future[T.Optional[bytes]]
+        self.waiters.append(waiter)
+        self._update_reader()
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(waiter.result())
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+                self._update_reader()
+            raise
+
+    def acquire_available(self, count: int) -> T.List[bytes]:
+        """Take up to count tokens that are available right now, without
+        waiting for the others. Waiting for several tokens could deadlock
+        with tests or jobs that hold some of them."""
+        tokens = []  # type: T.List[bytes]
+        # The tests already waiting for a slot get the next tokens
+        while len(tokens) < count and not self.closed and not self._next_waiter():
+            try:
+                token = os.read(self.rfd, 1)
+            except OSError:
+                break
+            if not token:
+                self.closed = True
+                break
+            tokens.append(token)
+        return tokens
+
+    def release(self, token: T.Optional[bytes]) -> None:
+        if token is not None:
+            try:
+                os.write(self.wfd, token)
+            except OSError:
+                pass
+        elif self._next_waiter():
+            self.waiters.popleft().set_result(None)
+        else:
+            self.implicit_slot = True
+        self._update_reader()
+
+    def close(self) -> None:
+        self.closed = True
+        self._update_reader()
+        os.close(self.rfd)
+        os.close(self.wfd)
+
+    def _next_waiter(self) -> bool:
+        while self.waiters and self.waiters[0].cancelled():
+            self.waiters.popleft()
+        return bool(self.waiters)
+
+    def _read_token(self) -> None:
+        try:
+            token = os.read(self.rfd, 1)
+        except BlockingIOError:
+            # Another job got the token first
+            return
+        except OSError:
+            token = b''
+        if not token:
+            # The jobserver is gone, only the implicit slot is left
+            self.closed = True
+        elif self._next_waiter():
+            self.waiters.popleft().set_result(token)
+        else:
+            self.release(token)
+        self._update_reader()
+
+    def _update_reader(self) -> None:
+        wanted = self._next_waiter() and not self.closed
+        if wanted and not self.reading:
+            asyncio.get_event_loop().add_reader(self.rfd, self._read_token)
+        elif not wanted and self.reading:
+            asyncio.get_event_loop().remove_reader(self.rfd)
+        self.reading = wanted
+
+class TestResourceLock:
+    """A resource that tests can hold either exclusively or shared."""
+
+    def __init__(self) -> None:
+        self.condition = asyncio.Condition()
+        self.shared = 0
+        self.exclusive = False
+        self.waiting_exclusive = 0
+
+    async def acquire(self, exclusive: bool) -> None:
+        async with self.condition:
+            if exclusive:
+                self.waiting_exclusive += 1
+                try:
+                    await self.condition.wait_for(lambda: not self.exclusive and not self.shared)
+                finally:
+                    self.waiting_exclusive -= 1
+                self.exclusive = True
+            else:
+                # Do not let a stream of shared holders starve exclusive ones
+                await self.condition.wait_for(lambda: not self.exclusive and not self.waiting_exclusive)
+                self.shared += 1
+
+    async def release(self, exclusive: bool) -> None:
+        async with self.condition:
+            if exclusive:
+                self.exclusive = False
+            else:
+                self.shared -= 1
+            self.condition.notify_all()
+
 
 class SingleTestRunner:
 
     def __init__(self, test: TestSerialisation, test_env: T.Dict[str, str],
                  env: T.Dict[str, str], name: str,
-                 options: argparse.Namespace):
+                 options: argparse.Namespace, shards: int = 1,
+                 shard: T.Optional[T.Tuple[int, int]] = None,
+                 output_dir: T.Optional[str] = None):
         self.test = test
         self.test_env = test_env
         self.env = env
         self.options = options
+        self.shards = shards
+        self.output_dir = output_dir
         self.runobj = TestRun(test, test_env, name)
+        self.runobj.shard = shard
 
     def _get_cmd(self) -> T.Optional[T.List[str]]:
         if self.test.fname[0].endswith('.jar'):
@@ -911,12 +1497,45 @@ class SingleTestRunner:
             wrap = TestHarness.get_wrapper(self.options)
             if self.options.gdb:
                 self.test.timeout = None
-            await self._run_cmd(wrap + cmd + self.test.cmd_args + self.options.test_args)
+            if self.shards > 1:
+                await self._run_shards()
+            else:
+                await self._run_cmd(wrap + cmd + self.test.cmd_args + self.options.test_args)
+            self.check_max_rss()
         return self.runobj
 
+    def check_max_rss(self) -> None:
+        rusage = self.runobj.rusage
+        if self.options.max_rss is None or rusage is None:
+            return
+        if rusage['maxrss'] <= self.options.max_rss * 1024 * 1024:
+            return
+        if self.runobj.res in {TestResult.SKIP, TestResult.ERROR, TestResult.TIMEOUT, TestResult.INTERRUPT}:
+            return
+        self.runobj.res = TestResult.FAIL
+        self.runobj.rss_exceeded = True
+        note = 'Test used {:.1f} MiB of memory, more than the {} MiB allowed by --max-rss.'.format(
+            rusage['maxrss'] / (1024 * 1024), self.options.max_rss)
+        self.runobj.stde = (self.runobj.stde or '') + note + '\n'
+
+    async def _run_shards(self) -> None:
+        runners = [SingleTestRunner(self.test, self.test_env, self.env.copy(), self.runobj.name,
+                                    self.options, shard=(i, self.shards), output_dir=self.output_dir)
+                   for i in range(self.shards)]
+        futures = [asyncio.ensure_future(r.run()) for r in runners]
+        try:
+            await asyncio.gather(*futures)
+        finally:
+            # If the shards have been interrupted, wait for them to kill
+            # their processes and report what they did before cancelling
+            await complete_all(futures)
+            self.runobj.complete_shards([r.runobj for r in runners])
+
     async def _run_subprocess(self, args: T.List[str], *, timeout: T.Optional[int],
-                              stdout: T.IO, stderr: T.IO,
-                              env: T.Dict[str, str], cwd: T.Optional[str]) -> T.Tuple[int, TestResult, T.Optional[str]]:
+                              stdout: T.Any, stderr: T.Any,
+                              env: T.Dict[str, str], cwd: T.Optional[str],
+                              read_stdout: T.Optional[T.Callable[[asyncio.StreamReader], T.Awaitable[None]]] = None
+                              ) -> T.Tuple[int, TestResult, T.Optional[str]]:
         async def kill_process(p: asyncio.subprocess.Process) -> T.Optional[str]:
             # Python does not provide multiplatform support for
             # killing a process and all its children so we need
@@ -963,6 +1582,8 @@ class SingleTestRunner:
             signal.signal(signal.SIGINT, signal.SIG_IGN)
 
         def preexec_fn() -> None:
+            if self.options.cpu_affinity:
+                os.sched_setaffinity(0, self.options.cpu_affinity)
             if self.options.gdb:
                 # Restore the SIGINT handler for the child process to
                 # ensure it can handle it.
@@ -979,6 +1600,9 @@ class SingleTestRunner:
                                                  env=env,
                                                  cwd=cwd,
                                                  preexec_fn=preexec_fn if not is_windows() else None)
+        reader = None  # type: T.Optional[asyncio.Future]
+        if read_stdout is not None:
+            reader = asyncio.ensure_future(read_stdout(p.stdout))
         result = None
         additional_error = None
         try:
@@ -996,9 +1620,44 @@ class SingleTestRunner:
             if self.options.gdb:
                 # Let us accept ^C again
                 signal.signal(signal.SIGINT, previous_sigint_handler)
+            if reader is not None:
+                # Processes started by the test may keep the pipe open
+                await try_wait_one(reader, timeout=1)
+                if reader.done():
+                    reader.result()
+                else:
+                    reader.cancel()
 
         return p.returncode or 0, result, additional_error
 
+    def open_output(self, stream: str) -> TestOutput:
+        return TestOutput(self.runobj.name, stream, self.output_dir, self.options.spill_size,
+                          self.options.keep_output)
+
+    async def read_tap(self, reader: asyncio.StreamReader, output: TestOutput) -> None:
+        '''
+        Copy the output of a TAP test to `output`, and parse it as it comes
+        instead of once the test is done.
+        '''
+        buf = bytearray()
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            output.write(data)
+            buf += data
+            end = buf.rfind(b'\n') + 1
+            for line in bytes(buf[:end]).split(b'\n')[:-1]:
+                self.parse_tap_line(decode(line))
+            del buf[:end]
+        if buf:
+            self.parse_tap_line(decode(bytes(buf)))
+
+    def parse_tap_line(self, line: str) -> None:
+        if self.options.verbose:
+            print(line, flush=True)
+        self.runobj.parse_tap_line(line)
+
     async def _run_cmd(self, cmd: T.List[str]) -> None:
         if self.test.extra_paths:
             self.env['PATH'] = os.pathsep.join(self.test.extra_paths + ['']) + self.env['PATH']
@@ -1020,20 +1679,24 @@ class SingleTestRunner:
         if ('MALLOC_PERTURB_' not in self.env or not self.env['MALLOC_PERTURB_']) and not self.options.benchmark:
             self.env['MALLOC_PERTURB_'] = str(random.randint(1, 255))
 
-        stdout = None
-        stderr = None
+        stdout = None  # type: T.Optional[TestOutput]
+        stderr = None  # type: T.Optional[TestOutput]
+        # The stdout of TAP tests is parsed, so their stderr is always kept apart
         if not self.options.verbose:
-            stdout = tempfile.TemporaryFile("wb+")
-            stderr = tempfile.TemporaryFile("wb+") if self.options.split else stdout
-        if self.test.protocol is TestProtocol.TAP and stderr is stdout:
-            stdout = tempfile.TemporaryFile("wb+")
+            stdout = self.open_output('stdout')
+            if self.options.split or self.test.protocol is TestProtocol.TAP:
+                stderr = self.open_output('stderr')
+            else:
+                stderr = stdout
+        elif self.test.protocol is TestProtocol.TAP:
+            stdout = self.open_output('stdout')
 
         extra_cmd = []  # type: T.List[str]
         if self.test.protocol is TestProtocol.GTEST:
-            gtestname = self.test.name
-            if self.test.workdir:
-                gtestname = os.path.join(self.test.workdir, self.test.name)
-            extra_cmd.append('--gtest_output=xml:{}.xml'.format(gtestname))
+            extra_cmd.append('--gtest_output=xml:{}'.format(self.runobj.get_gtest_output()))
+            if self.runobj.shard is not None:
+                self.env['GTEST_SHARD_INDEX'] = str(self.runobj.shard[0])
+                self.env['GTEST_TOTAL_SHARDS'] = str(self.runobj.shard[1])
 
         if self.test.timeout is None:
             timeout = None
@@ -1042,26 +1705,42 @@ class SingleTestRunner:
         else:
             timeout = self.test.timeout
 
-        returncode, result, additional_error = await self._run_subprocess(cmd + extra_cmd,
+        read_stdout = None  # type: T.Optional[T.Callable[[asyncio.StreamReader], T.Awaitable[None]]]
+        if self.test.protocol is TestProtocol.TAP:
+            tap_output = stdout
+            read_stdout = lambda reader: self.read_tap(reader, tap_output)
+
+        args = cmd + extra_cmd
+        rusage_file = None  # type: T.Optional[str]
+        if self.options.rusage and not self.options.gdb:
+            fd, rusage_file = tempfile.mkstemp(prefix='meson-rusage-', suffix='.json')
+            os.close(fd)
+            args = get_rusage_command(rusage_file) + args
+
+        returncode, result, additional_error = await self._run_subprocess(args,
                                                                           timeout=timeout,
-                                                                          stdout=stdout,
+                                                                          stdout=stdout if read_stdout is None else asyncio.subprocess.PIPE,
                                                                           stderr=stderr,
                                                                           env=self.env,
-                                                                          cwd=self.test.workdir)
-        if additional_error is None:
-            if stdout is None:
-                stdo = ''
-            else:
-                stdout.seek(0)
-                stdo = decode(stdout.read())
-            if stderr is None or stderr is stdout:
-                stde = ''
-            else:
-                stderr.seek(0)
-                stde = decode(stderr.read())
-        else:
+                                                                          cwd=self.test.workdir,
+                                                                          read_stdout=read_stdout)
+        stdo = ''
+        stde = ''
+        if stdout is not None:
+            stdo, spilled = stdout.read()
+            if spilled:
+                self.runobj.stdo_files.append(spilled)
+        if stderr is not None and stderr is not stdout:
+            stde, spilled = stderr.read()
+            if spilled:
+                self.runobj.stde_files.append(spilled)
+        if rusage_file is not None:
+            self.runobj.rusage = read_rusage(rusage_file)
+        if additional_error is not None:
             stdo = ""
             stde = additional_error
+            self.runobj.stdo_files = []
+            self.runobj.stde_files = []
         if result:
             self.runobj.complete(result, [], returncode, stdo, stde, cmd)
         else:
@@ -1070,8 +1749,6 @@ class SingleTestRunner:
             elif self.test.protocol is TestProtocol.GTEST:
                 self.runobj.complete_gtest(returncode, stdo, stde, cmd)
             else:
-                if self.options.verbose:
-                    print(stdo, end='')
                 self.runobj.complete_tap(returncode, stdo, stde, cmd)
 
 class TestHarness:
@@ -1089,6 +1766,18 @@ class TestHarness:
         self.is_run = False
         self.loggers = []         # type: T.List[TestLogger]
         self.loggers.append(ConsoleLogger())
+        self.history = {}         # type: T.Dict[str, T.Dict[str, T.Any]]
+        self.updated_history = set()  # type: T.Set[str]
+        self.cached_results = {}  # type: T.Dict[str, T.Tuple[str, TestResult]]
+        self.file_hashes = {}     # type: T.Dict[str, T.Optional[str]]
+        self.output_dir = None    # type: T.Optional[str]
+        self.pipelined_build = None  # type: T.Optional[PipelinedBuild]
+        self.rusage_results = []  # type: T.List[T.Tuple[str, T.Dict[str, T.Union[int, float]]]]
+        self.benchmark_samples = {}  # type: T.Dict[str, T.List[float]]
+        self.benchmark_names = {}    # type: T.Dict[str, str]
+        self.benchmark_stats = {}    # type: T.Dict[str, T.Dict[str, T.Any]]
+        self.baseline = {}           # type: T.Dict[str, T.Dict[str, T.Any]]
+        self.regressions = []        # type: T.List[str]
 
         if self.options.benchmark:
             self.tests = load_benchmarks(options.wd)
@@ -1099,6 +1788,7 @@ class TestHarness:
             for s in t.suite:
                 ss.add(s)
         self.suites = list(ss)
+        self.load_history()
 
     def __enter__(self) -> 'TestHarness':
         return self
@@ -1147,7 +1837,18 @@ class TestHarness:
         if (test.is_cross_built and test.needs_exe_wrapper and
                 test.exe_runner and test.exe_runner.found()):
             env['MESON_EXE_WRAPPER'] = join_args(test.exe_runner.get_command())
-        return SingleTestRunner(test, test_env, env, name, options)
+        return SingleTestRunner(test, test_env, env, name, options, self.get_num_shards(test, options),
+                                output_dir=self.output_dir)
+
+    @staticmethod
+    def get_num_shards(test: TestSerialisation, options: argparse.Namespace) -> int:
+        if test.protocol is not TestProtocol.GTEST or not test.is_parallel or options.gdb:
+            return 1
+        if test.shards:
+            return test.shards
+        # One shard for each process meson test may run
+        num_processes = options.num_processes  # type: int
+        return max(1, num_processes // test.cpus)
 
     def process_test_result(self, result: TestRun) -> None:
         if result.res is TestResult.TIMEOUT:
@@ -1167,6 +1868,22 @@ class TestHarness:
 
         if result.res.is_bad():
             self.collected_failures.append(result)
+        if result.rusage is not None:
+            self.rusage_results.append((result.name, result.rusage))
+        if self.options.benchmark and result.res is TestResult.OK:
+            key = get_test_key(result.test)
+            self.benchmark_names[key] = result.name
+            self.benchmark_samples.setdefault(key, []).append(result.duration)
+        if result.res is not TestResult.INTERRUPT and not self.options.benchmark and not result.cached:
+            key = get_test_key(result.test)
+            self.updated_history.add(key)
+            entry = self.history.setdefault(key, {})
+            entry['duration'] = result.duration
+            entry['result'] = result.res.value
+            if result.cache_key is not None:
+                entry['cache_key'] = result.cache_key
+            else:
+                entry.pop('cache_key', None)
         for l in self.loggers:
             l.log(self, result)
 
@@ -1179,8 +1896,12 @@ class TestHarness:
             name=result.name,
             res=result.res.get_text(colorize),
             dur=result.duration)
-        if result.res is TestResult.FAIL:
+        if result.rss_exceeded:
+            result_str += ' max RSS {:.1f} MiB'.format(result.rusage['maxrss'] / (1024 * 1024))
+        elif result.res is TestResult.FAIL:
             result_str += ' ' + returncode_to_status(result.returncode)
+        elif result.cached:
+            result_str += ' (cached)'
         return result_str
 
     def summary(self) -> str:
@@ -1195,8 +1916,76 @@ class TestHarness:
             ''').format(self.success_count, self.expectedfail_count, self.fail_count,
                         self.unexpectedpass_count, self.skip_count, self.timeout_count)
 
+    def rusage_summary(self) -> str:
+        """List the tests that used the most CPU time and memory."""
+        if not self.rusage_results:
+            return ''
+        by_cpu = sorted(self.rusage_results, key=lambda r: r[1]['user'] + r[1]['system'], reverse=True)
+        by_rss = sorted(self.rusage_results, key=lambda r: r[1]['maxrss'], reverse=True)
+        lines = ['', 'Most CPU time:', '']
+        for name, u in by_cpu[:RUSAGE_SUMMARY_COUNT]:
+            lines.append('{:>9.2f}s user {:>9.2f}s system  {}'.format(u['user'], u['system'], name))
+        lines += ['', 'Most memory:', '']
+        for name, u in by_rss[:RUSAGE_SUMMARY_COUNT]:
+            lines.append('{:>9.1f} MiB max RSS  {}'.format(u['maxrss'] / (1024 * 1024), name))
+        return '\n'.join(lines) + '\n'
+
+    def summarize_benchmarks(self) -> None:
+        threshold = 1 + self.options.regression_threshold / 100
+        for key, samples in self.benchmark_samples.items():
+            stats = get_benchmark_stats(samples)
+            self.benchmark_stats[key] = stats
+            base = self.baseline.get(key)
+            if base is not None and stats['median'] > base['median'] * threshold:
+                self.regressions.append(key)
+
+    def benchmark_report(self) -> str:
+        """Show the statistics of the benchmarks, and how they compare with the baseline."""
+        if not self.benchmark_stats:
+            return ''
+        lines = ['', 'Benchmark results:', '',
+                 '{:>10} {:>10} {:>10} {:>10} {:>5}  {}'.format('median', 'mean', 'stddev', 'min', 'runs', 'name')]
+        for key, stats in self.benchmark_stats.items():
+            line = '{median:>9.4f}s {mean:>9.4f}s {stddev:>9.4f}s {min:>9.4f}s {runs:>5}  '.format(**stats)
+            line += self.benchmark_names[key]
+            base = self.baseline.get(key)
+            if base is not None:
+                line += '  {:+.1f}%'.format((stats['median'] / base['median'] - 1) * 100)
+                if key in self.regressions:
+                    line += ' REGRESSION'
+            elif self.options.compare_baseline:
+                line += '  (not in baseline)'
+            lines.append(line)
+        if self.regressions:
+            lines += ['', '{} of the benchmarks are more than {}% slower than the baseline.'.format(
+                len(self.regressions), self.options.regression_threshold)]
+        return '\n'.join(lines) + '\n'
+
+    def load_baseline(self) -> None:
+        try:
+            with open(self.options.compare_baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            raise TestException('Could not read the benchmark baseline: {}'.format(e))
+        if not isinstance(baseline, dict):
+            raise TestException('The benchmark baseline must be a file written by --save-baseline.')
+        for key, stats in baseline.items():
+            median = stats.get('median') if isinstance(stats, dict) else None
+            if isinstance(median, (int, float)) and median > 0:
+                self.baseline[key] = stats
+
+    def save_baseline(self) -> None:
+        baseline = {}  # type: T.Dict[str, T.Dict[str, T.Any]]
+        for key, stats in self.benchmark_stats.items():
+            baseline[key] = dict(stats, name=self.benchmark_names[key])
+        try:
+            with open(self.options.save_baseline, 'w', encoding='utf-8') as f:
+                json.dump(baseline, f, indent=4)
+        except OSError as e:
+            raise TestException('Could not write the benchmark baseline: {}'.format(e))
+
     def total_failure_count(self) -> int:
-        return self.fail_count + self.unexpectedpass_count + self.timeout_count
+        return self.fail_count + self.unexpectedpass_count + self.timeout_count + len(self.regressions)
 
     def doit(self, options: argparse.Namespace) -> int:
         if self.is_run:
@@ -1205,7 +1994,26 @@ class TestHarness:
         tests = self.get_tests()
         if not tests:
             return 0
-        if not options.no_rebuild and not rebuild_deps(options.wd, tests):
+
+        if options.compare_baseline:
+            self.load_baseline()
+        if options.cache == 'on':
+            self.load_cached_results()
+        if options.schedule == 'longest-first' and options.num_processes > 1 and not options.gdb:
+            tests = self.order_longest_first(tests)
+        if options.failed_first:
+            tests = self.order_failed_first(tests)
+
+        if options.no_rebuild:
+            pass
+        elif options.pipelined_rebuild and (Path(options.wd) / 'build.ninja').is_file():
+            ninja = environment.detect_ninja()
+            if not ninja:
+                print("Can't find ninja, can't rebuild test.")
+                sys.exit(125)
+            # The dependencies are built in the order the tests are started
+            self.pipelined_build = PipelinedBuild(options.wd, ninja, tests)
+        elif not rebuild_deps(options.wd, tests):
             # We return 125 here in case the build failed.
             # The reason is that exit code 125 tells `git bisect run` that the current
             # commit should be skipped.  Thus users can directly use `meson test` to
@@ -1215,9 +2023,147 @@ class TestHarness:
 
         self.test_count = len(tests)
         self.name_max_len = max([len(self.get_pretty_suite(test)) for test in tests])
-        self.run_tests(tests)
+        try:
+            self.run_tests(tests)
+        finally:
+            self.save_history()
+        if options.save_baseline:
+            self.save_baseline()
+        if self.pipelined_build is not None and self.pipelined_build.failed is not None:
+            # Same as above, some tests could not run because the build failed
+            sys.exit(125)
         return self.total_failure_count()
 
+    def get_history_file(self) -> str:
+        return os.path.join(self.options.wd, 'meson-private', 'test_history.json')
+
+    def read_history(self) -> T.Dict[str, T.Dict[str, T.Any]]:
+        try:
+            with open(self.get_history_file(), encoding='utf-8') as f:
+                history = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return history if isinstance(history, dict) else {}
+
+    def load_history(self) -> None:
+        self.history = self.read_history()
+
+    def save_history(self) -> None:
+        if not self.updated_history:
+            return
+        fname = self.get_history_file()
+        # Another meson test may have saved its results since this one
+        # started, only replace the entries of the tests that ran here.
+        history = self.read_history()
+        for key in self.updated_history:
+            history[key] = self.history[key]
+        try:
+            fd, tmpname = tempfile.mkstemp(prefix='test_history.', suffix='.tmp', dir=os.path.dirname(fname))
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(history, f)
+                os.replace(tmpname, fname)
+            except BaseException:
+                os.unlink(tmpname)
+                raise
+        except OSError as e:
+            mlog.warning('Could not save the test history: {}'.format(e))
+
+    def load_cached_results(self) -> None:
+        for key, entry in self.history.items():
+            try:
+                res = TestResult(entry['result'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if res.is_ok() and isinstance(entry.get('cache_key'), str):
+                self.cached_results[key] = (entry['cache_key'], res)
+
+    def get_cached_result(self, result: TestRun) -> T.Optional[TestResult]:
+        cache_key, res = self.cached_results.get(get_test_key(result.test), (None, None))
+        if result.cache_key is None or cache_key != result.cache_key:
+            return None
+        return res
+
+    def hash_file(self, fname: str) -> T.Optional[str]:
+        if fname not in self.file_hashes:
+            h = hashlib.sha256()
+            try:
+                with open(fname, 'rb') as f:
+                    for chunk in iter(lambda: f.read(65536), b''):
+                        h.update(chunk)
+                self.file_hashes[fname] = h.hexdigest()
+            except OSError:
+                self.file_hashes[fname] = None
+        return self.file_hashes[fname]
+
+    def get_test_inputs(self, test: TestSerialisation) -> T.List[str]:
+        '''
+        Return the files a test runs or loads: the outputs of the targets it
+        depends on and of the libraries they link to, and the files in its
+        command line.
+        '''
+        targets = self.build_data.get_targets()
+        todo = [targets[i] for i in test.depends if i in targets]
+        seen = set()  # type: T.Set[str]
+        files = set()  # type: T.Set[str]
+        while todo:
+            t = todo.pop()
+            if isinstance(t, build.CustomTargetIndex):
+                t = t.target
+            if t.get_id() in seen:
+                continue
+            seen.add(t.get_id())
+            files.update(os.path.join(t.get_subdir(), o) for o in t.get_outputs())
+            if isinstance(t, build.BuildTarget):
+                todo += t.link_targets + t.link_whole_targets
+            elif isinstance(t, build.CustomTarget):
+                todo += t.get_transitive_build_target_deps()
+        for arg in test.fname + test.cmd_args:
+            fname = os.path.join(test.workdir or '', arg)
+            if os.path.isfile(fname):
+                files.add(fname)
+        return sorted(files)
+
+    def get_cache_key(self, test: TestSerialisation, env: T.Dict[str, str],
+                      options: argparse.Namespace) -> str:
+        inputs = {
+            'command': test.fname + test.cmd_args + options.test_args,
+            'env': {k: v for k, v in env.items() if k not in CACHE_IGNORED_ENV},
+            'workdir': test.workdir,
+            'protocol': str(test.protocol),
+            'should_fail': test.should_fail,
+            'setup': options.setup,
+            'wrapper': options.wrapper,
+            'files': [(f, self.hash_file(f)) for f in self.get_test_inputs(test)],
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+    def failed_last_time(self, test: TestSerialisation) -> bool:
+        try:
+            return TestResult(self.history.get(get_test_key(test), {}).get('result')).is_bad()
+        except ValueError:
+            return False
+
+    def order_failed_first(self, tests: T.List[TestSerialisation]) -> T.List[TestSerialisation]:
+        '''
+        Start the tests that failed last time before the others, keeping the
+        order of both groups otherwise.
+        '''
+        return sorted(tests, key=lambda t: not self.failed_last_time(t))
+
+    def order_longest_first(self, tests: T.List[TestSerialisation]) -> T.List[TestSerialisation]:
+        '''
+        Start the tests that took the longest last time first, so that the
+        slow tests do not end up running alone at the end. Tests that were
+        never run are assumed to be slow.
+        '''
+        def expected_duration(test: TestSerialisation) -> float:
+            duration = self.history.get(get_test_key(test), {}).get('duration')
+            return duration if isinstance(duration, (int, float)) else math.inf
+
+        # Non parallel tests stop all others, run them after the parallel ones
+        return sorted(tests, key=lambda t: (-t.priority, not t.is_parallel, -expected_duration(t)))
+
     @staticmethod
     def split_suite_string(suite: str) -> T.Tuple[str, str]:
         if ':' in suite:
@@ -1306,8 +2252,70 @@ class TestHarness:
             print('No suitable tests defined.')
             return []
 
+        if self.options.last_failed:
+            tests = [t for t in tests if self.failed_last_time(t)]
+            if not tests:
+                print('No tests failed last time.')
+                return []
+
+        if self.options.shard:
+            tests = self.select_shard(tests, *self.options.shard)
+            if self.options.shard_manifest:
+                self.write_shard_manifest(tests)
+
         return tests
 
+    def load_shard_timings(self) -> T.Dict[str, float]:
+        try:
+            with open(self.options.shard_timings, encoding='utf-8') as f:
+                history = json.load(f)
+        except (OSError, ValueError) as e:
+            raise TestException('Could not read the shard timings: {}'.format(e))
+        if not isinstance(history, dict):
+            raise TestException('The shard timings must be a test history file.')
+        timings = {}  # type: T.Dict[str, float]
+        for key, entry in history.items():
+            duration = entry.get('duration') if isinstance(entry, dict) else None
+            if isinstance(duration, (int, float)):
+                timings[key] = duration
+        return timings
+
+    def select_shard(self, tests: T.List[TestSerialisation], index: int, count: int) -> T.List[TestSerialisation]:
+        '''
+        Split the tests into `count` groups that take about the same time and
+        return the `index`th one. The split only depends on the tests and on
+        the timings, so that every machine running a shard computes the same
+        groups. Without timings all the tests are assumed to take as long.
+        '''
+        timings = self.load_shard_timings() if self.options.shard_timings else {}
+        # Tests that did not run before are assumed to take the average time
+        default = sum(timings.values()) / len(timings) if timings else 1.0
+        durations = [timings.get(get_test_key(t), default) for t in tests]
+
+        totals = [0.0] * count
+        selected = set()  # type: T.Set[int]
+        # Give the longest test to the least loaded shard first
+        for i in sorted(range(len(tests)), key=lambda i: (-durations[i], get_test_key(tests[i]), i)):
+            shard = min(range(count), key=lambda s: (totals[s], s))
+            totals[shard] += durations[i]
+            if shard == index - 1:
+                selected.add(i)
+        return [t for i, t in enumerate(tests) if i in selected]
+
+    def write_shard_manifest(self, tests: T.List[TestSerialisation]) -> None:
+        manifest = {
+            'shard': '{}/{}'.format(*self.options.shard),
+            'tests': [{'name': t.name,
+                       'project': t.project_name,
+                       'suite': t.suite,
+                       'protocol': str(t.protocol)} for t in tests],
+        }
+        try:
+            with open(self.options.shard_manifest, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=4)
+        except OSError as e:
+            raise TestException('Could not write the shard manifest: {}'.format(e))
+
     def flush_logfiles(self) -> None:
         for l in self.loggers:
             l.flush()
@@ -1327,9 +2335,13 @@ class TestHarness:
         if namebase:
             logfile_base += '-' + namebase.replace(' ', '_')
 
-        self.loggers.append(JunitBuilder(logfile_base + '.junit.xml'))
-        self.loggers.append(JsonLogfileBuilder(logfile_base + '.json'))
-        self.loggers.append(TextLogfileBuilder(logfile_base + '.txt', errors='surrogateescape'))
+        # The output of the tests is only kept until the next run
+        self.output_dir = logfile_base + '-output'
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+        compression = self.options.log_compression
+        self.loggers.append(JunitBuilder(logfile_base + '.junit.xml', compression))
+        self.loggers.append(JsonLogfileBuilder(logfile_base + '.json', compression))
+        self.loggers.append(TextLogfileBuilder(logfile_base + '.txt', compression, errors='surrogateescape'))
 
     @staticmethod
     def get_wrapper(options: argparse.Namespace) -> T.List[str]:
@@ -1364,7 +2376,8 @@ class TestHarness:
             self.close_logfiles()
 
     async def _run_tests(self, tests: T.List[TestSerialisation]) -> None:
-        semaphore = asyncio.Semaphore(self.options.num_processes)
+        capacity = TestCapacity(self.options.num_processes)
+        jobserver = Jobserver.from_environment()
         futures = deque()  # type: T.Deque[asyncio.Future]
         running_tests = dict() # type: T.Dict[asyncio.Future, str]
         startdir = os.getcwd()
@@ -1373,14 +2386,77 @@ class TestHarness:
         self.build_data = build.load(os.getcwd())
         interrupted = False
 
-        async def run_test(test: SingleTestRunner) -> None:
-            async with semaphore:
-                if interrupted or (self.options.repeat > 1 and self.fail_count):
+        resource_locks = {}  # type: T.Dict[str, TestResourceLock]
+
+        async def run_test(test: SingleTestRunner, warmup: bool = False) -> None:
+            if self.pipelined_build is not None and not await self.pipelined_build.wait(test.test):
+                if interrupted or warmup:
+                    return
+                test.runobj.start()
+                for l in self.loggers:
+                    l.start_test(test.runobj)
+                test.runobj.complete(TestResult.ERROR, [], GNU_ERROR_RETURNCODE, None,
+                                     'The dependencies of the test could not be built.', None)
+                self.process_test_result(test.runobj)
+                return
+            # The inputs of the test are only hashed once they are built
+            if test.options.cache != 'off' and not test.options.benchmark and not test.options.gdb:
+                test.runobj.cache_key = self.get_cache_key(test.test, test.env, test.options)
+            cached = self.get_cached_result(test.runobj)
+            if cached is not None:
+                if interrupted:
                     return
+                test.runobj.start()
                 for l in self.loggers:
                     l.start_test(test.runobj)
-                res = await test.run()
-                self.process_test_result(res)
+                test.runobj.complete_cached(cached)
+                self.process_test_result(test.runobj)
+                return
+            # Locks are taken in a fixed order so that tests cannot deadlock,
+            # and before the CPUs so that waiting tests do not take a job slot
+            locks = sorted([(l, True) for l in test.test.locks] +
+                           [(l, False) for l in test.test.shared_locks])
+            acquired = []  # type: T.List[T.Tuple[str, bool]]
+            try:
+                for name, exclusive in locks:
+                    await resource_locks.setdefault(name, TestResourceLock()).acquire(exclusive)
+                    acquired.append((name, exclusive))
+                cpus = await capacity.acquire(test.test.cpus * test.shards)
+                try:
+                    # Each process of the test needs a job slot of the outer
+                    # make. Only the first one is waited for, and a sharded
+                    # test only runs as many shards as it got slots for.
+                    tokens = []  # type: T.List[T.Optional[bytes]]
+                    if jobserver:
+                        tokens.append(await jobserver.acquire())
+                        tokens += jobserver.acquire_available(cpus - 1)
+                        if test.shards > 1:
+                            test.shards = max(1, len(tokens) // test.test.cpus)
+                            needed = test.test.cpus * test.shards
+                            for token in tokens[needed:]:
+                                jobserver.release(token)
+                            del tokens[needed:]
+                            capacity.release(cpus - min(needed, cpus))
+                            cpus = min(needed, cpus)
+                    try:
+                        if interrupted or (self.options.repeat > 1 and self.fail_count):
+                            return
+                        if warmup:
+                            # Only run to get the caches warm, the result is not reported
+                            await test.run()
+                            return
+                        for l in self.loggers:
+                            l.start_test(test.runobj)
+                        res = await test.run()
+                        self.process_test_result(res)
+                    finally:
+                        for token in tokens:
+                            jobserver.release(token)
+                finally:
+                    capacity.release(cpus)
+            finally:
+                for name, exclusive in reversed(acquired):
+                    await resource_locks[name].release(exclusive)
 
         def test_done(f: asyncio.Future) -> None:
             if not f.cancelled():
@@ -1426,18 +2502,22 @@ class TestHarness:
         for l in self.loggers:
             l.start(self)
 
+        build_task = None  # type: T.Optional[asyncio.Future]
+        if self.pipelined_build is not None:
+            build_task = self.pipelined_build.start()
+
         if sys.platform != 'win32':
             asyncio.get_event_loop().add_signal_handler(signal.SIGINT, sigint_handler)
             asyncio.get_event_loop().add_signal_handler(signal.SIGTERM, sigterm_handler)
         try:
-            for _ in range(self.options.repeat):
+            for warmup in [True] * self.options.warmup + [False] * self.options.repeat:
                 for test in tests:
                     visible_name = self.get_pretty_suite(test)
                     single_test = self.get_test_runner(test, visible_name)
 
                     if not test.is_parallel or single_test.options.gdb:
                         await complete_all(futures)
-                    future = asyncio.ensure_future(run_test(single_test))
+                    future = asyncio.ensure_future(run_test(single_test, warmup))
                     futures.append(future)
                     running_tests[future] = visible_name
                     future.add_done_callback(test_done)
@@ -1448,9 +2528,17 @@ class TestHarness:
 
             await complete_all(futures)
         finally:
+            if build_task is not None:
+                # Only left running if the tests were interrupted
+                build_task.cancel()
+                await asyncio.gather(build_task, return_exceptions=True)
             if sys.platform != 'win32':
                 asyncio.get_event_loop().remove_signal_handler(signal.SIGINT)
                 asyncio.get_event_loop().remove_signal_handler(signal.SIGTERM)
+            if self.options.benchmark:
+                self.summarize_benchmarks()
+            if jobserver:
+                jobserver.close()
             for l in self.loggers:
                 await l.finish(self)
             os.chdir(startdir)
@@ -1461,6 +2549,84 @@ def list_tests(th: TestHarness) -> bool:
         print(th.get_pretty_suite(t))
     return not tests
 
+def load_intro_targets(wd: str) -> T.Dict[str, T.List[str]]:
+    intro_targets = dict()     # type: T.Dict[str, T.List[str]]
+    for target in load_info_file(get_infodir(wd), kind='targets'):
+        intro_targets[target['id']] = [
+                os.path.relpath(f, wd)
+                for f in target['filename']]
+    return intro_targets
+
+class PipelinedBuild:
+    '''
+    Rebuild the dependencies of the tests one group at a time, in the order
+    the tests are started, so that each test can start as soon as its own
+    dependencies are up to date while those of the next ones are built.
+    '''
+
+    def __init__(self, wd: str, ninja: T.List[str], tests: T.List[TestSerialisation]):
+        self.wd = wd
+        self.ninja = ninja
+        self.steps = []       # type: T.List[T.List[str]]
+        self.test_steps = {}  # type: T.Dict[int, int]
+        self.events = []      # type: T.List[asyncio.Event]
+        self.failed = None    # type: T.Optional[int]
+
+        intro_targets = load_intro_targets(wd)
+        target_steps = {}     # type: T.Dict[str, int]
+        for t in tests:
+            targets = set()   # type: T.Set[str]
+            for d in t.depends:
+                targets.update(intro_targets[d])
+            missing = targets - set(target_steps)
+            if missing:
+                for f in missing:
+                    target_steps[f] = len(self.steps)
+                self.steps.append(sorted(missing))
+            if targets:
+                self.test_steps[id(t)] = max(target_steps[f] for f in targets)
+
+    def start(self) -> asyncio.Future:
+        self.events = [asyncio.Event() for _ in self.steps]
+        return asyncio.ensure_future(self.run())
+
+    async def run(self) -> None:
+        for i, targets in enumerate(self.steps):
+            try:
+                p = await asyncio.create_subprocess_exec(*self.ninja, '-C', self.wd, *targets,
+                                                         stdout=asyncio.subprocess.PIPE,
+                                                         stderr=asyncio.subprocess.STDOUT)
+            except OSError as e:
+                print('Could not run {}: {}'.format(self.ninja[0], e))
+                self.fail(i)
+                return
+            try:
+                out, _ = await p.communicate()
+            except asyncio.CancelledError:
+                p.kill()
+                await p.wait()
+                raise
+            if p.returncode != 0:
+                print(decode(out), end='')
+                print('Could not rebuild {}'.format(self.wd))
+                self.fail(i)
+                return
+            self.events[i].set()
+
+    def fail(self, step: int) -> None:
+        self.failed = step
+        # Wake up the tests waiting for this step and the next ones
+        for event in self.events[step:]:
+            event.set()
+
+    async def wait(self, test: TestSerialisation) -> bool:
+        """Wait for the dependencies of a test, return whether they could be built."""
+        step = self.test_steps.get(id(test))
+        if step is None:
+            return True
+        await self.events[step].wait()
+        return self.failed is None or step < self.failed
+
 def rebuild_deps(wd: str, tests: T.List[TestSerialisation]) -> bool:
     if not (Path(wd) / 'build.ninja').is_file():
         print('Only ninja backend is supported to rebuild tests before running them.')
@@ -1473,11 +2639,7 @@ def rebuild_deps(wd: str, tests: T.List[TestSerialisation]) -> bool:
 
     depends = set()            # type: T.Set[str]
     targets = set()            # type: T.Set[str]
-    intro_targets = dict()     # type: T.Dict[str, T.List[str]]
-    for target in load_info_file(get_infodir(wd), kind='targets'):
-        intro_targets[target['id']] = [
-                os.path.relpath(f, wd)
-                for f in target['filename']]
+    intro_targets = load_intro_targets(wd)
     for t in tests:
         for d in t.depends:
             if d in depends:
@@ -1515,6 +2677,37 @@ def run(options: argparse.Namespace) -> int:
         loop = asyncio.ProactorEventLoop()
         asyncio.set_event_loop(loop)
 
+    if not options.benchmark and (options.warmup or options.save_baseline or options.compare_baseline):
+        print('--warmup, --save-baseline and --compare-baseline can only be used with --benchmark.')
+        return 1
+
+    if options.benchmark and (options.failed_first or options.last_failed):
+        print('--failed-first and --last-failed cannot be used with --benchmark.')
+        return 1
+
+    if options.cpu_affinity is not None:
+        if not hasattr(os, 'sched_setaffinity'):
+            print('Setting the CPU affinity of the tests is not supported on this platform.')
+            return 1
+        unavailable = options.cpu_affinity - os.sched_getaffinity(0)
+        if unavailable:
+            print('CPUs {} are not available to run the tests on.'.format(
+                ', '.join(str(c) for c in sorted(unavailable))))
+            return 1
+
+    if options.max_rss is not None:
+        options.rusage = True
+    if options.rusage and is_windows():
+        print('The resource usage of the tests is not available on Windows.')
+        return 1
+
+    if options.log_compression == 'zstd':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            print('The zstandard Python module is required to compress the logs with zstd.')
+            return 1
+
     if check_bin is not None:
         exe = ExternalProgram(check_bin, silent=True)
         if not exe.found():
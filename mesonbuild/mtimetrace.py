@@ -0,0 +1,174 @@
+# Copyright 2021 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Aggregate the time trace reports written by Clang with b_time_trace."""
+
+import os
+import json
+import typing as T
+from collections import defaultdict
+from pathlib import Path
+
+from . import build
+from .mcompile import validate_builddir, get_output_owners, find_output_owner, load_compdb
+from .mesonlib import MesonException
+
+if T.TYPE_CHECKING:
+    import argparse
+
+TEMPLATE_EVENTS = {'InstantiateClass', 'InstantiateFunction'}
+PHASE_EVENTS = {'Frontend': 'frontend', 'Backend': 'backend'}
+
+class Total:
+    def __init__(self) -> None:
+        self.time = 0
+        self.self_time = 0
+        self.count = 0
+
+    def add(self, duration: int, self_time: int = 0) -> None:
+        self.time += duration
+        self.self_time += self_time
+        self.count += 1
+
+def add_arguments(parser: 'argparse.ArgumentParser') -> None:
+    parser.add_argument(
+        '-C',
+        action='store',
+        dest='builddir',
+        type=Path,
+        default='.',
+        help='The build directory containing the time traces.'
+    )
+    parser.add_argument(
+        '-n', '--count',
+        type=int,
+        default=10,
+        help='The number of headers and templates to list (default: %(default)s).'
+    )
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='Print the report as JSON.'
+    )
+
+def find_time_traces(builddir: Path) -> T.List[T.Tuple[str, T.Optional[str]]]:
+    """
+    Return the time trace of each object file in the compilation database,
+    and the id of the target it belongs to.
+    """
+    owners = get_output_owners(build.load(str(builddir)))
+    traces = []  # type: T.List[T.Tuple[str, T.Optional[str]]]
+    for c in load_compdb(builddir):
+        output = os.path.normpath(c['output'])
+        # Clang names the trace after the object file
+        trace = os.path.join(str(builddir), os.path.splitext(output)[0] + '.json')
+        if os.path.isfile(trace):
+            traces.append((trace, find_output_owner(owners, output)))
+    return traces
+
+def header_self_times(sources: T.List[T.Tuple[int, int, str]]) -> T.List[T.Tuple[str, int, int]]:
+    """
+    Take the (start, duration, header) of the Source events of a trace,
+    which nest like the includes do, and return each header with the time
+    spent parsing it and the headers it includes, and without the latter.
+    """
+    self_times = [duration for _, duration, _ in sources]
+    stack = []  # type: T.List[T.Tuple[int, int]]
+    order = sorted(range(len(sources)), key=lambda i: (sources[i][0], -sources[i][1]))
+    for i in order:
+        start, duration, _ = sources[i]
+        while stack and stack[-1][0] <= start:
+            stack.pop()
+        if stack:
+            self_times[stack[-1][1]] -= duration
+        stack.append((start + duration, i))
+    return [(header, duration, self_times[i]) for i, (_, duration, header) in enumerate(sources)]
+
+def aggregate(traces: T.List[T.Tuple[str, T.Optional[str]]]) -> T.Dict[str, T.Dict[str, Total]]:
+    totals = {
+        'headers': defaultdict(Total),
+        'templates': defaultdict(Total),
+        'frontend': defaultdict(Total),
+        'backend': defaultdict(Total),
+    }  # type: T.Dict[str, T.Dict[str, Total]]
+    for fname, target in traces:
+        try:
+            with open(fname, encoding='utf-8') as f:
+                events = json.load(f)['traceEvents']
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+        sources = []  # type: T.List[T.Tuple[int, int, str]]
+        for e in events:
+            if not isinstance(e, dict) or e.get('ph') != 'X':
+                continue
+            name = e.get('name')
+            duration = e.get('dur', 0)
+            detail = e.get('args', {}).get('detail')
+            if name == 'Source' and detail:
+                sources.append((e.get('ts', 0), duration, detail))
+            elif name in TEMPLATE_EVENTS and detail:
+                totals['templates'][detail].add(duration)
+            elif name in PHASE_EVENTS:
+                totals[PHASE_EVENTS[name]][target or ''].add(duration)
+        # Precompiling a header also saves the time of the headers it
+        # includes, so they are ranked by the time including them
+        for header, duration, self_time in header_self_times(sources):
+            totals['headers'][header].add(duration, self_time)
+    return totals
+
+def get_report(totals: T.Dict[str, T.Dict[str, Total]], count: int) -> T.Dict[str, T.Any]:
+    def top(kind: str) -> T.List[T.Dict[str, T.Any]]:
+        items = sorted(totals[kind].items(), key=lambda i: i[1].time, reverse=True)[:count]
+        return [{'name': k, 'time': v.time / 1000000, 'count': v.count} for k, v in items]
+
+    headers = top('headers')
+    for h in headers:
+        h['self'] = totals['headers'][h['name']].self_time / 1000000
+
+    targets = []  # type: T.List[T.Dict[str, T.Any]]
+    for tid in set(totals['frontend']) | set(totals['backend']):
+        targets.append({'id': tid or None,
+                        'frontend': totals['frontend'][tid].time / 1000000,
+                        'backend': totals['backend'][tid].time / 1000000,
+                        'sources': totals['frontend'][tid].count})
+    targets.sort(key=lambda t: t['frontend'] + t['backend'], reverse=True)
+    return {'headers': headers, 'templates': top('templates'), 'targets': targets}
+
+def print_report(report: T.Dict[str, T.Any]) -> None:
+    print('Most expensive headers, with and without the headers they include:')
+    for i in report['headers']:
+        print('  {:>9.3f}s  {:>9.3f}s  {:>5}x  {}'.format(i['time'], i['self'], i['count'], i['name']))
+    print()
+    print('Most expensive template instantiations:')
+    for i in report['templates']:
+        print('  {:>9.3f}s  {:>5}x  {}'.format(i['time'], i['count'], i['name']))
+    print()
+    print('Time per target:')
+    print('  {:>10}  {:>10}  {:>7}  {}'.format('frontend', 'backend', 'sources', 'target'))
+    for t in report['targets']:
+        print('  {:>9.3f}s  {:>9.3f}s  {:>7}  {}'.format(t['frontend'], t['backend'], t['sources'], t['id'] or '(unknown)'))
+
+def run(options: 'argparse.Namespace') -> int:
+    bdir = options.builddir  # type: Path
+    validate_builddir(bdir.resolve())
+    traces = find_time_traces(bdir)
+    if not traces:
+        raise MesonException('No time traces found in `{}`. Build with `-Db_time_trace=true` '
+                             'and a Clang compiler first.'.format(bdir))
+    report = get_report(aggregate(traces), options.count)
+    if options.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print_report(report)
+    return 0
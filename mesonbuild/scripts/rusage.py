@@ -0,0 +1,80 @@
+# Copyright 2021 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Run a command and write the resources it used to a file as JSON.
+
+`meson test` cannot wait for its tests with wait4(), because asyncio reaps
+them, so it runs them through this script when asked for their resource
+usage. The usage includes the processes started by the command that it
+waited for. The script exits with the status of the command, and kills
+itself with the same signal if the command was killed by one.
+
+This file is run directly by the Python interpreter, and must not import
+anything from Meson, so that it starts quickly.
+'''
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import typing as T
+
+FORWARDED_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+
+def get_usage(ru: T.Any) -> T.Dict[str, T.Union[int, float]]:
+    # ru_maxrss is in kilobytes, except on macOS where it is in bytes
+    maxrss = ru.ru_maxrss if sys.platform == 'darwin' else ru.ru_maxrss * 1024
+    return {'user': ru.ru_utime,
+            'system': ru.ru_stime,
+            'maxrss': maxrss,
+            'voluntary_switches': ru.ru_nvcsw,
+            'involuntary_switches': ru.ru_nivcsw,
+            'inblock': ru.ru_inblock,
+            'oublock': ru.ru_oublock}
+
+
+def run(args: T.List[str]) -> int:
+    if len(args) < 3 or args[1] != '--':
+        print('rusage.py <output file> -- <command>')
+        return 1
+    outfile, command = args[0], args[2:]
+
+    # Termination signals are sent to the whole process group, let the
+    # command decide what to do with them. Handlers, unlike ignored
+    # signals, are reset in the command when it is executed.
+    for sig in FORWARDED_SIGNALS:
+        signal.signal(sig, lambda signum, frame: None)
+    try:
+        p = subprocess.Popen(command)
+    except OSError as e:
+        print('Could not run {!r}: {}'.format(command[0], e), file=sys.stderr)
+        return 127
+    _, status, ru = os.wait4(p.pid, 0)
+    p.returncode = 0  # Already reaped
+
+    with open(outfile, 'w') as f:
+        json.dump(get_usage(ru), f)
+
+    if os.WIFSIGNALED(status):
+        termsig = os.WTERMSIG(status)
+        signal.signal(termsig, signal.SIG_DFL)
+        os.kill(os.getpid(), termsig)
+        return 128 + termsig
+    return os.WEXITSTATUS(status)
+
+
+if __name__ == '__main__':
+    sys.exit(run(sys.argv[1:]))
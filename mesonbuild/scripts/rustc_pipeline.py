@@ -0,0 +1,237 @@
+# Copyright 2021 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Split one rustc invocation across two Ninja edges.
+
+The `start` step runs rustc in the background and returns as soon as it
+has written the metadata of the crate, so that the crates depending on it
+can start compiling. The `finish` step waits for that rustc to be done and
+returns its exit status. If there is no such rustc, because only the
+second edge is out of date, it runs the compiler itself. A rustc left
+running by an interrupted build is killed by the next `start` step.
+
+rustc must be passed `--error-format=json --json=artifacts`; diagnostics
+are printed in their human readable form.
+'''
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import typing as T
+
+POLL_INTERVAL = 0.01
+
+
+def print_message(line: str) -> T.Optional[str]:
+    '''Print a line of rustc output and return the type of artifact it
+    announces, if any.'''
+    try:
+        msg = json.loads(line)
+    except ValueError:
+        msg = None
+    if not isinstance(msg, dict):
+        sys.stderr.write(line)
+        return None
+    if 'artifact' in msg:
+        emit = msg.get('emit')
+        return emit if isinstance(emit, str) else None
+    rendered = msg.get('rendered')
+    if rendered:
+        sys.stderr.write(rendered)
+    return None
+
+
+def state_file(base: str, token: str, suffix: str) -> str:
+    return '{}.{}.{}'.format(base, token, suffix)
+
+
+def remove(*fnames: str) -> None:
+    for f in fnames:
+        try:
+            os.unlink(f)
+        except FileNotFoundError:
+            pass
+
+
+def clean_state(base: str) -> None:
+    dirname = os.path.dirname(base) or '.'
+    prefix = os.path.basename(base) + '.'
+    for f in os.listdir(dirname):
+        if f.startswith(prefix):
+            remove(os.path.join(dirname, f))
+
+
+def write_atomic(fname: str, contents: str) -> None:
+    with open(fname + '.tmp', 'w') as f:
+        f.write(contents)
+    os.replace(fname + '.tmp', fname)
+
+
+def monitor(base: str, token: str, command: T.List[str]) -> None:
+    '''Run rustc, logging its output, and record its exit status.'''
+    os.setsid()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    with open(state_file(base, token, 'log'), 'a') as log:
+        try:
+            returncode = subprocess.call(command, stdin=subprocess.DEVNULL, stdout=log, stderr=log)
+        except OSError as e:
+            log.write('Could not run {}: {}\n'.format(command[0], e))
+            returncode = 127
+    write_atomic(state_file(base, token, 'status'), str(returncode))
+
+
+def stop_previous(base: str) -> None:
+    '''Kill the rustc of a previous start step that is still running, e.g.
+    after an interrupted build, and wait for it to exit so that it does not
+    write the outputs again.'''
+    try:
+        with open(base + '.current') as f:
+            token = f.read()
+        with open(state_file(base, token, 'pid')) as f:
+            pid = int(f.read())
+    except (OSError, ValueError):
+        return
+    if os.path.exists(state_file(base, token, 'status')):
+        return
+    # The monitor is the leader of the session, rustc belongs to its group
+    try:
+        os.killpg(pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        return
+    while True:
+        try:
+            os.killpg(pid, 0)
+        except (ProcessLookupError, PermissionError):
+            return
+        time.sleep(POLL_INTERVAL)
+
+
+def start(base: str, command: T.List[str]) -> int:
+    token = str(os.getpid())
+    log_file = state_file(base, token, 'log')
+    status_file = state_file(base, token, 'status')
+    stop_previous(base)
+    clean_state(base)
+    open(log_file, 'w').close()
+    write_atomic(base + '.current', token)
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            monitor(base, token, command)
+        finally:
+            os._exit(0)
+    write_atomic(state_file(base, token, 'pid'), str(pid))
+
+    offset = 0
+    with open(log_file) as log:
+        while True:
+            finished = os.path.exists(status_file)
+            while True:
+                line = log.readline()
+                if not line.endswith('\n'):
+                    # Incomplete line, wait for rustc to write the rest
+                    log.seek(offset)
+                    break
+                offset = log.tell()
+                if print_message(line) == 'metadata':
+                    write_atomic(state_file(base, token, 'offset'), str(offset))
+                    return 0
+            if finished:
+                # rustc failed before it could write the metadata
+                for line in log:
+                    print_message(line)
+                with open(status_file) as f:
+                    returncode = int(f.read())
+                clean_state(base)
+                return returncode or 1
+            time.sleep(POLL_INTERVAL)
+
+
+def run_directly(command: T.List[str]) -> int:
+    # The metadata is up to date, rewriting it would make all the crates
+    # using it out of date. It still has to be emitted, as the set of
+    # outputs changes the hash of the crate.
+    command = list(command)
+    unused = None
+    for i, arg in enumerate(command):
+        if arg.startswith('metadata=') and i > 0 and command[i - 1] == '--emit':
+            unused = arg[len('metadata='):] + '.unused'
+            command[i] = 'metadata=' + unused
+    p = subprocess.Popen(command, stderr=subprocess.PIPE, universal_newlines=True)
+    for line in p.stderr:
+        print_message(line)
+    returncode = p.wait()
+    if unused:
+        remove(unused)
+    return returncode
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def finish(base: str, command: T.List[str]) -> int:
+    try:
+        with open(base + '.current') as f:
+            token = f.read()
+        with open(state_file(base, token, 'pid')) as f:
+            pid = int(f.read())
+    except (OSError, ValueError):
+        return run_directly(command)
+    status_file = state_file(base, token, 'status')
+    while not os.path.exists(status_file):
+        if not pid_alive(pid) and not os.path.exists(status_file):
+            # The background rustc was killed, start over
+            clean_state(base)
+            return run_directly(command)
+        time.sleep(POLL_INTERVAL)
+    # Print the diagnostics that came after the metadata
+    with open(state_file(base, token, 'offset')) as f:
+        offset = int(f.read())
+    with open(state_file(base, token, 'log')) as log:
+        log.seek(offset)
+        for line in log:
+            print_message(line)
+    with open(status_file) as f:
+        returncode = int(f.read())
+    clean_state(base)
+    return returncode
+
+
+def run(args: T.List[str]) -> int:
+    if len(args) < 4 or args[0] not in {'start', 'finish'} or args[2] != '--':
+        print('rustc_pipeline.py <start|finish> <state file base> -- <rustc command>')
+        return 1
+    mode, base, command = args[0], args[1], args[3:]
+    if mode == 'start':
+        return start(base, command)
+    return finish(base, command)
+
+
+if __name__ == '__main__':
+    sys.exit(run(sys.argv[1:]))
@@ -33,7 +33,9 @@ import threading
 import urllib.error
 import urllib.request
 import zipfile
+import gzip
 import hashlib
+import xml.etree.ElementTree
 from itertools import chain
 from unittest import mock
 from configparser import ConfigParser
@@ -45,6 +47,7 @@ import typing as T
 
 import mesonbuild.mlog
 import mesonbuild.depfile
+import mesonbuild.backend.backends
 import mesonbuild.dependencies.base
 import mesonbuild.compilers
 import mesonbuild.envconfig
@@ -711,6 +714,34 @@ class InternalTests(unittest.TestCase):
 
         self.assertEqual(forced_value, desired_value)
 
+    def test_balance_unity_sources(self):
+        balance = mesonbuild.backend.backends.balance_unity_sources
+        srcs = ['src{}.c'.format(i) for i in range(12)]
+        costs = {s: 10 for s in srcs}
+        costs['src0.c'] = 60
+        buckets = balance(srcs, costs, 3)
+        self.assertEqual(len(buckets), 3)
+        self.assertEqual(sorted(chain(*buckets)), sorted(srcs))
+        # Order of declaration is kept within each bucket
+        for b in buckets:
+            self.assertEqual(b, sorted(b, key=srcs.index))
+        # The expensive source does not get as many companions as the others
+        heavy = [b for b in buckets if 'src0.c' in b][0]
+        self.assertLess(len(heavy), 4)
+        # Adding a source only moves a few of the existing ones
+        new_srcs = srcs + ['src12.c']
+        costs['src12.c'] = 10
+        new_buckets = balance(new_srcs, costs, 3)
+        self.assertEqual(sorted(chain(*new_buckets)), sorted(new_srcs))
+        old_bucket = {s: i for i, b in enumerate(buckets) for s in b}
+        moved = [s for i, b in enumerate(new_buckets) for s in b
+                 if s in old_bucket and old_bucket[s] != i]
+        self.assertLessEqual(len(moved), 3)
+        # There is never an empty bucket
+        self.assertEqual(balance(srcs[:3], {s: 1 for s in srcs[:3]}, 3),
+                         [['src0.c'], ['src1.c'], ['src2.c']])
+        self.assertEqual(balance([], {}, 2), [])
+
     def test_listify(self):
         listify = mesonbuild.mesonlib.listify
         # Test sanity
@@ -2814,6 +2845,446 @@ class AllPlatformTests(BasePlatformTests):
         self.utime(os.path.join(testdir, 'srcgen.py'))
         self.assertRebuiltTarget('basic')
 
+    def test_test_locks(self):
+        '''
+        Test that tests holding the same lock are not run together.
+        '''
+        testdir = os.path.join(self.unit_test_dir, '97 test locks')
+        self.init(testdir)
+        self.build()
+        self._run(self.mtest_command + ['--num-processes=4'])
+        # Each test fails if it sees a conflicting holder of the lock
+        with open(os.path.join(self.logdir, 'testlog.json')) as f:
+            runs = [json.loads(l) for l in f]
+        self.assertEqual(len(runs), 8)
+        self.assertTrue(all(r['result'] == 'OK' for r in runs))
+
+    def test_test_cpus(self):
+        '''
+        Test that the running tests never use more CPUs than available.
+        '''
+        testdir = os.path.join(self.unit_test_dir, '98 test cpus')
+        self.init(testdir)
+        self.build()
+        # Each test fails if it sees more than 4 CPUs in use
+        self._run(self.mtest_command + ['--num-processes=4'])
+
+    def test_test_schedule(self):
+        '''
+        Test that the tests that took the longest last time are started first.
+        '''
+        testdir = os.path.join(self.unit_test_dir, '99 test schedule')
+        self.init(testdir)
+        self.build()
+
+        def start_order():
+            with open(os.path.join(self.logdir, 'testlog.json')) as f:
+                runs = [json.loads(l) for l in f]
+            return [r['name'] for r in sorted(runs, key=lambda r: r['starttime'])]
+
+        self._run(self.mtest_command + ['--num-processes=1'])
+        self.assertEqual(start_order(), ['fast', 'medium', 'slow'])
+        history_file = os.path.join(self.privatedir, 'test_history.json')
+        with open(history_file) as f:
+            history = json.load(f)
+        self.assertEqual(len(history), 3)
+        self._run(self.mtest_command + ['--num-processes=2'])
+        self.assertEqual(start_order(), ['slow', 'medium', 'fast'])
+        self._run(self.mtest_command + ['--num-processes=2', '--schedule=declared'])
+        self.assertEqual(start_order(), ['fast', 'medium', 'slow'])
+        # Tests without a recorded duration are assumed to be slow
+        with open(history_file, 'w') as f:
+            json.dump({k: v for k, v in history.items() if not k.endswith(':fast')}, f)
+        self._run(self.mtest_command + ['--num-processes=2'])
+        self.assertEqual(start_order()[0], 'fast')
+        # Saving only replaces the entries of the tests that ran
+        with open(history_file) as f:
+            history = json.load(f)
+        history['other:other:other'] = {'duration': 1.0, 'result': 'OK'}
+        with open(history_file, 'w') as f:
+            json.dump(history, f)
+        self._run(self.mtest_command + ['fast'])
+        with open(history_file) as f:
+            new_history = json.load(f)
+        self.assertEqual(set(new_history), set(history))
+        self.assertEqual([f for f in os.listdir(self.privatedir) if f.endswith('.tmp')], [])
+
+    def test_test_cache(self):
+        '''
+        Test that tests are not run again while their inputs do not change.
+        '''
+        with tempfile.TemporaryDirectory() as tmpdir:
+            testdir = os.path.join(tmpdir, 'src')
+            shutil.copytree(os.path.join(self.unit_test_dir, '100 test cache'), testdir)
+            self.init(testdir)
+            self.build()
+
+            def cached_tests(*args, env=None):
+                cmd = self.mtest_command + list(args)
+                out = subprocess.run(cmd, stdout=subprocess.PIPE, universal_newlines=True, env=env).stdout
+                with open(os.path.join(self.logdir, 'testlog.json')) as f:
+                    cached = sorted(r['name'] for r in map(json.loads, f) if r.get('cached'))
+                self.assertEqual(out.count('(cached)'), len(cached))
+                return cached
+
+            self.assertEqual(cached_tests('--cache'), [])
+            self.assertEqual(cached_tests('--cache'), ['data', 'prog'])
+            junit = xml.etree.ElementTree.parse(os.path.join(self.logdir, 'testlog.junit.xml'))
+            self.assertEqual([t.get('status') for t in junit.iter('testcase')], ['cached', 'cached'])
+            # Running the tests without the cache forgets their results
+            self.assertEqual(cached_tests(), [])
+            self.assertEqual(cached_tests('--cache'), [])
+            self.assertEqual(cached_tests('--cache=refresh'), [])
+            self.assertEqual(cached_tests('--cache'), ['data', 'prog'])
+            # The library changes but the executable does not need to be relinked
+            with open(os.path.join(testdir, 'value.c'), 'w') as f:
+                f.write('int get_value(void) {\n    return 40 + 2;\n}\n')
+            self.utime(os.path.join(testdir, 'value.c'))
+            self.build()
+            self.assertEqual(cached_tests('--cache'), ['data'])
+            # Failures are not cached
+            with open(os.path.join(testdir, 'data.txt'), 'w') as f:
+                f.write('bad\n')
+            self.assertEqual(cached_tests('--cache'), ['prog'])
+            self.assertEqual(cached_tests('--cache'), ['prog'])
+            with open(os.path.join(testdir, 'data.txt'), 'w') as f:
+                f.write('ok\n')
+            self.assertEqual(cached_tests('--cache'), ['prog'])
+            self.assertEqual(cached_tests('--cache'), ['data', 'prog'])
+            # The environment meson test runs in is part of the inputs
+            env = os.environ.copy()
+            env['PATH'] = os.pathsep.join([tmpdir, env.get('PATH', '')])
+            self.assertEqual(cached_tests('--cache', env=env), [])
+            self.assertEqual(cached_tests('--cache', env=env), ['data', 'prog'])
+            env['MAKEFLAGS'] = '-j2'
+            self.assertEqual(cached_tests('--cache', env=env), ['data', 'prog'])
+
+    def test_test_shard(self):
+        '''
+        Test that --shard splits the tests into disjoint groups.
+        '''
+        testdir = os.path.join(self.unit_test_dir, '99 test schedule')
+        self.init(testdir)
+
+        def shard_tests(shard, *args):
+            out = self._run(self.mtest_command + ['--list', '--shard', shard] + list(args))
+            return out.split()
+
+        self.assertEqual(shard_tests('1/2'), ['fast', 'slow'])
+        self.assertEqual(shard_tests('2/2'), ['medium'])
+        self.assertEqual(shard_tests('1/1'), ['fast', 'medium', 'slow'])
+        # Some shards can be empty
+        self.assertEqual(self._run(self.mtest_command + ['--shard', '4/4']).strip(), '')
+        # The slowest test is alone in its shard
+        timings = os.path.join(self.builddir, 'timings.json')
+        with open(timings, 'w') as f:
+            json.dump({'test schedule:test_schedule:fast': {'duration': 0.1},
+                       'test schedule:test_schedule:medium': {'duration': 0.3},
+                       'test schedule:test_schedule:slow': {'duration': 0.6}}, f)
+        self.assertEqual(shard_tests('1/2', '--shard-timings', timings), ['slow'])
+        self.assertEqual(shard_tests('2/2', '--shard-timings', timings), ['fast', 'medium'])
+        manifest = os.path.join(self.builddir, 'manifest.json')
+        shard_tests('2/2', '--shard-timings', timings, '--shard-manifest', manifest)
+        with open(manifest) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['shard'], '2/2')
+        self.assertEqual([t['name'] for t in manifest['tests']], ['fast', 'medium'])
+        self.assertEqual(manifest['tests'][0]['project'], 'test schedule')
+        with self.assertRaises(subprocess.CalledProcessError):
+            shard_tests('3/2')
+
+    def test_test_last_failed(self):
+        '''
+        Test that --failed-first and --last-failed use the results of the
+        previous run.
+        '''
+        testdir = os.path.join(self.unit_test_dir, '105 last failed')
+        self.init(testdir)
+
+        def set_failing(*names):
+            for name in 'abcd':
+                fname = os.path.join(self.builddir, 'fail-' + name)
+                if name in names:
+                    open(fname, 'w').close()
+                elif os.path.exists(fname):
+                    os.unlink(fname)
+
+        def list_tests(*args):
+            out = self._run(self.mtest_command + ['--list'] + list(args))
+            return [l.split()[-1] for l in out.splitlines()]
+
+        def ran_tests():
+            with open(os.path.join(self.logdir, 'testlog.json')) as f:
+                runs = [json.loads(l) for l in f]
+            return [r['name'].split()[-1] for r in sorted(runs, key=lambda r: r['starttime'])]
+
+        set_failing('b', 'd')
+        with self.assertRaises(subprocess.CalledProcessError):
+            self._run(self.mtest_command)
+        self.assertEqual(list_tests('--last-failed'), ['b', 'd'])
+        self.assertEqual(list_tests('--last-failed', '--suite', 'other'), ['d'])
+        self.assertEqual(list_tests('--last-failed', 'b'), ['b'])
+        self.assertIn('No tests failed last time.', self._run(self.mtest_command + ['--last-failed', 'a']))
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            self._run(self.mtest_command + ['--failed-first', '--num-processes=1', '--schedule=declared'])
+        self.assertEqual(ran_tests(), ['b', 'd', 'a', 'c'])
+
+        set_failing('d')
+        with self.assertRaises(subprocess.CalledProcessError):
+            self._run(self.mtest_command + ['--last-failed'])
+        self.assertEqual(sorted(ran_tests()), ['b', 'd'])
+        self.assertEqual(list_tests('--last-failed'), ['d'])
+
+        set_failing()
+        self._run(self.mtest_command + ['--last-failed'])
+        self.assertEqual(ran_tests(), ['d'])
+        self.assertIn('No tests failed last time.', self._run(self.mtest_command + ['--last-failed']))
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            self._run(self.mtest_command + ['--benchmark', '--last-failed'])
+
+    @unittest.skipIf(is_windows(), 'The jobserver is a semaphore on Windows')
+    def test_test_jobserver(self):
+        '''
+        Test that the tests take their job slots from the jobserver of an
+        outer make, with a fake one passing a pipe or a named pipe.
+        '''
+        testdir = os.path.join(self.unit_test_dir, '106 test jobserver')
+        self.init(testdir)
+        self.build()
+
+        counts = os.path.join(self.builddir, 'markers.txt')
+
+        def run_tests(capacity, makeflags, pass_fds=()):
+            env = os.environ.copy()
+            env['MAKEFLAGS'] = makeflags
+            env['JOBSERVER_CAPACITY'] = str(capacity)
+            if os.path.exists(counts):
+                os.unlink(counts)
+            p = subprocess.run(self.mtest_command + ['--num-processes=8'], env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               universal_newlines=True, pass_fds=pass_fds)
+            self.assertEqual(p.returncode, 0, p.stdout)
+            # The tests use the slots they are given
+            with open(counts) as f:
+                self.assertGreaterEqual(max(int(l) for l in f), min(capacity, 3))
+            return p.stdout
+
+        def count_tokens(rfd):
+            os.set_blocking(rfd, False)
+            tokens = b''
+            try:
+                while True:
+                    tokens += os.read(rfd, 1)
+            except BlockingIOError:
+                pass
+            return tokens
+
+        # Two tokens and the implicit slot of meson test
+        rfd, wfd = os.pipe()
+        try:
+            os.write(wfd, b'++')
+            run_tests(3, '-j3 --jobserver-auth={},{}'.format(rfd, wfd), (rfd, wfd))
+            self.assertEqual(count_tokens(rfd), b'++')
+            # Without tokens the tests run one at a time
+            run_tests(1, '-j --jobserver-fds={},{}'.format(rfd, wfd), (rfd, wfd))
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+
+        fifo = os.path.join(self.builddir, 'jobserver')
+        os.mkfifo(fifo)
+        fd = os.open(fifo, os.O_RDWR)
+        try:
+            os.write(fd, b'x')
+            run_tests(2, '-j2 --jobserver-auth=fifo:' + fifo)
+            self.assertEqual(count_tokens(fd), b'x')
+        finally:
+            os.close(fd)
+
+        # A jobserver that was not passed to meson test is ignored
+        out = run_tests(8, '-j3 --jobserver-auth=1000,1001')
+        self.assertIn('Cannot use the jobserver of MAKEFLAGS', out)
+
+    def test_test_output_spill(self):
+        '''
+        Test that long test output is kept in its own file.
+        '''
+        testdir = os.path.join(self.unit_test_dir, '101 test output spill')
+        self.init(testdir)
+        self._run(self.mtest_command + ['--spill-size=1000'])
+        with open(os.path.join(self.logdir, 'testlog.json')) as f:
+            runs = {r['name']: r for r in map(json.loads, f)}
+        outputs = os.listdir(os.path.join(self.logdir, 'testlog-output'))
+        self.assertEqual(len(outputs), 4)
+        for name in ('tap', 'exitcode'):
+            run = runs[name]
+            self.assertLessEqual(len(run['stdout']), 1000)
+            self.assertTrue(run['stdout'].endswith('ok 500 line 500\n'))
+            self.assertTrue(run['stderr'].endswith('stderr line 500\n'))
+            with open(run['stdout_files'][0]) as f:
+                self.assertEqual(f.read().count('\n'), 501 if name == 'tap' else 500)
+            with open(run['stderr_files'][0]) as f:
+                self.assertEqual(f.read().count('\n'), 500)
+        self.assertNotIn('stdout_files', runs['quiet'])
+        self.assertEqual(runs['quiet']['stdout'], 'ok 1 line 1\n')
+        # All the TAP results are parsed even if they are not kept
+        junit = xml.etree.ElementTree.parse(os.path.join(self.logdir, 'testlog.junit.xml'))
+        suite = junit.find("testsuite[@name='test output spill.tap']")
+        self.assertEqual(suite.get('tests'), '500')
+        self.assertIn(runs['tap']['stdout_files'][0], suite.find('system-out').text)
+        with open(os.path.join(self.logdir, 'testlog.txt')) as f:
+            self.assertIn(runs['exitcode']['stderr_files'][0], f.read())
+        # The stdout of TAP tests is parsed, so their stderr is never merged into it
+        self._run(self.mtest_command + ['--spill-size=1000', '--no-stdsplit', 'tap'])
+        with open(os.path.join(self.logdir, 'testlog.json')) as f:
+            run = json.loads(f.readline())
+        self.assertTrue(run['stdout_files'][0].endswith('.stdout'))
+        self.assertTrue(run['stderr_files'][0].endswith('.stderr'))
+
+    def test_test_log_compression(self):
+        '''
+        Test that the logs can be compressed, and are complete either way.
+        '''
+        testdir = os.path.join(self.unit_test_dir, '101 test output spill')
+        self.init(testdir)
+        self._run(self.mtest_command + ['--spill-size=1000', '--keep-output=both'])
+        junit = xml.etree.ElementTree.parse(os.path.join(self.logdir, 'testlog.junit.xml')).getroot()
+        self.assertEqual(junit.attrib, {'tests': '502', 'errors': '0', 'failures': '0'})
+        self.assertEqual(len(junit.findall('testsuite')), 2)
+
+        self._run(self.mtest_command + ['--spill-size=1000', '--keep-output=both', '--log-compression=gzip'])
+        with gzip.open(os.path.join(self.logdir, 'testlog.json.gz'), 'rt') as f:
+            runs = {r['name']: r for r in map(json.loads, f)}
+        stdout = runs['exitcode']['stdout']
+        self.assertTrue(stdout.startswith('ok 1 line 1\n'))
+        self.assertIn('bytes omitted ...]\n', stdout)
+        self.assertTrue(stdout.endswith('ok 500 line 500\n'))
+        with gzip.open(os.path.join(self.logdir, 'testlog.junit.xml.gz')) as f:
+            junit = xml.etree.ElementTree.parse(f).getroot()
+        self.assertEqual(sum(int(s.get('tests')) for s in junit.findall('testsuite')), 502)
+        with gzip.open(os.path.join(self.logdir, 'testlog.txt.gz'), 'rt') as f:
+            self.assertIn('Ok:                 3', f.read())
+
+    @unittest.skipIf(is_windows(), 'getrusage is not available on Windows')
+    def test_test_rusage(self):
+        '''
+        Test that the resources used by the tests are recorded, and that
+        --max-rss fails the tests that use too much memory.
+        '''
+        testdir = os.path.join(self.unit_test_dir, '103 test rusage')
+        self.init(testdir)
+        out = self._run(self.mtest_command + ['--rusage'])
+        self.assertIn('Most CPU time:', out)
+        self.assertRegex(out, r'Most memory:\s+[0-9.]+ MiB max RSS  big\n')
+        with open(os.path.join(self.logdir, 'testlog.json')) as f:
+            runs = {r['name']: r for r in map(json.loads, f)}
+        for run in runs.values():
+            self.assertEqual(set(run['rusage']), {'user', 'system', 'maxrss', 'voluntary_switches',
+                                                  'involuntary_switches', 'inblock', 'oublock'})
+        self.assertGreater(runs['big']['rusage']['maxrss'], 200 * 1024 * 1024)
+        self.assertLess(runs['small']['rusage']['maxrss'], 200 * 1024 * 1024)
+        junit = xml.etree.ElementTree.parse(os.path.join(self.logdir, 'testlog.junit.xml'))
+        maxrss = junit.find("testsuite/testcase[@name='big']/properties/property[@name='rusage.maxrss']")
+        self.assertEqual(int(maxrss.get('value')), runs['big']['rusage']['maxrss'])
+        self.assertIsNotNone(junit.find("testsuite[@name='test rusage.tap']/properties"))
+
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            self._run(self.mtest_command + ['--max-rss=150'])
+        self.assertRegex(cm.exception.stdout, r'big +FAIL +[0-9.]+s max RSS')
+        self.assertRegex(cm.exception.stdout, r'small +OK')
+        with open(os.path.join(self.logdir, 'testlog.txt')) as f:
+            self.assertIn('more than the 150 MiB allowed by --max-rss', f.read())
+        self._run(self.mtest_command + ['--max-rss=150', 'small', 'tap'])
+
+    def test_benchmark_stats(self):
+        '''
+        Test the statistics of repeated benchmark runs, and the comparison
+        with a saved baseline.
+        '''
+        testdir = os.path.join(self.unit_test_dir, '104 benchmark stats')
+        self.init(testdir)
+        baseline = os.path.join(self.builddir, 'baseline.json')
+        out = self._run(self.mtest_command + ['--benchmark', '--warmup=2', '--repeat=3',
+                                              '--save-baseline', baseline])
+        self.assertRegex(out, r'Benchmark results:\s+median +mean +stddev +min +runs +name\n.* 3  quick\n')
+        with open(os.path.join(self.builddir, 'runs.txt')) as f:
+            self.assertEqual(f.read().count('run'), 5)
+        with open(os.path.join(self.logdir, 'testlog.json')) as f:
+            self.assertEqual(len(f.readlines()), 3)
+        with open(baseline) as f:
+            stats = json.load(f)
+        key = 'benchmark stats:benchmark_stats:quick'
+        self.assertEqual(stats[key]['runs'], 3)
+        self.assertEqual(stats[key]['name'], 'quick')
+        self.assertLessEqual(stats[key]['min'], stats[key]['median'])
+
+        stats[key]['median'] = 1000.0
+        with open(baseline, 'w') as f:
+            json.dump(stats, f)
+        out = self._run(self.mtest_command + ['--benchmark', '--compare-baseline', baseline])
+        self.assertRegex(out, r'quick  -\d+\.\d%\n')
+
+        stats[key]['median'] = 0.000001
+        with open(baseline, 'w') as f:
+            json.dump(stats, f)
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            self._run(self.mtest_command + ['--benchmark', '--compare-baseline', baseline])
+        self.assertIn('REGRESSION', cm.exception.stdout)
+        self._run(self.mtest_command + ['--benchmark', '--compare-baseline', baseline,
+                                        '--regression-threshold=1e12'])
+
+        # Warmup runs and baselines are only for benchmarks
+        with self.assertRaises(subprocess.CalledProcessError):
+            self._run(self.mtest_command + ['--warmup=1'])
+
+        if hasattr(os, 'sched_setaffinity'):
+            cpu = min(os.sched_getaffinity(0))
+            self._run(self.mtest_command + ['--benchmark', '--cpu-affinity', str(cpu)])
+            with open(os.path.join(self.logdir, 'testlog.json')) as f:
+                self.assertEqual(json.load(f)['stdout'], '[{}]\n'.format(cpu))
+
+    @skipIfNoExecutable('ninja')
+    def test_test_pipelined_rebuild(self):
+        '''
+        Test that tests start once their own dependencies are built.
+        '''
+        if self.backend is not Backend.ninja:
+            raise unittest.SkipTest('Tests are only rebuilt with the Ninja backend')
+        testdir = os.path.join(self.unit_test_dir, '102 test pipelined rebuild')
+        self.init(testdir)
+        p = subprocess.run(self.mtest_command + ['--pipelined-rebuild', '--num-processes=2'],
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        # The build failed for one of the tests
+        self.assertEqual(p.returncode, 125)
+        self.assertIn('Could not rebuild', p.stdout)
+        with open(os.path.join(self.logdir, 'testlog.json')) as f:
+            runs = {r['name']: r for r in map(json.loads, f)}
+        self.assertEqual({k: v['result'] for k, v in runs.items()},
+                         {'quick': 'OK', 'slow': 'OK', 'broken': 'ERROR'})
+        # The first test did not wait for the dependencies of the second one
+        slow_mtime = os.path.getmtime(os.path.join(self.builddir, 'slow.txt'))
+        self.assertLess(runs['quick']['starttime'], slow_mtime)
+        self.assertGreaterEqual(runs['slow']['starttime'], slow_mtime)
+
+    @skipIfNoExecutable('ninja')
+    def test_generator_batch(self):
+        '''
+        Test that a batch generator is run once per group of inputs.
+        '''
+        if self.backend is not Backend.ninja:
+            raise unittest.SkipTest('Batch generators only run once per group with the Ninja backend')
+        testdir = os.path.join(self.unit_test_dir, '96 generator batch')
+        self.init(testdir)
+        self.build()
+        self.run_tests()
+        with open(os.path.join(self.builddir, 'prog.p', 'invocations.txt')) as f:
+            invocations = f.read().splitlines()
+        self.assertEqual(len(invocations), 3)
+        self.assertEqual(sorted(invocations), ['1', '2', '2'])
+        self.assertBuildIsNoop()
+
     def test_static_library_lto(self):
         '''
         Test that static libraries can be built with LTO and linked to
@@ -2830,6 +3301,61 @@ class AllPlatformTests(BasePlatformTests):
         self.build()
         self.run_tests()
 
+    @skip_if_not_base_option('b_lto_threads')
+    def test_lto_threads(self):
+        testdir = os.path.join(self.common_test_dir, '5 linkstatic')
+
+        env = get_fake_env(testdir, self.builddir, self.prefix)
+        cc = env.detect_c_compiler(MachineChoice.HOST)
+        if cc.get_id() == 'clang' and is_windows():
+            raise unittest.SkipTest('LTO not (yet) supported by windows clang')
+
+        self.init(testdir, extra_args=['-Db_lto=true', '-Db_lto_threads=8', '-Dbackend_max_links=16'])
+        self.build()
+        self.run_tests()
+
+        expected = '-flto-jobs=8' if cc.get_id() == 'clang' else '-flto=8'
+        with open(os.path.join(self.builddir, 'build.ninja')) as f:
+            contents = f.read()
+        self.assertIn(expected, contents)
+        # Each LTO link takes 8 of the 16 link slots
+        self.assertIn('pool lto_link_pool\n  depth = 2\n', contents)
+        self.assertIn(' pool = lto_link_pool\n', contents)
+
+        # Without a number of threads, LTO is enabled the same way as before
+        self.setconf('-Db_lto_threads=0')
+        self.build()
+        with open(os.path.join(self.builddir, 'build.ninja')) as f:
+            contents = f.read()
+        self.assertNotIn(expected, contents)
+        self.assertNotIn('lto_link_pool', contents)
+        if cc.get_id() == 'gcc':
+            self.assertNotIn('-flto=', contents)
+
+        # -1 uses one job per CPU, or the jobserver of make with GCC >= 10
+        self.setconf('-Db_lto_threads=-1')
+        self.build()
+        with open(os.path.join(self.builddir, 'build.ninja')) as f:
+            contents = f.read()
+        self.assertIn(' pool = lto_link_pool\n', contents)
+        if cc.get_id() == 'gcc' and version_compare(cc.version, '>=10.0'):
+            self.assertIn('-flto=auto', contents)
+
+    @skip_if_not_base_option('b_thinlto_cache_policy')
+    def test_thinlto_cache_policy(self):
+        testdir = os.path.join(self.common_test_dir, '5 linkstatic')
+        env = get_fake_env(testdir, self.builddir, self.prefix)
+        cc = env.detect_c_compiler(MachineChoice.HOST)
+        if cc.linker.id not in {'ld.lld', 'ld.gold'}:
+            raise unittest.SkipTest('ThinLTO cache policies need lld or gold, not {}'.format(cc.linker.id))
+
+        self.init(testdir, extra_args=['-Db_lto=true', '-Db_lto_mode=thin', '-Db_thinlto_cache=true',
+                                       '-Db_thinlto_cache_policy=cache_size=10%'])
+        self.build()
+        self.assertPathExists(os.path.join(self.privatedir, 'thinlto-cache'))
+        with open(os.path.join(self.builddir, 'build.ninja')) as f:
+            self.assertIn('cache_size=10%', f.read())
+
     def test_dist_git(self):
         if not shutil.which('git'):
             raise unittest.SkipTest('Git not found')
@@ -4819,6 +5345,73 @@ class AllPlatformTests(BasePlatformTests):
             self._run([*self.meson_command, 'compile', '-C', self.builddir, '--vs-args=-t:{}:Clean'.format(re.sub(r'[\%\$\@\;\.\(\)\']', '_', get_exe_name('trivialprog')))])
             self.assertPathDoesNotExist(os.path.join(self.builddir, get_exe_name('trivialprog')))
 
+    @skipIfNoExecutable('ninja')
+    def test_meson_compile_stats(self):
+        if self.backend is not Backend.ninja:
+            raise unittest.SkipTest('Build statistics are only available with the ninja backend')
+        testdir = os.path.join(self.common_test_dir, '6 linkshared')
+        self.init(testdir)
+        self.build()
+        # Only the runs of `meson compile` record where they start in the log
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            self._run([*self.meson_command, 'compile', '-C', self.builddir, '--stats'])
+        self.assertIn('The last build was not run by `meson compile`', cm.exception.stdout)
+        self.clean()
+        self._run([*self.meson_command, 'compile', '-C', self.builddir])
+        trace = os.path.join(self.builddir, 'trace.json')
+        out = self._run([*self.meson_command, 'compile', '-C', self.builddir, '--stats', '--stats-trace', trace])
+        stats = json.loads(out)
+        self.assertEqual({t['name'] for t in stats['targets']}, {'mylib', 'mycpplib', 'prog', 'cppprog'})
+        self.assertGreater(stats['parallelism'], 0)
+        # The critical path goes from a library to the program linking it
+        self.assertIn([t['name'] for t in stats['critical_path']], [['mylib', 'prog'], ['mycpplib', 'cppprog']])
+        sources = [e['source'] for e in stats['slowest'] if e['source']]
+        self.assertIn(os.path.join(testdir, 'main.c'), sources)
+        with open(trace) as f:
+            events = json.load(f)['traceEvents']
+        self.assertIn('prog', [e['name'] for e in events])
+        # An incremental build only lists the steps that ran again
+        self.utime(os.path.join(testdir, 'main.c'))
+        self._run([*self.meson_command, 'compile', '-C', self.builddir])
+        stats = json.loads(self._run([*self.meson_command, 'compile', '-C', self.builddir, '--stats']))
+        self.assertEqual({t['name'] for t in stats['targets']}, {'prog'})
+
+    @skipIfNoExecutable('ninja')
+    def test_meson_timetrace(self):
+        if self.backend is not Backend.ninja:
+            raise unittest.SkipTest('The compilation database is only written by the ninja backend')
+        testdir = os.path.join(self.common_test_dir, '6 linkshared')
+        self.init(testdir)
+        self.build()
+        cc = get_fake_env(testdir, self.builddir, self.prefix).detect_c_compiler(MachineChoice.HOST)
+        if 'b_time_trace' not in cc.base_options:
+            # Write the traces Clang would have written
+            for c in self.get_compdb():
+                trace = os.path.join(self.builddir, os.path.splitext(c['output'])[0] + '.json')
+                events = [{'ph': 'X', 'name': 'Source', 'ts': 0, 'dur': 3000000, 'args': {'detail': '/usr/include/stdio.h'}},
+                          {'ph': 'X', 'name': 'Source', 'ts': 1000000, 'dur': 1000000, 'args': {'detail': '/usr/include/features.h'}},
+                          {'ph': 'X', 'name': 'InstantiateFunction', 'dur': 1000000, 'args': {'detail': 'f<int>'}},
+                          {'ph': 'X', 'name': 'Frontend', 'dur': 4000000},
+                          {'ph': 'X', 'name': 'Backend', 'dur': 2000000}]
+                with open(trace, 'w') as f:
+                    json.dump({'traceEvents': events}, f)
+        else:
+            self.setconf('-Db_time_trace=true')
+            self.build()
+        out = self._run([*self.meson_command, 'timetrace', '-C', self.builddir, '--json'])
+        report = json.loads(out)
+        self.assertEqual({t['id'] for t in report['targets']}, {'mylib@sha', 'mycpplib@sha', 'prog@exe', 'cppprog@exe'})
+        for t in report['targets']:
+            self.assertEqual(t['sources'], 1)
+            self.assertGreater(t['frontend'], 0)
+        if 'b_time_trace' not in cc.base_options:
+            # Headers are ranked by the time including the headers they include
+            self.assertEqual(report['headers'], [{'name': '/usr/include/stdio.h', 'time': 12.0, 'count': 4, 'self': 8.0},
+                                                 {'name': '/usr/include/features.h', 'time': 4.0, 'count': 4, 'self': 4.0}])
+            self.assertEqual(report['templates'], [{'name': 'f<int>', 'time': 4.0, 'count': 4}])
+        out = self._run([*self.meson_command, 'timetrace', '-C', self.builddir])
+        self.assertIn('Most expensive headers', out)
+
     def test_spurious_reconfigure_built_dep_file(self):
         testdir = os.path.join(self.unit_test_dir, '75 dep files')
 
@@ -4874,6 +5467,34 @@ class AllPlatformTests(BasePlatformTests):
     def test_junit_valid_gtest(self):
         self._test_junit(os.path.join(self.framework_test_dir, '2 gtest'))
 
+    def test_gtest_shards(self):
+        testdir = os.path.join(self.framework_test_dir, '2 gtest')
+        self.init(testdir)
+        self.run_tests()
+        for i in range(2):
+            self.assertPathExists(os.path.join(self.builddir, 'gtest sharded test.shard{}.xml'.format(i)))
+        junit = xml.etree.ElementTree.parse(os.path.join(self.logdir, 'testlog.junit.xml'))
+        suites = [s for s in junit.findall('.//testsuite') if '.gtest sharded test.' in s.get('name')]
+        # The cases run by both shards are reported in a single suite
+        self.assertEqual(len(suites), 1)
+        self.assertEqual(suites[0].get('tests'), '2')
+        self.assertEqual(len(suites[0].findall('testcase')), 2)
+        if is_windows():
+            return
+        # With a jobserver, only as many shards run as there are job slots
+        for i in range(2):
+            os.unlink(os.path.join(self.builddir, 'gtest sharded test.shard{}.xml'.format(i)))
+        rfd, wfd = os.pipe()
+        try:
+            env = os.environ.copy()
+            env['MAKEFLAGS'] = '-j1 --jobserver-auth={},{}'.format(rfd, wfd)
+            subprocess.run(self.mtest_command + ['gtest sharded test'], env=env, pass_fds=(rfd, wfd),
+                           stdout=subprocess.DEVNULL, check=True)
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+        self.assertPathDoesNotExist(os.path.join(self.builddir, 'gtest sharded test.shard1.xml'))
+
     def test_link_language_linker(self):
         # TODO: there should be some way to query how we're linking things
         # without resorting to reading the ninja.build file
@@ -6382,6 +7003,22 @@ class LinuxlikeTests(BasePlatformTests):
         self.assertPathDoesNotExist(os.path.join(self.builddir, 'user@exe/user-unity.c'))
         self.build()
 
+    def test_unity_cost(self):
+        testdir = os.path.join(self.unit_test_dir, '93 unity cost')
+        self.init(testdir, extra_args=['--unity=on', '-Dunity_size=3', '-Dunity_strategy=cost'])
+        unity_files = sorted(glob(os.path.join(self.builddir, 'prog.p', 'prog-unity*.c')))
+        self.assertEqual([os.path.basename(f) for f in unity_files],
+                         ['prog-unity0.c', 'prog-unity1.c'])
+        buckets = []
+        for f in unity_files:
+            with open(f) as ufile:
+                buckets.append(sorted(os.path.basename(l.strip()[len('#include<'):-1]) for l in ufile))
+        # The expensive source gets a unity file of its own instead of
+        # making the one of the small sources the slowest to compile
+        self.assertIn(['big.c'], buckets)
+        self.assertIn(['a.c', 'b.c', 'c.c', 'd.c', 'prog.c'], buckets)
+        self.build()
+
     def test_installed_modes(self):
         '''
         Test that files installed by these tests have the correct permissions.
@@ -6762,6 +7399,96 @@ class LinuxlikeTests(BasePlatformTests):
             got_rpath = get_rpath(os.path.join(yonder_prefix, 'bin/rpathified'))
             self.assertEqual(got_rpath, yonder_libdir, rpath_format)
 
+    @skip_if_not_base_option('b_pch_auto')
+    def test_auto_pch(self):
+        testdir = os.path.join(self.unit_test_dir, '91 auto pch')
+        self.init(testdir, extra_args=['-Db_pch_auto=true'])
+        self.build()
+        header = os.path.join(self.builddir, 'prog.p', 'meson_auto_pch-c.h')
+        with open(header) as f:
+            content = f.read()
+        # Included by every source
+        self.assertIn('<stdio.h>', content)
+        self.assertIn('<string.h>', content)
+        # Included by only one source, or conditionally
+        self.assertNotIn('<stdlib.h>', content)
+        self.assertNotIn('<windows.h>', content)
+        for cmd in self.get_compdb():
+            # A source defining a macro before its includes cannot use it
+            if cmd['file'].endswith('gnu.c'):
+                self.assertNotIn('meson_auto_pch-c.h', cmd['command'])
+            else:
+                self.assertIn('meson_auto_pch-c.h', cmd['command'])
+        # Reconfiguring must not touch an unchanged header
+        mtime = os.stat(header).st_mtime_ns
+        time.sleep(0.01)
+        self.init(testdir, extra_args=['--reconfigure'], default_args=False)
+        self.assertEqual(os.stat(header).st_mtime_ns, mtime)
+        self.assertBuildIsNoop()
+
+    def test_shared_pch(self):
+        testdir = os.path.join(self.unit_test_dir, '92 shared pch')
+        self.init(testdir)
+        self.build()
+        compdb = self.get_compdb()
+        pch_cmds = [c for c in compdb if c['file'].endswith('pch.h')]
+        self.assertEqual(len(pch_cmds), 2)
+        for c in compdb:
+            if c['file'].endswith('prog.c'):
+                if '-DOTHER' in c['command']:
+                    self.assertIn('prog3.p', c['output'])
+                else:
+                    self.assertNotIn('prog3.p', c['command'])
+                    self.assertNotIn('prog2.p/pch.h', c['command'])
+        pch_name = 'pch.h.' + get_fake_env().detect_c_compiler(MachineChoice.HOST).get_pch_suffix()
+        self.assertPathExists(os.path.join(self.builddir, 'prog1.p', pch_name))
+        self.assertPathDoesNotExist(os.path.join(self.builddir, 'prog2.p', pch_name))
+
+    def test_shared_objects(self):
+        testdir = os.path.join(self.unit_test_dir, '94 shared objects')
+        out = self.init(testdir)
+        self.assertNotRegex(out, r'Duplicate object compiles shared between targets')
+        self.wipe()
+        out = self.init(testdir, extra_args=['-Dbackend_share_objects=true'])
+        self.assertRegex(out, r'Duplicate object compiles shared between targets: 3')
+        compdb = self.get_compdb()
+        for fname in ('main.c', 'common.c'):
+            outputs = sorted(c['output'] for c in compdb if c['file'].endswith(fname))
+            self.assertEqual(len(outputs), 2)
+            self.assertIn('prog1.p', outputs[0])
+            self.assertIn('prog3.p', outputs[1])
+        self.build()
+        self.run_tests()
+
+    @skip_if_not_language('rust')
+    def test_rust_pipelining(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            testdir = os.path.join(tmpdir, 'src')
+            shutil.copytree(os.path.join(self.unit_test_dir, '95 rust pipelining'), testdir)
+            self.init(testdir, extra_args=['-Drust_pipelining=true', '-Drust_incremental=true'])
+            self.build()
+            self.run_tests()
+            for name in ('first', 'second', 'third'):
+                privdir = os.path.join(self.builddir, 'lib{}.rlib.p'.format(name))
+                self.assertPathExists(os.path.join(privdir, 'lib{}.rmeta'.format(name)))
+                self.assertPathExists(os.path.join(privdir, 'incremental'))
+            self.assertBuildIsNoop()
+            # A change at the start of the chain reaches the executable
+            with open(os.path.join(testdir, 'first.rs'), 'w') as f:
+                f.write('pub fn value() -> i32 {\n    2\n}\n')
+            self.utime(os.path.join(testdir, 'first.rs'))
+            out = self.build()
+            for name in ('first', 'second', 'third'):
+                self.assertIn('Compiling Rust crate lib{}.rlib'.format(name), out)
+            self.assertNotEqual(subprocess.call([os.path.join(self.builddir, 'prog')]), 0)
+            self.assertBuildIsNoop()
+            # Only the rlib edge is out of date, rustc is run again for it
+            os.unlink(os.path.join(self.builddir, 'libsecond.rlib'))
+            out = self.build()
+            self.assertIn('Compiling Rust crate libsecond.rlib', out)
+            self.assertNotIn('Compiling Rust metadata', out)
+            self.assertBuildIsNoop()
+
     @skip_if_not_base_option('b_sanitize')
     def test_pch_with_address_sanitizer(self):
         if is_cygwin():
@@ -7432,6 +8159,51 @@ class LinuxlikeTests(BasePlatformTests):
         self.assertEqual(len(obj_files), 1)
         self.assertTrue(obj_files[0].endswith('-prelink.o'))
 
+    @skip_if_not_base_option('b_thin_archive')
+    def test_thin_archive(self):
+        testdir = os.path.join(self.unit_test_dir, '89 thin archive')
+        self.init(testdir, extra_args=['-Db_thin_archive=true'])
+        self.build()
+        with open(os.path.join(self.builddir, 'libinternal.a'), 'rb') as f:
+            self.assertEqual(f.read(7), b'!<thin>')
+        # The deprecated T modifier is only used by versions of ar without --thin
+        env = get_fake_env(testdir, self.builddir, self.prefix)
+        linker = env.detect_static_linker(env.detect_c_compiler(MachineChoice.HOST))
+        if isinstance(linker, mesonbuild.linkers.ArLinker) and linker.thin_flag:
+            with open(os.path.join(self.builddir, 'build.ninja')) as f:
+                self.assertIn('--thin', f.read())
+        # Installed libraries must not reference the build directory
+        with open(os.path.join(self.builddir, 'libinstalled.a'), 'rb') as f:
+            self.assertEqual(f.read(7), b'!<arch>')
+        # Switching back must replace the thin archive with a regular one
+        self.setconf('-Db_thin_archive=false')
+        self.build()
+        with open(os.path.join(self.builddir, 'libinternal.a'), 'rb') as f:
+            self.assertEqual(f.read(7), b'!<arch>')
+
+    @skip_if_not_base_option('b_split_dwarf')
+    def test_split_dwarf(self):
+        testdir = os.path.join(self.unit_test_dir, '90 split dwarf')
+        self.init(testdir, extra_args=['-Db_split_dwarf=true', '--buildtype=debug'])
+        self.build()
+        dwo = os.path.join(self.builddir, 'prog.p', 'prog.c.dwo')
+        self.assertPathExists(dwo)
+        # Assembly may not produce a .dwo file, which must not leave its
+        # compile edge always dirty
+        self.assertBuildIsNoop()
+        # The debug info is packaged and installed next to the binary
+        if shutil.which('llvm-dwp') or shutil.which('dwp'):
+            self.install()
+            bindir = os.path.join(self.installdir, self.prefix.lstrip('/'), 'bin')
+            self.assertPathExists(os.path.join(bindir, 'prog.dwp'))
+        # The .dwo file is a declared output, so ninja cleans it
+        self.clean()
+        self.assertPathDoesNotExist(dwo)
+        # Nothing is split without debug info
+        self.setconf('-Ddebug=false')
+        self.build()
+        self.assertPathDoesNotExist(dwo)
+
 class BaseLinuxCrossTests(BasePlatformTests):
     # Don't pass --libdir when cross-compiling. We have tests that
     # check whether meson auto-detects it correctly.
@@ -0,0 +1,5 @@
+int get_value(void);
+
+int main(void) {
+    return get_value() == 42 ? 0 : 1;
+}
@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+
+import sys
+
+protocol, count = sys.argv[1], int(sys.argv[2])
+if protocol == 'tap':
+    print('1..{}'.format(count))
+for i in range(1, count + 1):
+    print('ok {} line {}'.format(i, i))
+    print('stderr line {}'.format(i), file=sys.stderr)
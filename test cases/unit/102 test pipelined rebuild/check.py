@@ -0,0 +1,6 @@
+#!/usr/bin/env python3
+
+import sys
+
+with open(sys.argv[1]) as f:
+    sys.exit(0 if f.read() == 'generated\n' else 1)
@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+
+if sys.argv[1] == 'fail':
+    sys.exit(1)
+time.sleep(float(sys.argv[1]))
+with open(sys.argv[2], 'w') as f:
+    f.write('generated\n')
@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+
+import sys
+
+# Write to every page, so that they count in the RSS
+data = b'x' * (int(sys.argv[1]) * 1024 * 1024)
+if sys.argv[2:] == ['tap']:
+    print('1..1')
+    print('ok 1 {}'.format(len(data)))
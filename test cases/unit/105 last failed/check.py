@@ -0,0 +1,7 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+# Fail while the build directory contains a file named fail-<test>
+sys.exit(1 if os.path.exists('fail-' + sys.argv[1]) else 0)
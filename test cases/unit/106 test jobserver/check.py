@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+
+markers, capacity = sys.argv[1], int(os.environ['JOBSERVER_CAPACITY'])
+os.makedirs(markers, exist_ok=True)
+me = os.path.join(markers, str(os.getpid()))
+
+def check():
+    running = len(os.listdir(markers))
+    # Lets the test check that the tests do run in parallel
+    with open(markers + '.txt', 'a') as f:
+        f.write('{}\n'.format(running))
+    if running > capacity:
+        sys.exit('{} tests running at once'.format(running))
+
+open(me, 'w').close()
+check()
+time.sleep(0.5)
+check()
+os.unlink(me)
@@ -0,0 +1,3 @@
+int func(void) {
+    return 0;
+}
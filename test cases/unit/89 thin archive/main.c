@@ -0,0 +1,5 @@
+int func(void);
+
+int main(void) {
+    return func();
+}
@@ -0,0 +1,7 @@
+#define _GNU_SOURCE
+#include <stdio.h>
+#include <string.h>
+
+int gnu_helper(void) {
+    return (int)strnlen("", 1);
+}
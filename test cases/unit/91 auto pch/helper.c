@@ -0,0 +1,7 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+int helper(void) {
+    return (int)strlen(getenv("PATH") ? "" : "x");
+}
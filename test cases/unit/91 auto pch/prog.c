@@ -0,0 +1,15 @@
+/* The leading system headers go into the precompiled header */
+#include <stdio.h>
+#include <string.h>
+
+int helper(void);
+int gnu_helper(void);
+
+#ifdef _WIN32
+#include <windows.h>
+#endif
+
+int main(void) {
+    printf("%d\n", (int)strlen("hello") + helper() + gnu_helper());
+    return 0;
+}
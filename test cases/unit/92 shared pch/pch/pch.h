@@ -0,0 +1,3 @@
+static inline int func(void) {
+    return 0;
+}
@@ -0,0 +1,3 @@
+int func_a(void) {
+    return 1;
+}
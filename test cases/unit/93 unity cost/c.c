@@ -0,0 +1,3 @@
+int func_c(void) {
+    return 1;
+}
@@ -0,0 +1,9 @@
+int func_a(void);
+int func_b(void);
+int func_c(void);
+int func_d(void);
+int func_big(void);
+
+int main(void) {
+    return func_a() + func_b() + func_c() + func_d() + func_big() == 4 + 4950 ? 0 : 1;
+}
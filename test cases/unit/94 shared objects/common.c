@@ -0,0 +1,7 @@
+int common(void) {
+#ifdef OTHER
+    return 1;
+#else
+    return 0;
+#endif
+}
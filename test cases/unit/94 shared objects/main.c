@@ -0,0 +1,9 @@
+int common(void);
+
+int main(void) {
+#ifdef OTHER
+    return common() - 1;
+#else
+    return common();
+#endif
+}
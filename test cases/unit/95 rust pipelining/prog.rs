@@ -0,0 +1,3 @@
+fn main() {
+    std::process::exit(third::value() - 3);
+}
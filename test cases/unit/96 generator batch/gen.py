@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+outdir = sys.argv[1]
+with open(os.path.join(outdir, 'invocations.txt'), 'a') as f:
+    f.write('{}\n'.format(len(sys.argv) - 2))
+for i in sys.argv[2:]:
+    with open(i) as f:
+        name = f.read().strip()
+    base = os.path.splitext(os.path.basename(i))[0]
+    with open(os.path.join(outdir, base + '.c'), 'w') as f:
+        f.write('int {}(void) {{ return 1; }}\n'.format(name))
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+
+markers, mode = sys.argv[1:]
+os.makedirs(markers, exist_ok=True)
+me = os.path.join(markers, '{}-{}'.format(mode, os.getpid()))
+
+def others():
+    return [f for f in os.listdir(markers) if os.path.join(markers, f) != me]
+
+def check():
+    held = others()
+    if mode == 'exclusive' and held:
+        sys.exit('exclusive lock held together with {}'.format(held))
+    if mode == 'shared' and [f for f in held if f.startswith('exclusive')]:
+        sys.exit('shared lock held together with {}'.format(held))
+
+check()
+open(me, 'w').close()
+time.sleep(0.3)
+check()
+os.unlink(me)
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+
+markers, cpus, capacity = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+os.makedirs(markers, exist_ok=True)
+me = os.path.join(markers, '{}-{}'.format(min(cpus, capacity), os.getpid()))
+
+def check():
+    used = sum(int(f.split('-')[0]) for f in os.listdir(markers))
+    if used > capacity:
+        sys.exit('{} CPUs used by the running tests'.format(used))
+
+open(me, 'w').close()
+check()
+time.sleep(0.3)
+check()
+os.unlink(me)